@@ -1,57 +1,306 @@
-class VirtualMachine:
+import os
+import sys
+import time
+from collections import OrderedDict
+
+from arrays import (new_array, check_index, bulk_fill, bulk_copy, bulk_sum, bulk_min,
+                    bulk_max, bulk_dot, bulk_add, bulk_mul)
+from python_code_generator import FunctionTranslator, AOTError, Halt, AOT_RECURSION_LIMIT
+from output import StdoutSink
+
+DISPATCH_MODES = ("decoded", "legacy")
+FRAME_POOL_SIZE = 256
+JIT_THRESHOLD = 50
+MEMO_SIZE = 1024
+# Ativações compiladas pelo JIT aninhadas na pilha do Python antes de a
+# chamada voltar para o interpretador (bem abaixo de AOT_RECURSION_LIMIT,
+# mesmo com os frames de _call entre elas)
+JIT_DEPTH_LIMIT = 10000
+
+def jit_allowed():
+    # Chave de desligamento: TOTHIC_JIT=0 desativa o JIT mesmo quando pedido.
+    return os.environ.get("TOTHIC_JIT", "1") != "0"
+
+class Frame:
+    # Registro de ativação: locais da chamada e para onde voltar.
+    __slots__ = ("function", "return_pc", "locals", "memo_key")
+
     def __init__(self):
+        self.function = None
+        self.return_pc = 0
+        self.locals = []
+        self.memo_key = None    # chamada memoizada cujo resultado o RET guarda
+
+def memo_key(target, args):
+    # True == 1 == 1.0 e têm o mesmo hash: o tipo entra na chave para a
+    # memoização não trocar um resultado por outro de tipo diferente
+    return (target, *((type(arg), arg) for arg in args))
+
+class Zeros(dict):
+    # n -> lista com n zeros, criada uma vez: o ENTER estende os locais com
+    # ela em vez de montar [0] * n a cada chamada
+    def __missing__(self, n):
+        zeros = self[n] = [0] * n
+        return zeros
+
+ZEROS = Zeros()
+
+class LazyCode(dict):
+    # Código decodificado sob demanda (programas lidos de uma imagem): o
+    # laço acessa code[pc] como numa lista e só a primeira passagem por um
+    # pc cai no __missing__, que decodifica e guarda a instrução.
+
+    def __init__(self, instructions, decode):
+        self.instructions = instructions
+        self.decode_instruction = decode
+
+    def __len__(self):
+        return len(self.instructions)
+
+    def __missing__(self, pc):
+        entry = self[pc] = self.decode_instruction(self.instructions[pc])
+        return entry
+
+class VirtualMachine:
+    def __init__(self, dispatch="decoded", jit=False, jit_threshold=JIT_THRESHOLD,
+                 memoize=True, memo_size=MEMO_SIZE, sink=None):
+        if dispatch not in DISPATCH_MODES:
+            raise ValueError(f"Modo de despacho desconhecido: {dispatch}")
         self.stack = []
-        self.static_memory = {}
-        self.labels = {}
+        self.static_memory = []
+        self.program = None
         self.instructions = []
         self.pc = 0
         self.call_stack = []
-        self.functions = set()
+        self.frame_pool = [Frame() for _ in range(FRAME_POOL_SIZE)]
+        self.locals = None
+        self.native_depth = 0
         self.running = True
+        self.dispatch = dispatch
+        self.steps = 0
+        self.code = []
+        self.sink = sink if sink is not None else StdoutSink()
+        # O JIT só existe no despacho decodificado: CALL é decodificado para
+        # op_CALL_JIT, e o laço normal não paga nada quando ele está desligado.
+        self.jit = jit and dispatch == "decoded" and jit_allowed()
+        self.jit_threshold = jit_threshold
+        self.reset_jit()
+        # Memoização de funções puras: também só no despacho decodificado,
+        # com CALL/RET trocados por versões que consultam e guardam no cache.
+        self.memoize = memoize and dispatch == "decoded"
+        self.memo_size = memo_size
+        self.reset_memo()
 
-    def run(self, instructions):
-        self.instructions = instructions
-        self.find_labels_and_functions()
+    def reset_jit(self):
+        self.call_counts = {}
+        self.jit_functions = {}    # pc de entrada -> (função Python, nº de parâmetros) ou False
+        self.jit_translator = None
+        # funções puras cujas chamadas, mesmo as recursivas, passam pelo cache
+        self.jit_memoized = frozenset()
+        self.jit_stats = {"compiled": 0, "failed": 0, "compile_time": 0.0}
+
+    def reset_memo(self):
+        self.memo = OrderedDict()  # (pc de entrada, *argumentos) -> resultado, em ordem LRU
+        self.memo_stats = {"hits": 0, "misses": 0}
+
+    def load(self, program):
+        # Recebe um LinkedProgram: desvios e chamadas já têm endereço absoluto.
+        # Recarregar o mesmo programa só zera as globais (no lugar, porque o
+        # código do JIT guarda a lista) e as pilhas: o código decodificado,
+        # as funções compiladas e o cache de funções puras continuam valendo.
+        if program is not self.program:
+            self.program = program
+            self.instructions = program.code
+            self.static_memory = [0] * program.global_size
+            self.reset_memo()
+            self.reset_jit()
+            if self.memoize:
+                self.jit_memoized = frozenset(program.pure_functions)
+            if self.dispatch == "decoded":
+                self.code = self.decode(self.instructions)
+        else:
+            self.static_memory[:] = [0] * program.global_size
+        # Uma recursão profunda deixa o pool grande, e um halt ou um erro
+        # deixa frames com locais e chaves de memoização: nada disso passa
+        # para a próxima execução
+        del self.frame_pool[FRAME_POOL_SIZE:]
+        for frame in self.frame_pool:
+            frame.locals.clear()
+            frame.memo_key = None
+        self.stack.clear()
+        self.call_stack.clear()
+        self.locals = None
+        self.native_depth = 0   # ativações do JIT na pilha do Python
         self.pc = 0
+        self.steps = 0
         self.running = True
+
+    def run(self, program):
+        self.load(program)
+        try:
+            self.execute()
+        finally:
+            self.sink.flush()
+
+    def execute(self):
+        if self.dispatch == "decoded":
+            if self.jit:
+                old_limit = sys.getrecursionlimit()
+                sys.setrecursionlimit(max(old_limit, AOT_RECURSION_LIMIT))
+                try:
+                    self.run_code()
+                finally:
+                    sys.setrecursionlimit(old_limit)
+            else:
+                self.run_code()
+        else:
+            self.run_legacy()
+
+    def run_code(self):
+        # Um LazyProgram cresce durante a execução: se o pc foi para além do
+        # código que existia quando o laço começou, o laço recomeça
+        self.run_decoded(self.code)
+        while self.running and self.pc < len(self.code):
+            self.run_decoded(self.code)
+
+    def run_legacy(self):
+        steps = 0
         while self.pc < len(self.instructions) and self.running:
             instr = self.instructions[self.pc]
             op = instr[0]
             args = instr[1:]
-
-            if op == "LABEL" and instr[1] in self.functions:
-                self.pc = self.skip_function_body(self.pc)
-                continue
+            steps += 1
 
             if hasattr(self, f"op_{op}"):
                 getattr(self, f"op_{op}")(*args)
             self.pc += 1
+        self.steps = steps
 
-    def find_labels_and_functions(self):
-        for idx, instr in enumerate(self.instructions):
-            if instr[0] == "LABEL":
-                self.labels[instr[1]] = idx
-        for instr in self.instructions:
-            if instr[0] == "CALL":
-                self.functions.add(instr[1])
-
-    def skip_function_body(self, start):
-        for i in range(start + 1, len(self.instructions)):
-            if self.instructions[i][0] == "RET":
-                return i + 1
-        return len(self.instructions)
+    def decode(self, instructions):
+        # Fase de carga: resolve cada opcode para o método ligado uma única vez
+        # e separa os operandos, deixando o laço principal só buscar e chamar.
+        handlers = {"CALL": self.op_CALL_JIT} if self.jit else {}
+        pure_functions = self.program.pure_functions if self.memoize else {}
+        # num LazyProgram as funções puras só aparecem quando são geradas
+        if pure_functions or (self.memoize and hasattr(self.program, "materialize")):
+            handlers.update(RET=self.op_RET_MEMO, RET_L=self.op_RET_L_MEMO)
+
+        def decode_instruction(instr):
+            op = instr[0]
+            if op == "CALL" and instr[1] in pure_functions:
+                return self.op_CALL_MEMO, instr[1:]
+            handler = handlers.get(op)
+            if handler is None:
+                handler = handlers[op] = getattr(self, f"op_{op}", self.op_NOP)
+            return handler, instr[1:]
+
+        self.decode_instruction = decode_instruction
+        if getattr(instructions, "lazy", False):
+            return LazyCode(instructions, decode_instruction)
+        return [decode_instruction(instr) for instr in instructions]
+
+    def run_decoded(self, code):
+        steps = 0
+        end = len(code)
+        while self.running and self.pc < end:
+            handler, args = code[self.pc]
+            handler(*args)
+            self.pc += 1
+            steps += 1
+        self.steps += steps
+
+    def op_NOP(self, *args):
+        pass
 
     def op_HALT(self):
         self.running = False
+        self.sink.flush()
+
+    def op_ENTER(self, size):
+        # O frame vem do pool com a lista de locais vazia (o RET a limpa).
+        frame_locals = self.locals
+        missing = size - len(frame_locals)
+        if missing > 0:
+            frame_locals.extend(ZEROS[missing])
+
+    def op_ALLOC_GLOBAL(self, slot, value=0):
+        self.static_memory[slot] = value
+
+    def op_LOAD_GLOBAL(self, slot):
+        self.stack.append(self.static_memory[slot])
+
+    def op_STORE_GLOBAL(self, slot):
+        self.static_memory[slot] = self.stack.pop()
+
+    def op_ALLOC_LOCAL(self, slot, value=0):
+        self.locals[slot] = value
+
+    def op_LOAD_LOCAL(self, slot):
+        self.stack.append(self.locals[slot])
+
+    def op_STORE_LOCAL(self, slot):
+        self.locals[slot] = self.stack.pop()
+
+    def op_NEW_ARRAY(self, element_type):
+        self.stack.append(new_array(element_type, self.stack.pop()))
+
+    def op_LOAD_INDEX(self):
+        stack = self.stack
+        index = stack.pop()
+        values = stack.pop()
+        stack.append(values[check_index(values, index)])
+
+    def op_LOAD_INDEX_UNCHECKED(self):
+        stack = self.stack
+        index = stack.pop()
+        stack.append(stack.pop()[index])
+
+    def op_STORE_INDEX(self):
+        stack = self.stack
+        value = stack.pop()
+        index = stack.pop()
+        values = stack.pop()
+        values[check_index(values, index)] = value
+
+    def op_STORE_INDEX_UNCHECKED(self):
+        stack = self.stack
+        value = stack.pop()
+        index = stack.pop()
+        stack.pop()[index] = value
+
+    # Funções embutidas sobre arrays: uma instrução por chamada, o laço sobre
+    # os elementos roda dentro de arrays.py.
+
+    def bulk(self, function, arity):
+        stack = self.stack
+        base = len(stack) - arity
+        args = stack[base:]
+        del stack[base:]
+        stack.append(function(*args))
 
-    def op_ALLOC(self, varname, value=0):
-        self.static_memory[varname] = value
+    def op_FILL(self):
+        self.bulk(bulk_fill, 2)
 
-    def op_LOAD(self, varname):
-        self.stack.append(self.static_memory[varname])
+    def op_COPY(self):
+        self.bulk(bulk_copy, 2)
 
-    def op_STORE(self, varname):
-        self.static_memory[varname] = self.stack.pop()
+    def op_SUM(self):
+        self.bulk(bulk_sum, 1)
+
+    def op_MIN(self):
+        self.bulk(bulk_min, 1)
+
+    def op_MAX(self):
+        self.bulk(bulk_max, 1)
+
+    def op_DOT(self):
+        self.bulk(bulk_dot, 2)
+
+    def op_VADD(self):
+        self.bulk(bulk_add, 3)
+
+    def op_VMUL(self):
+        self.bulk(bulk_mul, 3)
 
     def op_PUSH(self, value):
         self.stack.append(value)
@@ -74,6 +323,11 @@ class VirtualMachine:
         a = self.stack.pop()
         self.stack.append(a * b)
 
+    def op_DIV(self):
+        b = self.stack.pop()
+        a = self.stack.pop()
+        self.stack.append(a // b if isinstance(a, int) and isinstance(b, int) else a / b)
+
     def op_EQ(self):
         b = self.stack.pop()
         a = self.stack.pop()
@@ -105,30 +359,205 @@ class VirtualMachine:
         self.stack.append(1 if a >= b else 0)
 
     def op_PRINT(self):
-        print(">>", self.stack.pop())
+        self.sink.write(self.stack.pop())
 
-    def op_LABEL(self, label):
-        pass
+    def output(self, value):
+        # print do código do JIT: passa por aqui porque o sink pode mudar
+        # entre execuções e as funções compiladas sobrevivem a elas
+        self.sink.write(value)
 
-    def op_JUMP(self, label):
-        self.pc = self.labels[label] - 1
+    def op_JUMP(self, target):
+        self.pc = target - 1
 
-    def op_JMP_IF_TRUE(self, label):
+    def op_JMP_IF_TRUE(self, target):
         condition = self.stack.pop()
         if condition:
-            self.pc = self.labels[label] - 1
+            self.pc = target - 1
 
-    def op_CALL(self, label):
-        self.call_stack.append((self.pc, self.static_memory.copy()))
-        self.pc = self.labels[label]
+    def op_CALL(self, target):
+        # Os registros vêm do pool e são reaproveitados: uma recursão profunda
+        # só aloca quando passa da maior profundidade já vista.
+        depth = len(self.call_stack)
+        if depth == len(self.frame_pool):
+            self.frame_pool.append(Frame())
+        frame = self.frame_pool[depth]
+        frame.function = target
+        frame.return_pc = self.pc
+        # um frame de chamada memoizada interrompida por exceção ainda teria
+        # a chave; só o CALL_MEMO a põe de volta
+        frame.memo_key = None
+        self.call_stack.append(frame)
+        self.locals = frame.locals
+        self.pc = target - 1
 
     def op_RET(self):
         if not self.call_stack:
             raise RuntimeError("RET called without active CALL")
-        self.pc, self.static_memory = self.call_stack.pop()
+        frame = self.call_stack.pop()
+        # solta os locais (arrays inclusive): o frame fica no pool vazio
+        frame.locals.clear()
+        self.pc = frame.return_pc
+        self.locals = self.call_stack[-1].locals if self.call_stack else None
+
+    def op_CALL_LAZY(self, name):
+        # Primeira chamada a uma função ainda não gerada: o programa a gera
+        # e esta instrução vira um CALL comum para as próximas passagens
+        entry = self.program.materialize(name)
+        instr = ("CALL", entry)
+        self.program.code[self.pc] = instr
+        if self.dispatch == "decoded":
+            handler, args = self.code[self.pc] = self.decode_instruction(instr)
+            handler(*args)
+        else:
+            self.op_CALL(entry)
+
+    # JIT: funções chamadas jit_threshold vezes viram closures Python.
+
+    def jit_lookup(self, target):
+        compiled = self.jit_functions.get(target)
+        if compiled is None:
+            count = self.call_counts.get(target, 0) + 1
+            self.call_counts[target] = count
+            if count >= self.jit_threshold:
+                compiled = self.jit_compile(target)
+        return compiled
+
+    def jit_compile(self, target):
+        start = time.perf_counter()
+        try:
+            if hasattr(self.program, "resolve_calls"):
+                self.program.resolve_calls(target)
+            if self.jit_translator is None or len(self.jit_translator.params) != len(self.program.functions):
+                # um LazyProgram pode ter ganhado funções desde a última tradução
+                if self.memoize:
+                    self.jit_memoized = frozenset(self.program.pure_functions)
+                self.jit_translator = FunctionTranslator(self.program, self.jit_memoized)
+            name, source = self.jit_translator.translate(target)
+            namespace = {"Halt": Halt, "g": self.static_memory, "_call": self.invoke, "_out": self.output,
+                         "_interp": self.interpret_at, "_LIMIT": JIT_DEPTH_LIMIT}
+            exec(compile(source, f"<tothic-jit:{name}>", "exec"), namespace)
+            compiled = (namespace[f"f_{name}"], len(self.jit_translator.params[target]))
+            self.jit_stats["compiled"] += 1
+        except AOTError:
+            # operação sem tradução: a função continua no interpretador
+            compiled = False
+            self.jit_stats["failed"] += 1
+        self.jit_stats["compile_time"] += time.perf_counter() - start
+        self.jit_functions[target] = compiled
+        return compiled
+
+    def op_CALL_JIT(self, target):
+        compiled = self.jit_lookup(target)
+        if not compiled or self.native_depth >= JIT_DEPTH_LIMIT:
+            return self.op_CALL(target)
+        function, nparams = compiled
+        stack = self.stack
+        args = stack[len(stack) - nparams:]
+        del stack[len(stack) - nparams:]
+        try:
+            stack.append(function(*args, self.native_depth + 1))
+        except Halt:
+            self.running = False
+
+    def invoke(self, target, depth, *args):
+        # Chamada feita de dentro de código compilado.
+        if target in self.jit_memoized:
+            key = memo_key(target, args)
+            memo = self.memo
+            if key in memo:
+                memo.move_to_end(key)
+                self.memo_stats["hits"] += 1
+                return memo[key]
+            self.memo_stats["misses"] += 1
+            value = self.invoke_function(target, args, depth)
+            self.remember(key, value)
+            return value
+        return self.invoke_function(target, args, depth)
+
+    def invoke_function(self, target, args, depth=0):
+        compiled = self.jit_lookup(target)
+        if compiled:
+            return compiled[0](*args, depth + 1)
+        return self.interpret_at(target, args, depth)
+
+    def interpret_at(self, target, args, depth):
+        # Interpreta a partir de código compilado a 'depth' ativações de
+        # profundidade: o CALL_JIT dentro dele continua a contagem e, passado
+        # o limite, segue interpretando
+        saved = self.native_depth
+        self.native_depth = depth
+        try:
+            return self.interpret(target, args)
+        finally:
+            self.native_depth = saved
+
+    def interpret(self, target, args):
+        # Roda uma função interpretada até o RET correspondente; usado pelo
+        # JIT e pela execução em lote quando a função não vetoriza.
+        saved_pc = self.pc
+        depth = len(self.call_stack)
+        self.stack.extend(args)
+        self.op_CALL(target)
+        self.pc += 1
+        code = self.code
+        steps = 0
+        while self.running and len(self.call_stack) > depth:
+            handler, operands = code[self.pc]
+            handler(*operands)
+            self.pc += 1
+            steps += 1
+        self.steps += steps
+        self.pc = saved_pc
+        if not self.running:
+            raise Halt()
+        return self.stack.pop()
+
+    # Memoização: chamadas a funções puras consultam um cache LRU limitado.
+
+    def remember(self, key, value):
+        memo = self.memo
+        memo[key] = value
+        if len(memo) > self.memo_size:
+            memo.popitem(last=False)
+
+    def op_CALL_MEMO(self, target):
+        stack = self.stack
+        base = len(stack) - self.program.pure_functions[target]
+        key = memo_key(target, stack[base:])
+        memo = self.memo
+        if key in memo:
+            memo.move_to_end(key)
+            del stack[base:]
+            stack.append(memo[key])
+            self.memo_stats["hits"] += 1
+            return
+        self.memo_stats["misses"] += 1
+
+        compiled = self.jit_lookup(target) if self.jit and self.native_depth < JIT_DEPTH_LIMIT else None
+        if compiled:
+            args = stack[base:]
+            del stack[base:]
+            value = compiled[0](*args, self.native_depth + 1)
+            self.remember(key, value)
+            stack.append(value)
+            return
+        self.op_CALL(target)
+        self.call_stack[-1].memo_key = key
+
+    def op_RET_MEMO(self):
+        if self.call_stack:
+            frame = self.call_stack[-1]
+            if frame.memo_key is not None:
+                self.remember(frame.memo_key, self.stack[-1])
+                frame.memo_key = None
+        self.op_RET()
 
-    def op_LOAD_ADDR(self, varname):
-        self.stack.append(("ref", varname))
+    def op_RET_L_MEMO(self, slot):
+        self.stack.append(self.locals[slot])
+        self.op_RET_MEMO()
+
+    def op_LOAD_ADDR(self, slot):
+        self.stack.append(("ref", slot))
 
     def op_DEREF(self):
         ref = self.stack[-1]
@@ -144,3 +573,90 @@ class VirtualMachine:
             self.static_memory[ref[1]] = value
         else:
             raise RuntimeError("Invalid reference")
+
+    # Superinstruções: sequências quentes fundidas por superinstructions.fuse.
+    # Sufixos indicam a origem de cada operando (L local, G global, K constante).
+
+    def op_ADD_LLL(self, a, b, dst):
+        local = self.locals
+        local[dst] = local[a] + local[b]
+
+    def op_SUB_LLL(self, a, b, dst):
+        local = self.locals
+        local[dst] = local[a] - local[b]
+
+    def op_MUL_LLL(self, a, b, dst):
+        local = self.locals
+        local[dst] = local[a] * local[b]
+
+    def op_ADD_LKL(self, a, k, dst):
+        local = self.locals
+        local[dst] = local[a] + k
+
+    def op_SUB_LKL(self, a, k, dst):
+        local = self.locals
+        local[dst] = local[a] - k
+
+    def op_EQ_LKL(self, a, k, dst):
+        local = self.locals
+        local[dst] = 1 if local[a] == k else 0
+
+    def op_NEQ_LKL(self, a, k, dst):
+        local = self.locals
+        local[dst] = 1 if local[a] != k else 0
+
+    def op_LT_LKL(self, a, k, dst):
+        local = self.locals
+        local[dst] = 1 if local[a] < k else 0
+
+    def op_GT_LKL(self, a, k, dst):
+        local = self.locals
+        local[dst] = 1 if local[a] > k else 0
+
+    def op_ADD_GGG(self, a, b, dst):
+        memory = self.static_memory
+        memory[dst] = memory[a] + memory[b]
+
+    def op_SUB_GGG(self, a, b, dst):
+        memory = self.static_memory
+        memory[dst] = memory[a] - memory[b]
+
+    def op_MUL_GGG(self, a, b, dst):
+        memory = self.static_memory
+        memory[dst] = memory[a] * memory[b]
+
+    def op_ADD_GKG(self, a, k, dst):
+        memory = self.static_memory
+        memory[dst] = memory[a] + k
+
+    def op_SUB_GKG(self, a, k, dst):
+        memory = self.static_memory
+        memory[dst] = memory[a] - k
+
+    def op_MUL_GKG(self, a, k, dst):
+        memory = self.static_memory
+        memory[dst] = memory[a] * k
+
+    def op_MOVE_LL(self, src, dst):
+        self.locals[dst] = self.locals[src]
+
+    def op_MOVE_GG(self, src, dst):
+        self.static_memory[dst] = self.static_memory[src]
+
+    def op_SET_KL(self, k, dst):
+        self.locals[dst] = k
+
+    def op_SET_KG(self, k, dst):
+        self.static_memory[dst] = k
+
+    def op_JMP_IF_TRUE_L(self, target, slot):
+        if self.locals[slot]:
+            self.pc = target - 1
+
+    def op_JMP_IF_TRUE_G(self, target, slot):
+        if self.static_memory[slot]:
+            self.pc = target - 1
+
+    def op_RET_L(self, slot):
+        self.stack.append(self.locals[slot])
+        self.op_RET()
@@ -0,0 +1,104 @@
+import operator
+from array import array
+
+try:
+    import numpy
+except ImportError:  # NumPy é opcional: sem ele as operações em lote usam os buffers direto
+    numpy = None
+
+# Armazenamento dos arrays Tothic: int e float ficam em array.array (8 bytes
+# por elemento, sem um objeto Python por posição) e bool num bytearray (1
+# byte). string não tem tamanho fixo e continua numa lista.
+TYPECODES = {"int": "q", "float": "d"}
+
+def new_array(element_type, size):
+    if not isinstance(size, int) or size < 0:
+        raise ValueError(f"Tamanho de array inválido: {size}")
+    if element_type in TYPECODES:
+        return array(TYPECODES[element_type], [0]) * size
+    if element_type == "bool":
+        return bytearray(size)
+    return [""] * size
+
+def numpy_view(values):
+    # Visão NumPy sem cópia de um array int/float; None sem NumPy ou para
+    # bool/string, que ficam no caminho por buffer.
+    if numpy is None or not isinstance(values, array):
+        return None
+    return numpy.frombuffer(values, dtype=numpy.int64 if values.typecode == "q" else numpy.float64)
+
+def check_index(values, index):
+    # Índices negativos não podem cair na indexação do Python pelo fim.
+    if not 0 <= index < len(values):
+        raise IndexError(f"Índice {index} fora dos limites do array de tamanho {len(values)}")
+    return index
+
+def check_lengths(*arrays):
+    size = len(arrays[0])
+    for other in arrays[1:]:
+        if len(other) != size:
+            raise ValueError(f"Arrays de tamanhos diferentes: {size} e {len(other)}")
+    return size
+
+# Operações em lote das funções embutidas sobre arrays. NumPy só entra onde
+# o resultado é idêntico ao do laço elemento a elemento: somas e produtos de
+# int continuam exatos (estouro vira OverflowError em vez de dar a volta
+# como no int64) e sum/dot mantêm a ordem sequencial das parcelas.
+
+def bulk_fill(values, value):
+    if isinstance(values, array):
+        values[:] = array(values.typecode, [value]) * len(values)
+    elif isinstance(values, bytearray):
+        values[:] = bytes([value]) * len(values)
+    else:
+        values[:] = [value] * len(values)
+    return 0
+
+def bulk_copy(target, source):
+    check_lengths(target, source)
+    target[:] = source
+    return 0
+
+def bulk_sum(values):
+    return sum(values)
+
+def bulk_min(values):
+    view = numpy_view(values)
+    return view.min().item() if view is not None and len(values) else min(values)
+
+def bulk_max(values):
+    view = numpy_view(values)
+    return view.max().item() if view is not None and len(values) else max(values)
+
+def bulk_dot(a, b):
+    check_lengths(a, b)
+    return sum(map(operator.mul, a, b))
+
+def elementwise(function, ufunc, target, a, b):
+    # add/mul só aceitam arrays int ou float (verificado na análise semântica)
+    check_lengths(target, a, b)
+    view = numpy_view(target)
+    if view is not None and target.typecode == "d":
+        ufunc(numpy_view(a), numpy_view(b), out=view)
+    else:
+        target[:] = array(target.typecode, map(function, a, b))
+    return 0
+
+def bulk_add(target, a, b):
+    return elementwise(operator.add, numpy and numpy.add, target, a, b)
+
+def bulk_mul(target, a, b):
+    return elementwise(operator.mul, numpy and numpy.multiply, target, a, b)
+
+# função embutida -> (opcode da VM, implementação, nº de argumentos)
+BULK_OPS = {
+    "fill": ("FILL", bulk_fill, 2),
+    "copy": ("COPY", bulk_copy, 2),
+    "sum":  ("SUM", bulk_sum, 1),
+    "min":  ("MIN", bulk_min, 1),
+    "max":  ("MAX", bulk_max, 1),
+    "dot":  ("DOT", bulk_dot, 2),
+    "add":  ("VADD", bulk_add, 3),
+    "mul":  ("VMUL", bulk_mul, 3),
+}
+BULK_OPCODES = {opcode: (function, arity) for opcode, function, arity in BULK_OPS.values()}
@@ -1,104 +1,111 @@
 from dataclasses import dataclass
 from typing import List, Optional, Union, Tuple
 
-class Node: pass
+# Nós com __slots__ (dataclass(slots=True)): sem __dict__ por instância, um
+# programa grande ocupa bem menos memória no front-end.
 
-@dataclass
+class Node:
+    __slots__ = ("line",)   # linha do fonte onde o comando começa (só em comandos)
+
+    def __post_init__(self):
+        self.line = None
+
+@dataclass(slots=True)
 class Literal(Node):
     value: Union[int, float]
     type: str
 
-@dataclass
+@dataclass(slots=True)
 class VarRef(Node):
     name: str
 
-@dataclass
+@dataclass(slots=True)
 class BinaryOp(Node):
     op: str
     left: Node
     right: Node
 
-@dataclass
+@dataclass(slots=True)
 class TypeCast(Node):
     target_type: str
     expr: Node
 
-@dataclass
+@dataclass(slots=True)
 class Assign(Node):
     name: Node
     expr: Node
 
-@dataclass
+@dataclass(slots=True)
 class Decl(Node):
     name: str
     type: str
 
-@dataclass
+@dataclass(slots=True)
 class AutoDecl(Node):
     name: str
     expr: Node
 
-@dataclass
+@dataclass(slots=True)
 class If(Node):
     condition: Node
     then_branch: Node
     else_branch: Optional[Node] = None
 
-@dataclass
+@dataclass(slots=True)
 class Block(Node):
     statements: List[Node]
 
-@dataclass
+@dataclass(slots=True)
 class NamespaceDecl(Node):
     name: str
     declarations: List[Node]
 
-@dataclass
+@dataclass(slots=True)
 class ArrayDecl(Node):
     name: str
     type: str
     size: Node
 
-@dataclass
+@dataclass(slots=True)
 class ArrayAccess(Node):
     name: str
     index: Node
 
-@dataclass
+@dataclass(slots=True)
 class QualifiedRef(Node):
     namespace: str
     name: str
 
-@dataclass
+@dataclass(slots=True)
 class ExprStmt(Node):
     expr: Node
 
-@dataclass
+@dataclass(slots=True)
 class FunctionDecl(Node):
     name: str
     params: List[Tuple[str, str]]  # (nome, tipo)
     return_type: str
     body: Block
 
-@dataclass
+@dataclass(slots=True)
 class Call(Node):
     name: str
     args: List[Node]
 
-@dataclass
+@dataclass(slots=True)
 class Print(Node):
     name: str
     args: List[Node]
 
-@dataclass
+@dataclass(slots=True)
 class Halt(Node):
     name: str
     args: List[Node]
 
-@dataclass
+@dataclass(slots=True)
 class Return(Node):
     expr: Node
 
-@dataclass
+@dataclass(slots=True)
 class Program(Node):
     statements: List[Node]
@@ -0,0 +1,298 @@
+import operator
+from itertools import repeat
+
+from lexer import *
+from parser import *
+from semantic_analyzer import *
+from tac_generator import *
+from tac_optimizer import optimize
+from vm_code_generator import *
+from linker import link
+from VM import VirtualMachine
+from python_code_generator import Halt
+
+try:
+    import numpy
+except ImportError:  # sem NumPy as colunas são listas processadas com map
+    numpy = None
+
+class BatchError(Exception): pass
+
+class NotVectorizable(Exception): pass
+
+# Execução em lote: a mesma função Tothic sobre N linhas de argumentos. Uma
+# função só com aritmética, comparações e if/else roda seu TAC uma única vez
+# sobre colunas inteiras; cada if vira uma máscara e cada atribuição dentro
+# dele um select. O resto cai na VM escalar, uma chamada por linha.
+
+COMPARISONS = {'==': operator.eq, '!=': operator.ne, '<': operator.lt,
+               '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+ARITHMETIC = {'+': operator.add, '-': operator.sub, '*': operator.mul}
+
+def divide(a, b):
+    return a // b if isinstance(a, int) and isinstance(b, int) else a / b
+
+
+def plan(body, params, scope):
+    # Converte o TAC do corpo em passos vetoriais, ou levanta
+    # NotVectorizable com o motivo.
+    targets = {instr.result for instr in body if instr.op in {'goto', 'ifz'}}
+    steps = []
+    frames = []     # ifs abertos: [rótulo do else, rótulo do fim]
+
+    def operand(value):
+        if isinstance(value, (int, float)):
+            return ("const", value)
+        symbol = scope.VMlookup(value)
+        if symbol is not None and symbol.category == 'literal':
+            raise NotVectorizable("literal string")
+        if symbol is not None and symbol.category == 'var' and value not in scope.symbols:
+            raise NotVectorizable(f"lê a variável externa '{value}'")
+        return ("var", value)
+
+    i = 0
+    while i < len(body):
+        instr = body[i]
+        op = instr.op
+        if op == 'param':
+            pass
+        elif op == '=':
+            steps.append(("set", instr.result, operand(instr.arg1)))
+        elif op in ARITHMETIC or op in COMPARISONS or op == '/':
+            steps.append(("binop", op, instr.result, operand(instr.arg1), operand(instr.arg2)))
+        elif op == 'alloc' and instr.arg1 == 1:
+            steps.append(("set", instr.result, ("const", 0)))
+        elif op == 'ifz':
+            frames.append([instr.result, None])
+            steps.append(("if", operand(instr.arg1)))
+        elif op == 'goto':
+            # só o salto do fim do then, seguido do rótulo do else
+            following = body[i + 1] if i + 1 < len(body) else None
+            if not frames or frames[-1][1] is not None or following is None \
+                    or following.op != 'label' or following.result != frames[-1][0]:
+                raise NotVectorizable("desvio fora do padrão de if (laço ou chamada de cauda)")
+            frames[-1][1] = instr.result
+            steps.append(("else",))
+            i += 1
+        elif op == 'label':
+            if frames and instr.result == frames[-1][1]:
+                frames.pop()
+                steps.append(("endif",))
+            elif instr.result in targets:
+                raise NotVectorizable("desvio fora do padrão de if (laço ou chamada de cauda)")
+        elif op == 'ret':
+            steps.append(("ret", operand(instr.arg1) if instr.arg1 is not None else ("const", 0)))
+        else:
+            raise NotVectorizable(f"operação '{op}' não vetoriza")
+        i += 1
+    return steps
+
+
+class ListLanes:
+    # Colunas como listas; cada operação é um map em C sobre a coluna toda.
+    # Máscaras são listas de bool e None significa "todas as linhas".
+
+    def __init__(self, size):
+        self.size = size
+
+    def column(self, values):
+        return list(values)
+
+    def lanes(self, value):
+        return value if isinstance(value, list) else repeat(value, self.size)
+
+    def binop(self, op, a, b, active):
+        if op == '/':
+            if not isinstance(a, list) and not isinstance(b, list) and b != 0:
+                return divide(a, b)
+            # só as linhas ativas dividem: as outras podem ter divisor zero
+            return [divide(x, y) if m else 0 for m, x, y in zip(self.lanes(True if active is None else active),
+                                                                 self.lanes(a), self.lanes(b))]
+        if not isinstance(a, list) and not isinstance(b, list):
+            result = ARITHMETIC[op](a, b) if op in ARITHMETIC else COMPARISONS[op](a, b)
+            return int(result) if op in COMPARISONS else result
+        if op in ARITHMETIC:
+            return list(map(ARITHMETIC[op], self.lanes(a), self.lanes(b)))
+        return list(map(int, map(COMPARISONS[op], self.lanes(a), self.lanes(b))))
+
+    def truth(self, value):
+        return list(map(bool, self.lanes(value)))
+
+    def where(self, mask, a, b):
+        return [x if m else y for m, x, y in zip(mask, self.lanes(a), self.lanes(b))]
+
+    def both(self, a, b):
+        return list(map(operator.and_, a, b))
+
+    def either(self, a, b):
+        return list(map(operator.or_, a, b))
+
+    def invert(self, mask):
+        return [not m for m in mask]
+
+    def any(self, mask):
+        return any(mask)
+
+    def result(self, value):
+        return self.column(self.lanes(value))
+
+
+class NumpyLanes(ListLanes):
+    # Colunas como vetores NumPy. Inteiros viram int64: diferente da VM, um
+    # estouro dá a volta em vez de crescer.
+
+    def column(self, values):
+        return numpy.asarray(values)
+
+    def lanes(self, value):
+        return value
+
+    def binop(self, op, a, b, active):
+        a, b = numpy.asarray(a), numpy.asarray(b)
+        if op in ARITHMETIC:
+            return ARITHMETIC[op](a, b)
+        if op in COMPARISONS:
+            return COMPARISONS[op](a, b).astype(numpy.int64)
+        zero = b == 0
+        if numpy.any(zero if active is None else zero & active):
+            raise ZeroDivisionError("divisão por zero")
+        b = numpy.where(zero, 1, b)
+        if a.dtype.kind in "iub" and b.dtype.kind in "iub":
+            return numpy.floor_divide(a, b)
+        return numpy.true_divide(a, b)
+
+    def truth(self, value):
+        return numpy.broadcast_to(numpy.asarray(value) != 0, (self.size,))
+
+    def where(self, mask, a, b):
+        return numpy.where(mask, a, b)
+
+    def both(self, a, b):
+        return a & b
+
+    def either(self, a, b):
+        return a | b
+
+    def invert(self, mask):
+        return ~mask
+
+    def any(self, mask):
+        return bool(numpy.any(mask))
+
+    def result(self, value):
+        return numpy.broadcast_to(numpy.asarray(value), (self.size,)).copy()
+
+
+def run_plan(steps, params, columns, lanes):
+    env = {name: lanes.column(column) for name, column in zip(params, columns)}
+    mask = None         # linhas que chegaram ao ponto atual (None: todas)
+    done = None         # linhas que já retornaram
+    result = 0
+    branches = []
+
+    def value(operand):
+        kind, item = operand
+        return item if kind == "const" else env.get(item, 0)
+
+    for step in steps:
+        kind = step[0]
+        if done is None:
+            active = mask
+        else:
+            pending = lanes.invert(done)
+            active = pending if mask is None else lanes.both(mask, pending)
+
+        if kind == "set":
+            new = value(step[2])
+            env[step[1]] = new if active is None else lanes.where(active, new, env.get(step[1], 0))
+        elif kind == "binop":
+            _, op, target, a, b = step
+            new = lanes.binop(op, value(a), value(b), active)
+            env[target] = new if active is None else lanes.where(active, new, env.get(target, 0))
+        elif kind == "if":
+            condition = lanes.truth(value(step[1]))
+            branches.append((mask, condition))
+            mask = condition if mask is None else lanes.both(mask, condition)
+        elif kind == "else":
+            outer, condition = branches[-1]
+            inverted = lanes.invert(condition)
+            mask = inverted if outer is None else lanes.both(outer, inverted)
+        elif kind == "endif":
+            mask = branches.pop()[0]
+        elif kind == "ret":
+            if active is None:
+                return lanes.result(value(step[1]))
+            result = lanes.where(active, value(step[1]), result)
+            done = active if done is None else lanes.either(done, active)
+            if not lanes.any(lanes.invert(done)):
+                return lanes.result(result)
+
+    # retorno implícito 0 para as linhas que chegaram ao fim do corpo
+    if done is None:
+        return lanes.result(0)
+    return lanes.result(lanes.where(done, result, 0))
+
+
+class BatchFunction:
+    # Compila uma função de um programa Tothic para execução em lote:
+    # BatchFunction(fonte, "f")(coluna_a, coluna_b) devolve a coluna de
+    # resultados. 'vectorized' diz se ela roda vetorizada e, se não, 'reason'
+    # diz por quê.
+
+    def __init__(self, source_code, name, opt=False, use_numpy=None):
+        stream = TokenStream(Lexer(source_code).scan())
+        parsed_ast = Parser(stream).parse_program()
+        analyzer = SemanticAnalyzer()
+        analyzer.visit(parsed_ast)
+        instructions = TACGenerator(analyzer.global_scope).visit(parsed_ast)
+        if opt:
+            instructions = optimize(instructions)
+
+        start = next((i for i, instr in enumerate(instructions) if instr.op == 'func' and instr.result == name), None)
+        namespace = next((instr.result for instr in reversed(instructions[:start or 0]) if instr.op == 'namespace'), None)
+        scope = analyzer.global_scope.child(namespace).child(name) if namespace is not None else None
+        if scope is None or scope.frame is not scope:
+            raise BatchError(f"Função não definida: {name}")
+        self.name = name
+        self.params = [param for param, _ in scope.parent.symbols[name].params]
+
+        end = next(i for i in range(start, len(instructions))
+                   if instructions[i].op == 'endfunc' and instructions[i].result == name)
+        try:
+            self.steps = plan(instructions[start + 1:end], self.params, scope)
+            self.reason = None
+        except NotVectorizable as e:
+            self.steps = None
+            self.reason = str(e)
+
+        self.program = link(VMCodeGenerator(instructions, analyzer.global_scope).generate())
+        if use_numpy and numpy is None:
+            raise BatchError("NumPy não está instalado")
+        self.use_numpy = numpy is not None if use_numpy is None else use_numpy
+
+    @property
+    def vectorized(self):
+        return self.steps is not None
+
+    def __call__(self, *columns):
+        if len(columns) != len(self.params):
+            raise BatchError(f"Função '{self.name}' espera {len(self.params)} colunas, mas recebeu {len(columns)}")
+        sizes = {len(column) for column in columns}
+        if len(sizes) > 1:
+            raise BatchError(f"Colunas de tamanhos diferentes: {sorted(sizes)}")
+        size = sizes.pop() if sizes else 1
+        if self.steps is None:
+            return self.run_scalar(columns, size)
+        lanes = NumpyLanes(size) if self.use_numpy else ListLanes(size)
+        return run_plan(self.steps, self.params, columns, lanes)
+
+    def run_scalar(self, columns, size):
+        vm = VirtualMachine()
+        vm.load(self.program)
+        entry = self.program.functions[self.name]
+        rows = zip(*columns) if columns else repeat((), size)
+        try:
+            results = [vm.interpret(entry, row) for row in rows]
+        except Halt:
+            raise BatchError(f"halt() chamado dentro de '{self.name}' na execução em lote")
+        return numpy.asarray(results) if self.use_numpy else results
@@ -0,0 +1,544 @@
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import fields, is_dataclass, make_dataclass
+from itertools import islice
+from contextlib import redirect_stdout
+
+from lexer import *
+from parser import *
+from semantic_analyzer import *
+from tac_generator import *
+from tac_optimizer import optimize
+from vm_code_generator import *
+from linker import *
+from VM import *
+from register_code_generator import *
+from register_vm import *
+from superinstructions import fuse
+from python_code_generator import compile_program, run_compiled
+from batch import BatchFunction
+from profiler import SamplingProfiler
+from output import StdoutSink, BufferedSink, NullSink
+from compiler import compile as compile_source, compile_lazy, generate
+import bytecode
+
+
+def build_program(source_code, opt=False, engine="pilha", superinstructions=False):
+    stream = TokenStream(Lexer(source_code).scan())
+    parsed_ast = Parser(stream).parse_program()
+    analyzer = SemanticAnalyzer()
+    analyzer.visit(parsed_ast)
+    instructions = TACGenerator(analyzer.global_scope).visit(parsed_ast)
+    if opt:
+        instructions = optimize(instructions)
+    if engine == "registradores":
+        return RegisterCodeGenerator(instructions, analyzer.global_scope).generate()
+    vm_code = VMCodeGenerator(instructions, analyzer.global_scope).generate()
+    if superinstructions:
+        vm_code = fuse(vm_code)
+    return link(vm_code)
+
+
+def generate_arithmetic(n):
+    # Programa linear com n declarações encadeadas, cheio de temporários
+    lines = ["namespace main {", "    int v0 = 1;"]
+    for i in range(1, n):
+        lines.append(f"    int v{i} = v{i - 1} + {i} * 2 - 1;")
+    lines.append(f"    print(v{n - 1});")
+    lines.append("    halt();")
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def generate_recursive(depth, calls):
+    # Contagem regressiva recursiva chamada várias vezes a partir do main
+    lines = [
+        "namespace main {",
+        "    int conta(int n) {",
+        "        int r;",
+        "        r = 0;",
+        "        if (n != 0) {",
+        "            r = conta(n - 1) + 1;",
+        "        }",
+        "        return r;",
+        "    }",
+    ]
+    for i in range(calls):
+        lines.append(f"    auto x{i} = conta({depth});")
+    lines.append(f"    print(x{calls - 1});")
+    lines.append("    halt();")
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def generate_fibonacci(n):
+    # Fibonacci ingênuo: função pura com recursão exponencial
+    return "\n".join([
+        "namespace main {",
+        "    int fib(int n) {",
+        "        if (n < 2) {",
+        "            return n;",
+        "        }",
+        "        return fib(n - 1) + fib(n - 2);",
+        "    }",
+        f"    print(fib({n}));",
+        "    halt();",
+        "}",
+    ])
+
+
+# As seções que comparam motores desligam a memoização: o programa recursivo
+# é puro e, com ela, as chamadas repetidas viram consultas ao cache.
+def time_vm(program, repeat, make_vm=VirtualMachine, **vm_options):
+    best = None
+    steps = 0
+    for _ in range(repeat):
+        vm = make_vm(sink=NullSink(), **vm_options)
+        start = time.perf_counter()
+        vm.run(program)
+        elapsed = time.perf_counter() - start
+        steps = vm.steps
+        best = elapsed if best is None else min(best, elapsed)
+    return best, steps
+
+
+def bench_dispatch(sources, repeat):
+    print("\n--- Despacho da VM: decoded x legacy ---\n")
+    print(f"{'programa':<28}{'modo':<10}{'ops':>10}{'tempo (s)':>12}{'ops/s':>14}")
+    for name, source_code in sources:
+        program = build_program(source_code)
+        for mode in DISPATCH_MODES:
+            elapsed, steps = time_vm(program, repeat, dispatch=mode, memoize=False)
+            print(f"{name:<28}{mode:<10}{steps:>10}{elapsed:>12.4f}{steps / elapsed:>14,.0f}")
+
+
+def bench_engines(sources, repeat):
+    print("\n--- Motores: pilha x registradores ---\n")
+    print(f"{'programa':<28}{'motor':<15}{'despachos':>10}{'tempo (s)':>12}")
+    for name, source_code in sources:
+        stack_program = build_program(source_code)
+        register_program = build_program(source_code, engine="registradores")
+        results = [
+            ("pilha",) + time_vm(stack_program, repeat, memoize=False),
+            ("registradores",) + time_vm(register_program, repeat, make_vm=RegisterVM),
+        ]
+        for engine, elapsed, steps in results:
+            print(f"{name:<28}{engine:<15}{steps:>10}{elapsed:>12.4f}")
+
+
+def bench_superinstructions(sources, repeat):
+    print("\n--- Superinstruções ---\n")
+    print(f"{'programa':<28}{'código':<15}{'despachos':>10}{'tempo (s)':>12}")
+    for name, source_code in sources:
+        for label, fused in (("simples", False), ("fundido", True)):
+            elapsed, steps = time_vm(build_program(source_code, superinstructions=fused), repeat, memoize=False)
+            print(f"{name:<28}{label:<15}{steps:>10}{elapsed:>12.4f}")
+
+
+def bench_aot(sources, repeat):
+    print("\n--- VM x módulo Python compilado (AOT) ---\n")
+    print(f"{'programa':<28}{'VM (s)':>10}{'compilação (s)':>16}{'AOT (s)':>10}{'ganho':>8}")
+    for name, source_code in sources:
+        program = build_program(source_code, superinstructions=True)
+        vm_time, _ = time_vm(program, repeat, memoize=False)
+        start = time.perf_counter()
+        compile_program(program)
+        compile_time = time.perf_counter() - start
+        aot_time = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run_compiled(program, NullSink())
+            elapsed = time.perf_counter() - start
+            aot_time = elapsed if aot_time is None else min(aot_time, elapsed)
+        print(f"{name:<28}{vm_time:>10.4f}{compile_time:>16.4f}{aot_time:>10.4f}{vm_time / aot_time:>7.1f}x")
+
+
+def bench_jit(sources, repeat):
+    print("\n--- JIT de funções quentes ---\n")
+    print(f"{'programa':<28}{'VM (s)':>10}{'VM+JIT (s)':>12}{'compiladas':>12}{'compilação (s)':>16}")
+    for name, source_code in sources:
+        program = build_program(source_code)
+        vm_time, _ = time_vm(program, repeat, memoize=False)
+        jit_time, _ = time_vm(program, repeat, jit=True, memoize=False)
+        vm = VirtualMachine(jit=True, memoize=False, sink=NullSink())
+        vm.run(program)
+        stats = vm.jit_stats
+        print(f"{name:<28}{vm_time:>10.4f}{jit_time:>12.4f}{stats['compiled']:>12}{stats['compile_time']:>16.4f}")
+
+
+def bench_memo(repeat):
+    print("\n--- Memoização de funções puras ---\n")
+    print(f"{'programa':<28}{'sem memo (s)':>14}{'com memo (s)':>14}{'acertos':>10}{'falhas':>10}")
+    for n in (15, 20, 25):
+        program = build_program(generate_fibonacci(n))
+        plain_time, _ = time_vm(program, repeat, memoize=False)
+        memo_time, _ = time_vm(program, repeat)
+        vm = VirtualMachine(sink=NullSink())
+        vm.run(program)
+        stats = vm.memo_stats
+        print(f"{f'fib({n})':<28}{plain_time:>14.4f}{memo_time:>14.4f}{stats['hits']:>10}{stats['misses']:>10}")
+
+
+def generate_array_sum(n, bulk):
+    # Soma de um array de n posições: laço por chamada de cauda ou sum()
+    lines = [
+        "namespace main {",
+        f"    int v[{n}];",
+        "    int soma(int i, int acc) {",
+        f"        if (i == {n}) {{",
+        "            return acc;",
+        "        }",
+        "        return soma(i + 1, acc + v[i]);",
+        "    }",
+        "    fill(v, 3);",
+        "    print(sum(v));" if bulk else "    print(soma(0, 0));",
+        "    halt();",
+        "}",
+    ]
+    return "\n".join(lines)
+
+
+def bench_bulk(repeat):
+    print("\n--- Funções embutidas sobre arrays ---\n")
+    print(f"{'programa':<28}{'laço (s)':>12}{'sum() (s)':>12}{'ganho':>8}")
+    for n in (1000, 100000):
+        loop_time, _ = time_vm(build_program(generate_array_sum(n, False)), repeat, memoize=False)
+        bulk_time, _ = time_vm(build_program(generate_array_sum(n, True)), repeat, memoize=False)
+        print(f"{f'soma de {n} ints':<28}{loop_time:>12.4f}{bulk_time:>12.4f}{loop_time / bulk_time:>7.0f}x")
+
+
+BATCH_SOURCE = """
+namespace main {
+    int classe(int x, int y) {
+        int r;
+        r = x * 2 - y;
+        if (r > 10) {
+            r = r - y * 3;
+        } else {
+            r = r + 100;
+        }
+        return r;
+    }
+}
+"""
+
+
+def bench_batch(repeat):
+    print("\n--- Execução em lote ---\n")
+    print(f"{'linhas':<28}{'VM escalar (s)':>16}{'vetorizada (s)':>16}{'ganho':>8}")
+    function = BatchFunction(BATCH_SOURCE, "classe")
+    for rows in (1000, 100000):
+        xs = [(i * 7919) % 41 - 20 for i in range(rows)]
+        ys = [i % 6 for i in range(rows)]
+        scalar_time = vector_time = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function.run_scalar((xs, ys), rows)
+            elapsed = time.perf_counter() - start
+            scalar_time = elapsed if scalar_time is None else min(scalar_time, elapsed)
+            start = time.perf_counter()
+            function(xs, ys)
+            elapsed = time.perf_counter() - start
+            vector_time = elapsed if vector_time is None else min(vector_time, elapsed)
+        print(f"{rows:<28}{scalar_time:>16.4f}{vector_time:>16.4f}{scalar_time / vector_time:>7.1f}x")
+
+
+def bench_sampling(sources, repeat):
+    # Custo do amostrador na taxa padrão: mesmo programa com e sem SIGPROF
+    print("\n--- Amostragem da pilha (SIGPROF) ---\n")
+    print(f"{'programa':<28}{'sem (s)':>12}{'com (s)':>12}{'custo':>9}{'amostras':>10}")
+    for name, source_code in sources:
+        program = build_program(source_code)
+        plain_time, _ = time_vm(program, repeat, memoize=False)
+        best, samples = None, 0
+        for _ in range(repeat):
+            sampler = SamplingProfiler(VirtualMachine(memoize=False, sink=NullSink()))
+            start = time.perf_counter()
+            sampler.run(program)
+            elapsed = time.perf_counter() - start
+            samples = sum(sampler.samples.values())
+            best = elapsed if best is None else min(best, elapsed)
+        overhead = 100 * (best - plain_time) / plain_time
+        print(f"{name:<28}{plain_time:>12.4f}{best:>12.4f}{overhead:>8.1f}%{samples:>10}")
+
+
+def generate_prints(n):
+    # Laço por chamada de cauda que imprime n linhas
+    lines = [
+        "namespace main {",
+        "    int mostra(int i) {",
+        f"        if (i == {n}) {{",
+        "            return 0;",
+        "        }",
+        "        print(i);",
+        "        return mostra(i + 1);",
+        "    }",
+        "    auto z = mostra(0);",
+        "    halt();",
+        "}",
+    ]
+    return "\n".join(lines)
+
+
+def bench_output(repeat):
+    # Saída para um arquivo de verdade, onde cada write é uma chamada de sistema
+    print("\n--- Destino dos prints ---\n")
+    print(f"{'programa':<28}{'destino':<10}{'tempo (s)':>12}")
+    program = build_program(generate_prints(50000))
+    with open(os.devnull, "w") as devnull:
+        sinks = [("linha", StdoutSink), ("buffer", lambda: BufferedSink(devnull)), ("nula", NullSink)]
+        for label, make_sink in sinks:
+            best = None
+            for _ in range(repeat):
+                vm = VirtualMachine(memoize=False, sink=make_sink())
+                with redirect_stdout(devnull):
+                    start = time.perf_counter()
+                    vm.run(program)
+                    elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{'prints (n=50000)':<28}{label:<10}{best:>12.4f}")
+
+
+def bench_image(repeat):
+    # Carregar um .totc inteiro x abrir a imagem mapeada (decodificação sob
+    # demanda); o tempo até a primeira instrução é o que cada worker paga
+    print("\n--- Imagem .totc: carga completa x mmap ---\n")
+    print(f"{'programa':<28}{'modo':<10}{'carga (s)':>12}{'execução (s)':>14}")
+    program = build_program(generate_arithmetic(5000))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "programa.totc")
+        bytecode.save(program, path)
+        for label, open_program in (("decode", bytecode.load), ("mmap", bytecode.open_image)):
+            load_time = run_time = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                loaded = open_program(path)
+                vm = VirtualMachine(memoize=False, sink=NullSink())
+                vm.load(loaded)
+                elapsed = time.perf_counter() - start
+                load_time = elapsed if load_time is None else min(load_time, elapsed)
+                start = time.perf_counter()
+                vm.run(loaded)
+                elapsed = time.perf_counter() - start
+                run_time = elapsed if run_time is None else min(run_time, elapsed)
+                if label == "mmap":
+                    del vm
+                    loaded.close()
+            print(f"{'aritmetica (n=5000)':<28}{label:<10}{load_time:>12.4f}{run_time:>14.4f}")
+
+
+def generate_library(functions, used):
+    # Muitas funções declaradas e só as 'used' primeiras chamadas pelo main
+    lines = ["namespace main {"]
+    for i in range(functions):
+        lines += [
+            f"    int f{i}(int n) {{",
+            "        int r;",
+            f"        r = n * {i + 1} + 1;",
+            "        if (r > 100) {",
+            "            r = r - 100;",
+            "        }",
+            "        return r;",
+            "    }",
+        ]
+    lines.append("    int total;")
+    lines.append("    total = 0;")
+    for i in range(used):
+        lines.append(f"    total = total + f{i}({i});")
+    lines.append("    print(total);")
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def bench_lazy(repeat):
+    # Geração completa x preguiçosa: com poucas funções usadas, o tempo até
+    # a primeira instrução cai para o custo do front-end e do main
+    print("\n--- Geração de código: completa x preguiçosa ---\n")
+    print(f"{'programa':<28}{'modo':<14}{'compilação (s)':>16}{'total (s)':>12}")
+    for functions, used in ((500, 5), (500, 500)):
+        source = generate_library(functions, used)
+        for label, compile_program in (("completa", compile_source), ("preguiçosa", compile_lazy)):
+            first = total = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                program = compile_program(source)
+                vm = VirtualMachine(sink=NullSink())
+                vm.load(program)
+                loaded = time.perf_counter() - start
+                vm.execute()
+                elapsed = time.perf_counter() - start
+                first = loaded if first is None else min(first, loaded)
+                total = elapsed if total is None else min(total, elapsed)
+            print(f"{f'{functions} funções, {used} usadas':<28}{label:<14}{first:>16.4f}{total:>12.4f}")
+
+
+def bench_dead_functions(repeat):
+    # Programa inteiro x sem as funções que o main não alcança: tamanho do
+    # código e da imagem .totc e o tempo para carregá-la
+    print("\n--- Eliminação de funções mortas ---\n")
+    print(f"{'programa':<28}{'modo':<14}{'instruções':>12}{'.totc (bytes)':>15}{'carga (s)':>12}")
+    source = generate_library(500, 5)
+    for label, shake in (("completo", False), ("podado", True)):
+        vm_code = generate(source)
+        if shake:
+            vm_code, _ = remove_dead_functions(vm_code)
+        program = link(vm_code)
+        data = bytecode.encode(program)
+        load_time = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            bytecode.decode(data)
+            elapsed = time.perf_counter() - start
+            load_time = elapsed if load_time is None else min(load_time, elapsed)
+        print(f"{'500 funções, 5 usadas':<28}{label:<14}{len(program.code):>12}{len(data):>15}{load_time:>12.4f}")
+
+
+def bench_lexer(repeat):
+    # Lista completa de tokens x gerador consumido pelo TokenStream, com o
+    # fonte em memória e mapeado do disco: tempo e pico de memória alocada
+    # durante a varredura (o pico da lista cresce com o número de tokens)
+    print("\n--- Lexer: lista x streaming ---\n")
+    print(f"{'fonte':<20}{'modo':<14}{'tempo (s)':>12}{'pico (MiB)':>12}")
+    source = generate_arithmetic(100000)
+
+    def drain(stream):
+        while stream.consume() is not None:
+            pass
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "fonte.tot")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(source)
+        modes = (
+            ("lista", lambda: drain(TokenStream(Lexer(source).tokenize()))),
+            ("streaming", lambda: drain(TokenStream(Lexer(source).scan()))),
+            ("mmap", lambda: drain(TokenStream(Lexer.from_file(path).scan()))),
+        )
+        size = f"{len(source) / 2 ** 20:.1f} MiB"
+        for label, scan in modes:
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                scan()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            tracemalloc.start()
+            scan()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{size:<20}{label:<14}{best:>12.4f}{peak / 2 ** 20:>12.2f}")
+
+
+class DictToken:
+    # Token como era antes dos __slots__, com __dict__ por instância
+    def __init__(self, type_, value, line, col_start, col_end):
+        self.type = type_
+        self.value = value
+        self.line = line
+        self.col_start = col_start
+        self.col_end = col_end
+
+
+class DictNode:
+    line = None
+
+
+def copy_tree(value, classes, counter):
+    # Recria a AST com as classes de 'classes' (nome -> classe); conta os nós
+    if isinstance(value, list):
+        return [copy_tree(item, classes, counter) for item in value]
+    if not is_dataclass(value):
+        return value
+    counter[0] += 1
+    return classes[type(value).__name__](*(copy_tree(getattr(value, f.name), classes, counter)
+                                            for f in fields(value)))
+
+
+def traced(build):
+    # Memória que continua alocada pelo objeto devolvido por build()
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def bench_memory():
+    # Memória do front-end por 100 mil tokens e por 100 mil nós da AST:
+    # objetos com __dict__ (como antes), com __slots__ e tokens em colunas
+    print("\n--- Memória do front-end ---\n")
+    print(f"{'estrutura':<12}{'representação':<20}{'MiB por 100 mil':>16}")
+    source = generate_arithmetic(20000)
+    count = 100000
+
+    def dict_tokens():
+        return [DictToken(tok.type, tok.value, tok.line, tok.col_start, tok.col_end)
+                for tok in islice(Lexer(source).scan(), count)]
+
+    for label, build in (("__dict__", dict_tokens),
+                         ("__slots__", lambda: list(islice(Lexer(source).scan(), count))),
+                         ("colunar", lambda: TokenBuffer(islice(Lexer(source).scan(), count)))):
+        _, size = traced(build)
+        print(f"{'tokens':<12}{label:<20}{size / 2 ** 20:>16.2f}")
+
+    tree = Parser(TokenStream(Lexer(source).scan())).parse_program()
+    slotted = {cls.__name__: cls for cls in Node.__subclasses__()}
+    plain = {name: make_dataclass(name, [f.name for f in fields(cls)], bases=(DictNode,))
+             for name, cls in slotted.items()}
+    for label, classes in (("__dict__", plain), ("__slots__", slotted)):
+        counter = [0]
+        _, size = traced(lambda: copy_tree(tree, classes, counter))
+        print(f"{'nós da AST':<12}{label:<20}{size / 2 ** 20 * count / counter[0]:>16.2f}")
+
+
+def bench_parser(repeat):
+    # Expressões: uma longa e plana (um operador a cada operando) e uma com
+    # milhares de parênteses aninhados, que a descida recursiva antiga não
+    # conseguia analisar sem RecursionError
+    print("\n--- Parser de expressões ---\n")
+    print(f"{'expressão':<36}{'tempo (s)':>12}")
+    flat = " + ".join(f"x{i} * {i} - {i}" for i in range(20000))
+    nested = "(" * 5000 + "1 + 2" + ")" * 5000
+    for label, expr in (("plana (60 mil operadores)", flat), ("5000 parênteses aninhados", nested)):
+        tokens = Lexer(f"namespace main {{ auto a = {expr}; }}").tokenize()
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            Parser(TokenStream(tokens)).parse_program()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{label:<36}{best:>12.4f}")
+
+
+def load_sources():
+    with open("exemplos/recusao.tot", "r", encoding="utf-8") as f:
+        recursao = f.read()
+    return [
+        ("exemplos/recusao.tot", recursao),
+        ("aritmetica (n=2000)", generate_arithmetic(2000)),
+        ("recursiva (prof=200, x20)", generate_recursive(200, 20)),
+    ]
+
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    sources = load_sources()
+    bench_dispatch(sources, repeat)
+    bench_engines(sources, repeat)
+    bench_superinstructions(sources, repeat)
+    bench_aot(sources, repeat)
+    bench_jit(sources, repeat)
+    bench_memo(repeat)
+    bench_bulk(repeat)
+    bench_batch(repeat)
+    bench_sampling(sources, repeat)
+    bench_output(repeat)
+    bench_image(repeat)
+    bench_lazy(repeat)
+    bench_dead_functions(repeat)
+    bench_lexer(repeat)
+    bench_memory()
+    bench_parser(repeat)
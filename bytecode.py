@@ -0,0 +1,348 @@
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+
+from linker import LinkedProgram
+from compiler import CompiledProgram
+
+class BytecodeError(Exception): pass
+
+# Formato binário .totc de um programa ligado. Depois de um cabeçalho struct
+# vêm seções de tamanho fixo, cada uma alinhada a 8 bytes, então carregar é
+# um read() e um memoryview.cast por seção, sem parsing. Com os offsets de
+# operandos e de strings, qualquer instrução pode ser lida direto da imagem
+# (ProgramImage) sem decodificar o resto:
+#
+#   cabeçalho       MAGIC, versão, flags, hash do fonte, globais, tamanho do
+#                   main e o nº de elementos de cada seção
+#   opcodes         1 byte por instrução (índice em OPCODES)
+#   aridade         1 byte por instrução
+#   offsets         u32 por instrução: onde seus operandos começam
+#   operandos       u32 por operando, índice no pool de constantes
+#   linhas          u32 por instrução (0 = sem linha)
+#   pool            int64, float64, bool (1 byte) e strings (u32 de offset +
+#                   UTF-8), nessa ordem de índices
+#   funções         pc de entrada u32, nº de parâmetros se pura (u32, NOT_PURE
+#                   se não) e nome (u32 de offset + UTF-8)
+
+MAGIC = b"TOTC"
+FORMAT_VERSION = 2
+NOT_PURE = 0xFFFFFFFF
+NO_HASH = bytes(32)
+
+SECTIONS = (
+    ("opcodes", "B"), ("arity", "B"), ("offsets", "I"), ("operands", "I"), ("lines", "I"),
+    ("ints", "q"), ("floats", "d"), ("bools", "B"), ("string_offsets", "I"), ("strings", "B"),
+    ("entries", "I"), ("purity", "I"), ("name_offsets", "I"), ("names", "B"),
+)
+HEADER = struct.Struct(f"<4sHH32sII{len(SECTIONS)}I")
+ALIGNMENT = 8
+
+# Só se acrescenta no fim: o número de cada opcode é o formato em disco.
+OPCODES = (
+    "NOP", "HALT", "ENTER", "ALLOC_GLOBAL", "LOAD_GLOBAL", "STORE_GLOBAL", "ALLOC_LOCAL",
+    "LOAD_LOCAL", "STORE_LOCAL", "PUSH", "POP", "ADD", "SUB", "MUL", "DIV", "EQ", "NEQ",
+    "LT", "LE", "GT", "GE", "PRINT", "JUMP", "JMP_IF_TRUE", "CALL", "RET", "LOAD_ADDR",
+    "DEREF", "STORE_AT_ADDR", "NEW_ARRAY", "LOAD_INDEX", "LOAD_INDEX_UNCHECKED",
+    "STORE_INDEX", "STORE_INDEX_UNCHECKED", "FILL", "COPY", "SUM", "MIN", "MAX", "DOT",
+    "VADD", "VMUL", "ADD_LLL", "SUB_LLL", "MUL_LLL", "ADD_LKL", "SUB_LKL", "EQ_LKL",
+    "NEQ_LKL", "LT_LKL", "GT_LKL", "ADD_GGG", "SUB_GGG", "MUL_GGG", "ADD_GKG", "SUB_GKG",
+    "MUL_GKG", "MOVE_LL", "MOVE_GG", "SET_KL", "SET_KG", "JMP_IF_TRUE_L", "JMP_IF_TRUE_G",
+    "RET_L",
+)
+OPCODE_NUMBERS = {name: number for number, name in enumerate(OPCODES)}
+
+# tipos do pool, na ordem em que as seções aparecem
+POOL_TYPES = (int, float, bool, str)
+
+
+def strings_section(strings):
+    # offsets (n + 1 posições) e bytes UTF-8 concatenados
+    data = [s.encode("utf-8") for s in strings]
+    offsets = array("I", [0])
+    for item in data:
+        offsets.append(offsets[-1] + len(item))
+    return offsets, b"".join(data)
+
+def padding(size):
+    return -size % ALIGNMENT
+
+
+def pool_key(value):
+    # -0.0 == 0.0 e os dois têm o mesmo hash: floats entram no pool pelos
+    # bits, para cada um voltar com o próprio sinal
+    if type(value) is float:
+        return float, struct.pack("<d", value)
+    return type(value), value
+
+def encode(program):
+    # Programa ligado -> bytes do .totc
+    pool = {}
+    constants = {kind: [] for kind in POOL_TYPES}
+    for instr in program.code:
+        for value in instr[1:]:
+            kind = type(value)
+            if kind not in constants:
+                raise BytecodeError(f"Operando sem representação no pool: {value!r}")
+            key = pool_key(value)
+            if key not in pool:
+                pool[key] = len(constants[kind])
+                constants[kind].append(value)
+
+    # índice global de cada constante: ints, depois floats, bools e strings
+    base = {}
+    offset = 0
+    for kind in POOL_TYPES:
+        base[kind] = offset
+        offset += len(constants[kind])
+
+    opcodes = bytearray()
+    arity = bytearray()
+    offsets = array("I")
+    operands = array("I")
+    for instr in program.code:
+        if instr[0] not in OPCODE_NUMBERS:
+            raise BytecodeError(f"Opcode sem número no formato: {instr[0]}")
+        opcodes.append(OPCODE_NUMBERS[instr[0]])
+        arity.append(len(instr) - 1)
+        offsets.append(len(operands))
+        operands.extend(base[type(value)] + pool[pool_key(value)] for value in instr[1:])
+
+    try:
+        ints = array("q", constants[int])
+    except OverflowError:
+        raise BytecodeError("Constante inteira fora de 64 bits")
+    string_offsets, strings = strings_section(constants[str])
+    names = sorted(program.functions, key=program.functions.get)
+    name_offsets, name_data = strings_section(names)
+
+    sections = {
+        "opcodes": opcodes, "arity": arity, "offsets": offsets, "operands": operands,
+        "lines": array("I", (line or 0 for line in program.lines)),
+        "ints": ints, "floats": array("d", constants[float]), "bools": bytes(constants[bool]),
+        "string_offsets": string_offsets, "strings": strings,
+        "entries": array("I", (program.functions[name] for name in names)),
+        "purity": array("I", (program.pure_functions.get(program.functions[name], NOT_PURE) for name in names)),
+        "name_offsets": name_offsets, "names": name_data,
+    }
+
+    flags = int(getattr(program, "optimized", False)) | int(getattr(program, "superinstructions", False)) << 1
+    digest = bytes.fromhex(program.source_hash) if getattr(program, "source_hash", None) else NO_HASH
+    parts = [HEADER.pack(MAGIC, FORMAT_VERSION, flags, digest, program.global_size, program.main_size,
+                         *(len(sections[name]) for name, _ in SECTIONS))]
+    for name, _ in SECTIONS:
+        values = sections[name]
+        if isinstance(values, array):
+            if sys.byteorder == "big":
+                values.byteswap()
+            values = values.tobytes()
+        parts.append(bytes(values))
+        parts.append(bytes(padding(len(values))))
+    return b"".join(parts)
+
+
+def read_sections(data):
+    # Valida o cabeçalho e devolve (metadados, seções). Em máquinas little
+    # endian cada seção é um memoryview sobre 'data', sem cópia.
+    if len(data) < HEADER.size:
+        raise BytecodeError("Arquivo .totc truncado")
+    magic, version, flags, digest, global_size, main_size, *counts = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise BytecodeError("Não é um arquivo .totc")
+    if version != FORMAT_VERSION:
+        raise BytecodeError(f"Versão do formato .totc não suportada: {version} (esperada {FORMAT_VERSION})")
+    meta = {
+        "source_hash": digest.hex() if digest != NO_HASH else None,
+        "optimized": bool(flags & 1),
+        "superinstructions": bool(flags & 2),
+        "global_size": global_size,
+        "main_size": main_size,
+    }
+
+    view = memoryview(data)
+    sections = {}
+    offset = HEADER.size
+    for (name, typecode), count in zip(SECTIONS, counts):
+        size = count * array(typecode).itemsize
+        if offset + size > len(view):
+            raise BytecodeError("Arquivo .totc truncado")
+        part = view[offset:offset + size]
+        if typecode != "B":
+            if sys.byteorder == "little":
+                part = part.cast(typecode)
+            else:
+                values = array(typecode)
+                values.frombytes(part)
+                values.byteswap()
+                part = values
+        sections[name] = part
+        offset += size + padding(size)
+    return meta, sections
+
+def read_strings(offsets, data):
+    data = bytes(data)
+    return [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+def function_tables(sections):
+    names = read_strings(sections["name_offsets"], sections["names"])
+    entries = list(sections["entries"])
+    functions = dict(zip(names, entries))
+    pure_functions = {entry: nparams for entry, nparams in zip(entries, sections["purity"]) if nparams != NOT_PURE}
+    return functions, pure_functions
+
+
+def decode(data):
+    # bytes de um .totc -> CompiledProgram com tudo materializado em tuplas
+    meta, sections = read_sections(data)
+    pool = sections["ints"].tolist()
+    pool += sections["floats"].tolist()
+    pool += [bool(b) for b in sections["bools"]]
+    pool += read_strings(sections["string_offsets"], sections["strings"])
+
+    # operandos resolvidos no pool de uma vez; o laço só monta as tuplas
+    values = list(map(pool.__getitem__, sections["operands"]))
+    code = []
+    position = 0
+    for name, count in zip(map(OPCODES.__getitem__, sections["opcodes"]), sections["arity"]):
+        if count == 0:
+            code.append((name,))
+        elif count == 1:
+            code.append((name, values[position]))
+        else:
+            code.append((name, *values[position:position + count]))
+        position += count
+
+    functions, pure_functions = function_tables(sections)
+    linked = LinkedProgram(code, functions, meta["global_size"], meta["main_size"], pure_functions,
+                           [line or None for line in sections["lines"]])
+    return CompiledProgram(linked, meta["source_hash"], meta["optimized"], meta["superinstructions"])
+
+
+class ImageCode:
+    # As instruções de uma ProgramImage como sequência: cada acesso monta a
+    # tupla a partir da imagem. A VM decodifica sob demanda (lazy) e guarda
+    # só as instruções que de fato executa.
+    lazy = True
+
+    def __init__(self, image):
+        self.image = image
+
+    def __len__(self):
+        return len(self.image.opcodes)
+
+    def __getitem__(self, pc):
+        if isinstance(pc, slice):
+            return [self[i] for i in range(*pc.indices(len(self)))]
+        image = self.image
+        count = image.arity[pc]
+        if not count:
+            return (OPCODES[image.opcodes[pc]],)
+        start = image.offsets[pc]
+        if count == 1:
+            return (OPCODES[image.opcodes[pc]], image.constant(image.operands[start]))
+        return (OPCODES[image.opcodes[pc]], *map(image.constant, image.operands[start:start + count]))
+
+
+class ImageLines:
+    def __init__(self, lines):
+        self.values = lines
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, pc):
+        return self.values[pc] or None
+
+
+class ProgramImage(LinkedProgram):
+    # Programa lido de um .totc mapeado em memória só de leitura. Instruções
+    # e constantes são lidas direto do memoryview da imagem, então vários
+    # processos que abrem (ou herdam por fork) o mesmo arquivo dividem uma
+    # única cópia física dele no page cache. Só as tabelas de funções, que
+    # são pequenas, viram objetos Python.
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        meta, sections = read_sections(self.mmap)
+        self.sections = sections
+        self.opcodes = sections["opcodes"]
+        self.arity = sections["arity"]
+        self.offsets = sections["offsets"]
+        self.operands = sections["operands"]
+        self.ints = sections["ints"]
+        self.floats = sections["floats"]
+        self.bools = sections["bools"]
+        self.string_offsets = sections["string_offsets"]
+        self.strings = sections["strings"]
+        # início das floats, bools e strings no índice do pool
+        self.float_base = len(self.ints)
+        self.bool_base = self.float_base + len(self.floats)
+        self.string_base = self.bool_base + len(self.bools)
+        functions, pure_functions = function_tables(sections)
+
+        self.code = ImageCode(self)
+        self.lines = ImageLines(sections["lines"])
+        self.functions = functions
+        self.function_names = {pc: name for name, pc in functions.items()}
+        self.pure_functions = pure_functions
+        self.global_size = meta["global_size"]
+        self.main_size = meta["main_size"]
+        self.source_hash = meta["source_hash"]
+        self.optimized = meta["optimized"]
+        self.superinstructions = meta["superinstructions"]
+
+    def constant(self, index):
+        if index < self.float_base:
+            return self.ints[index]
+        if index < self.bool_base:
+            return self.floats[index - self.float_base]
+        if index < self.string_base:
+            return bool(self.bools[index - self.bool_base])
+        index -= self.string_base
+        offsets = self.string_offsets
+        return str(self.strings[offsets[index]:offsets[index + 1]], "utf-8")
+
+    def close(self):
+        # os memoryviews precisam ser soltos antes do mmap
+        for view in self.sections.values():
+            if isinstance(view, memoryview):
+                view.release()
+        self.sections = {}
+        self.opcodes = self.arity = self.offsets = self.operands = None
+        self.ints = self.floats = self.bools = self.string_offsets = self.strings = None
+        self.lines = None
+        self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_image(path):
+    return ProgramImage(path)
+
+
+def save(program, path):
+    # Gravação atômica: quem lê nunca vê um .totc pela metade
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(encode(program))
+        os.replace(temporary, path)
+    except BaseException:
+        try:
+            os.remove(temporary)
+        except FileNotFoundError:
+            pass
+        raise
+
+def load(path):
+    with open(path, "rb") as f:
+        return decode(f.read())
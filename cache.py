@@ -0,0 +1,103 @@
+import hashlib
+import os
+
+from compiler import compile, compiler_stamp
+from bytecode import BytecodeError, decode, save
+
+CACHE_SIZE = 64 * 1024 * 1024     # bytes no diretório antes de despejar os mais antigos
+SUFFIX = ".totc"
+
+def default_directory():
+    # TOTHIC_CACHE escolhe o diretório; senão fica em $XDG_CACHE_HOME/tothic
+    if os.environ.get("TOTHIC_CACHE"):
+        return os.environ["TOTHIC_CACHE"]
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "tothic")
+
+
+class CompileCache:
+    # Cache em disco de programas compilados. A chave junta o hash do fonte,
+    # as opções de compilação e o carimbo do compilador; cada entrada é um
+    # .totc gravado de forma atômica (arquivo temporário + os.replace), e o
+    # mtime marca o último uso para o despejo LRU por tamanho total.
+
+    def __init__(self, directory=None, max_bytes=CACHE_SIZE):
+        self.directory = directory or default_directory()
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "evicted": 0}
+
+    def key(self, source_code, optimize=False, superinstructions=False):
+        text = f"{compiler_stamp()}\0{int(optimize)}\0{int(superinstructions)}\0{source_code}"
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                program = decode(f.read())
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # entrada corrompida ou de outro formato: descarta e recompila
+            self.discard(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass    # diretório só de leitura ou entrada despejada por outro processo
+        return program
+
+    def put(self, key, program):
+        os.makedirs(self.directory, exist_ok=True)
+        save(program, self.path(key))
+        self.evict()
+
+    def compile(self, source_code, optimize=False, superinstructions=False):
+        key = self.key(source_code, optimize, superinstructions)
+        program = self.get(key)
+        if program is not None:
+            self.stats["hits"] += 1
+            return program
+        self.stats["misses"] += 1
+        program = compile(source_code, optimize, superinstructions)
+        try:
+            self.put(key, program)
+        except (OSError, BytecodeError):
+            pass    # sem permissão, sem espaço ou constante sem formato: segue sem cache
+        return program
+
+    def entries(self):
+        result = []
+        for name in os.listdir(self.directory):
+            if name.endswith(SUFFIX):
+                path = os.path.join(self.directory, name)
+                try:
+                    info = os.stat(path)
+                except FileNotFoundError:
+                    continue    # despejado por outro processo
+                result.append((info.st_mtime, info.st_size, path))
+        return result
+
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self.discard(path)
+            total -= size
+            self.stats["evicted"] += 1
+
+    def clear(self):
+        for _, _, path in self.entries():
+            self.discard(path)
+
+    @staticmethod
+    def discard(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,184 @@
+import hashlib
+import importlib
+from types import MappingProxyType
+
+from lexer import Lexer, TokenStream
+from parser import Parser
+from semantic_analyzer import SemanticAnalyzer
+from tac_generator import TACGenerator
+from tac_optimizer import optimize as optimize_tac
+from vm_code_generator import VMCodeGenerator
+from linker import LinkedProgram, link, remove_dead_functions
+from superinstructions import fuse
+from VM import VirtualMachine
+from output import StdoutSink
+
+COMPILER_VERSION = "1"
+
+# Módulos cujo código decide o que compile() produz
+PIPELINE_MODULES = ("lexer", "parser", "ast_tree", "semantic_analyzer", "symbol_table", "tac_instruction",
+                    "tac_generator", "tac_optimizer", "vm_code_generator", "linker", "superinstructions",
+                    "arrays", "compiler")
+
+# Compila uma vez, executa muitas: compile() passa o fonte pelo pipeline
+# inteiro e devolve um CompiledProgram imutável; run() o executa numa VM
+# reaproveitada, que entre execuções do mesmo programa só zera globais e
+# pilhas.
+
+class CompiledProgram(LinkedProgram):
+    # Programa ligado congelado (código e tabelas em tuplas e mapeamentos só
+    # de leitura) mais os metadados da compilação. Pode ser executado por
+    # várias VMs, e a VM reconhece o mesmo programa pela identidade.
+
+    def __init__(self, linked, source_hash, optimized=False, superinstructions=False):
+        fields = {
+            "code": tuple(linked.code),
+            "functions": MappingProxyType(dict(linked.functions)),
+            "global_size": linked.global_size,
+            "main_size": linked.main_size,
+            "function_names": MappingProxyType(dict(linked.function_names)),
+            "pure_functions": MappingProxyType(dict(linked.pure_functions)),
+            "lines": tuple(linked.lines),
+            "source_hash": source_hash,
+            "optimized": optimized,
+            "superinstructions": superinstructions,
+        }
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CompiledProgram é imutável")
+
+    def __delattr__(self, name):
+        raise AttributeError("CompiledProgram é imutável")
+
+
+def source_hash(source_code):
+    return hashlib.sha256(source_code.encode("utf-8")).hexdigest()
+
+_stamp = None
+
+def compiler_stamp():
+    # Versão declarada + hash do código do pipeline: qualquer mudança no
+    # compilador invalida o que foi compilado antes, mesmo sem subir a versão.
+    global _stamp
+    if _stamp is None:
+        digest = hashlib.sha256(COMPILER_VERSION.encode())
+        for name in PIPELINE_MODULES:
+            with open(importlib.import_module(name).__file__, "rb") as f:
+                digest.update(f.read())
+        _stamp = f"{COMPILER_VERSION}-{digest.hexdigest()[:16]}"
+    return _stamp
+
+class GrowingCode(list):
+    # Código de um LazyProgram: cresce a cada função gerada, então a VM o
+    # decodifica sob demanda em vez de tudo na carga
+    lazy = True
+
+
+class LazyProgram(LinkedProgram):
+    # Programa cujas funções só passam por TAC, otimização, geração de
+    # código e ligação na primeira vez que são chamadas. O main é ligado na
+    # criação; cada chamada a uma função ainda não gerada é um CALL_LAZY, que
+    # a VM resolve com materialize() e troca por um CALL comum.
+
+    def __init__(self, generator, scope, optimize=False, superinstructions=False):
+        self.generator = generator
+        self.scope = scope
+        self.optimize = optimize
+        self.superinstructions = superinstructions
+        main_tac = generator.instructions
+        if optimize:
+            main_tac = optimize_tac(main_tac)
+        vm_code = VMCodeGenerator(main_tac, scope).generate()
+        # sem funções o gerador não fecha o main; aqui o código delas vem depois
+        vm_code.append(("HALT",))
+        linked = self.link(vm_code, 0)
+        super().__init__(GrowingCode(linked.code), {}, linked.global_size, len(linked.code),
+                         {}, linked.lines)
+
+    def link(self, vm_code, base):
+        if self.superinstructions:
+            vm_code = fuse(vm_code)
+        return link(vm_code, base, getattr(self, "functions", None), self.generator.deferred)
+
+    def materialize(self, name):
+        # Gera e liga a função; devolve o pc de entrada
+        if name in self.functions:
+            return self.functions[name]
+        tac = self.generator.function_tac(name)
+        if self.optimize:
+            tac = optimize_tac(tac)
+        vm_code = VMCodeGenerator(tac, self.scope).generate()
+        linked = self.link([instr for instr in vm_code if instr[0] != "GLOBALS"], len(self.code))
+        self.code.extend(linked.code)
+        self.lines.extend(linked.lines)
+        for function, entry in linked.functions.items():
+            if function not in self.functions:
+                self.functions[function] = entry
+                self.function_names[entry] = function
+        # atualizado no lugar: a VM consulta este mesmo dicionário
+        self.pure_functions.update(linked.pure_functions)
+        return self.functions[name]
+
+    def resolve_calls(self, entry):
+        # Gera as funções chamadas pela função em 'entry' e troca os
+        # CALL_LAZY do corpo dela por CALL: o JIT só traduz chamadas com
+        # endereço
+        end = min([pc for pc in self.function_names if pc > entry], default=len(self.code))
+        for pc in range(entry, end):
+            instr = self.code[pc]
+            if instr[0] == "CALL_LAZY":
+                self.code[pc] = ("CALL", self.materialize(instr[1]))
+
+    def materialize_all(self):
+        for name in list(self.generator.deferred):
+            self.materialize(name)
+
+
+def generate(source_code, optimize=False):
+    # Fonte -> código da VM de pilha (ainda com rótulos, antes do linker)
+    stream = TokenStream(Lexer(source_code).scan())
+    parsed_ast = Parser(stream).parse_program()
+    analyzer = SemanticAnalyzer()
+    analyzer.visit(parsed_ast)
+    instructions = TACGenerator(analyzer.global_scope).visit(parsed_ast)
+    if optimize:
+        instructions = optimize_tac(instructions)
+    return VMCodeGenerator(instructions, analyzer.global_scope).generate()
+
+def compile(source_code, optimize=False, superinstructions=False):
+    vm_code, _ = remove_dead_functions(generate(source_code, optimize))
+    if superinstructions:
+        vm_code = fuse(vm_code)
+    return CompiledProgram(link(vm_code), source_hash(source_code), optimize, superinstructions)
+
+
+def compile_lazy(source_code, optimize=False, superinstructions=False):
+    # A análise semântica roda sobre o programa inteiro; só a geração de
+    # código das funções é adiada
+    stream = TokenStream(Lexer(source_code).scan())
+    parsed_ast = Parser(stream).parse_program()
+    analyzer = SemanticAnalyzer()
+    analyzer.visit(parsed_ast)
+    generator = TACGenerator(analyzer.global_scope, lazy=True)
+    generator.visit(parsed_ast)
+    return LazyProgram(generator, analyzer.global_scope, optimize, superinstructions)
+
+
+_vm = None
+
+def run(program, sink=None, vm=None):
+    # Executa um CompiledProgram e devolve o sink usado. Sem 'vm', usa a VM
+    # do módulo, criada na primeira chamada e reaproveitada nas seguintes;
+    # ela não guarda o sink de uma chamada para a outra (sem 'sink', stdout).
+    global _vm
+    if vm is None:
+        if _vm is None:
+            _vm = VirtualMachine()
+        vm = _vm
+        vm.sink = sink if sink is not None else StdoutSink()
+    elif sink is not None:
+        vm.sink = sink
+    vm.run(program)
+    return vm.sink
@@ -1,6 +1,13 @@
+import mmap
+import os
 import re
+from array import array
+from collections import deque
+from io import StringIO
 
 class Token:
+    __slots__ = ("type", "value", "line", "col_start", "col_end")
+
     def __init__(self, type_, value, line, col_start, col_end):
         self.type = type_
         self.value = value
@@ -10,69 +17,151 @@ class Token:
 
     def __repr__(self):
         return f"{self.type}('{self.value}') @({self.line}:{self.col_start}-{self.col_end})"
-    
+
+KEYWORDS = {
+    'int', 'float', 'bool', 'string', 'auto', 'namespace', 'if', 'else', 'halt', 'print', 'return'
+}
+
+TOKEN_SPECIFICATION = [
+    ('FLOAT_LITERAL', r'\d+\.\d+'),
+    ('INT_LITERAL',   r'\d+'),
+    ('STRING_LITERAL',r'"[^"]*"'),
+    ('BOOL_LITERAL',  r'\btrue\b|\bfalse\b'),
+    ('IDENT',         r'[A-Za-z_][A-Za-z0-9_]*'),
+    ('COMMENT',       r'//[^\n]*'),
+    ('OP',            r'==|!=|<=|>=|[+\-*/=<>(){}\[\].,;]'),
+    ('SKIP',          r'[ \t]+'),
+    ('NEWLINE',       r'\n'),
+    ('MISMATCH',      r'.'),
+]
+
+# Tipos de token na ordem dos ids do TokenBuffer
+TOKEN_TYPES = tuple(name for name, _ in TOKEN_SPECIFICATION
+                    if name not in ('COMMENT', 'SKIP', 'NEWLINE', 'MISMATCH')) + \
+              tuple(sorted(keyword.upper() for keyword in KEYWORDS))
+TOKEN_TYPE_IDS = {name: i for i, name in enumerate(TOKEN_TYPES)}
+
+# Padrão mestre compilado uma vez na importação: uma versão para texto e
+# outra para bytes (arquivos mapeados com mmap)
+TOKEN_REGEX = '|'.join(f'(?P<{name}>{pattern})' for name, pattern in TOKEN_SPECIFICATION)
+MASTER_PATTERN = re.compile(TOKEN_REGEX)
+MASTER_PATTERN_BYTES = re.compile(TOKEN_REGEX.encode())
+
 class Lexer:
+    # O código pode ser uma str ou um buffer de bytes em UTF-8 (bytes, mmap).
+    # scan() é um gerador: os tokens saem um a um, conforme o parser pede,
+    # sem lista intermediária nem cópia do fonte. Em buffers de bytes as
+    # colunas contam bytes.
+
     def __init__(self, source_code):
         self.code = source_code
         self.tokens = []
-        self.keywords = {
-            'int', 'float', 'bool', 'string', 'auto', 'namespace', 'if', 'else', 'halt', 'print', 'return'
-        }
-        self.token_specification = [
-            ('FLOAT_LITERAL', r'\d+\.\d+'),
-            ('INT_LITERAL',   r'\d+'),
-            ('STRING_LITERAL',r'"[^"]*"'),
-            ('BOOL_LITERAL',  r'\btrue\b|\bfalse\b'),
-            ('IDENT',         r'[A-Za-z_][A-Za-z0-9_]*'),
-            ('OP',            r'==|!=|<=|>=|[+\-*/=<>(){}\[\].,;]'),
-            ('SKIP',          r'[ \t]+'),
-            ('NEWLINE',       r'\n'),
-            ('MISMATCH',      r'.'),
-        ]
+        self.keywords = KEYWORDS
 
-    def tokenize(self):
-        # Remove comentários de linha iniciados por //
-        self.code = re.sub(r'//.*', '', self.code)
+    @classmethod
+    def from_file(cls, path):
+        # Mapeia o arquivo em vez de lê-lo: o scanner percorre as páginas do
+        # próprio arquivo
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return cls("")
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
 
-        tok_regex = '|'.join(f'(?P<{name}>{pattern})' for name, pattern in self.token_specification)
+    def scan(self):
+        binary = not isinstance(self.code, str)
+        pattern = MASTER_PATTERN_BYTES if binary else MASTER_PATTERN
+        keywords = self.keywords
         line_num = 1
         line_start = 0
-        for mo in re.finditer(tok_regex, self.code):
+        for mo in pattern.finditer(self.code):
             kind = mo.lastgroup
-            value = mo.group()
-            col_start = mo.start() - line_start
-            col_end = mo.end() - line_start
-
+            if kind == 'SKIP' or kind == 'COMMENT':
+                continue
             if kind == 'NEWLINE':
                 line_num += 1
                 line_start = mo.end()
-            elif kind == 'SKIP':
                 continue
-            elif kind == 'MISMATCH':
+            value = mo.group()
+            if binary:
+                value = value.decode("utf-8", errors="replace")
+            col_start = mo.start() - line_start
+            col_end = mo.end() - line_start
+
+            if kind == 'MISMATCH':
                 raise SyntaxError(f"Caractere inesperado '{value}' na linha {line_num}, colunas {col_start}-{col_end}")
-            else:
-                if kind == 'IDENT' and value in self.keywords:
-                    kind = value.upper()  # Palavra-chave vira tipo próprio
-                token = Token(kind, value, line_num, col_start, col_end)
-                self.tokens.append(token)
+            if kind == 'IDENT' and value in keywords:
+                kind = value.upper()  # Palavra-chave vira tipo próprio
+            yield Token(kind, value, line_num, col_start, col_end)
 
+    def tokenize(self):
+        # Lista completa, para quem precisa ver todos os tokens (--verbose)
+        self.tokens = list(self.scan())
         return self.tokens
 
+class TokenBuffer:
+    # Tokens em colunas: arrays paralelos de id do tipo, linha e colunas, e
+    # os valores concatenados num único texto com o deslocamento de cada um.
+    # Ocupa uns 20 bytes por token, contra um objeto Token e sua string;
+    # token(i) monta o Token só quando o parser o pede.
+
+    def __init__(self, tokens):
+        self.types = array('B')
+        self.lines = array('I')
+        self.col_starts = array('I')
+        self.col_ends = array('I')
+        self.offsets = array('I', [0])
+        text = StringIO()
+        offset = 0
+        for tok in tokens:
+            self.types.append(TOKEN_TYPE_IDS[tok.type])
+            self.lines.append(tok.line)
+            self.col_starts.append(tok.col_start)
+            self.col_ends.append(tok.col_end)
+            offset += text.write(tok.value)
+            self.offsets.append(offset)
+        self.text = text.getvalue()
+
+    def __len__(self):
+        return len(self.types)
+
+    def token(self, i):
+        offsets = self.offsets
+        return Token(TOKEN_TYPES[self.types[i]], self.text[offsets[i]:offsets[i + 1]],
+                     self.lines[i], self.col_starts[i], self.col_ends[i])
+
+    def __iter__(self):
+        return map(self.token, range(len(self)))
+
 # Classe TokenStream para o Parser
 class TokenStream:
+    # Consome uma lista ou um gerador de tokens. Só guarda o último token
+    # consumido (peek(-1)) e os poucos que o parser já espiou à frente, então
+    # a memória não cresce com o tamanho do fonte.
+
     def __init__(self, tokens):
-        self.tokens = tokens
+        self.source = iter(tokens)
+        self.buffer = deque()   # tokens já lidos e ainda não consumidos
+        self.previous = None
         self.index = 0
 
     def peek(self, n=0):
-        pos = self.index + n
-        if pos < len(self.tokens):
-            return self.tokens[pos]
-        return None  # fim dos tokens
+        if n < 0:
+            if n != -1:
+                raise ValueError("TokenStream só guarda o último token consumido")
+            return self.previous
+        buffer = self.buffer
+        while len(buffer) <= n:
+            tok = next(self.source, None)
+            if tok is None:
+                return None  # fim dos tokens
+            buffer.append(tok)
+        return buffer[n]
 
     def consume(self):
         tok = self.peek()
         if tok:
+            self.buffer.popleft()
+            self.previous = tok
             self.index += 1
         return tok
 
@@ -81,3 +170,24 @@ class TokenStream:
         if not tok or tok.type != kind:
             raise SyntaxError(f"Esperado token '{kind}', mas encontrado '{tok}'")
         return tok
+
+
+class ColumnarTokenStream(TokenStream):
+    # TokenStream sobre um TokenBuffer: peek e consume leem as colunas pelo
+    # índice, sem fila de espiados; peek(-1) continua valendo.
+
+    def __init__(self, buffer):
+        self.tokens = buffer
+        self.index = 0
+
+    def peek(self, n=0):
+        pos = self.index + n
+        if 0 <= pos < len(self.tokens):
+            return self.tokens.token(pos)
+        return None  # fim dos tokens
+
+    def consume(self):
+        tok = self.peek()
+        if tok:
+            self.index += 1
+        return tok
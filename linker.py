@@ -0,0 +1,131 @@
+class LinkError(Exception): pass
+
+# Pseudo-ops que o linker retira; não ocupam pc.
+PSEUDO_OPS = {"LABEL", "FUNCTION", "GLOBALS", "LINE"}
+
+# Opcodes cujo primeiro operando é um rótulo de desvio.
+BRANCH_OPS = {"JUMP", "JMP_IF_TRUE", "JMP_IF_TRUE_L", "JMP_IF_TRUE_G"}
+
+class LinkedProgram:
+    def __init__(self, code, functions, global_size, main_size, pure_functions=None, lines=None):
+        self.code = code                # instruções sem LABEL, com alvos absolutos
+        self.functions = functions      # nome da função -> pc de entrada
+        self.global_size = global_size
+        self.main_size = main_size      # o main ocupa [0, main_size)
+        self.function_names = {pc: name for name, pc in functions.items()}
+        self.pure_functions = pure_functions or {}  # pc de entrada -> nº de parâmetros
+        self.lines = lines or [None] * len(code)    # pc -> linha do fonte
+
+    def function_at(self, pc):
+        # Nome da função cujo corpo contém o pc (None para o main).
+        name = None
+        for entry, func in sorted(self.function_names.items()):
+            if entry > pc:
+                break
+            name = func
+        return name
+
+    def __repr__(self):
+        lines = [f"; globais: {self.global_size}"]
+        for pc, instr in enumerate(self.code):
+            if pc in self.function_names:
+                lines.append(f"{self.function_names[pc]}:")
+            lines.append(f"{pc:5d}  {instr}")
+        return "\n".join(lines)
+
+
+def remove_dead_functions(vm_code):
+    # Tree shaking: separa o main (o código de topo de todos os namespaces)
+    # e o corpo de cada função, percorre o grafo de chamadas a partir do main
+    # e descarta as funções que nunca são alcançadas, junto com seus rótulos.
+    # Devolve o código que sobra e quantas instruções foram removidas.
+    main = []
+    bodies = {}
+    order = []
+    current = main
+    for instr in vm_code:
+        if instr[0] == "FUNCTION":
+            body = bodies[instr[1]] = []
+            order.append(instr[1])
+            # o LINE logo antes do FUNCTION é a linha da declaração
+            if current and current[-1][0] == "LINE":
+                body.append(current.pop())
+            current = body
+        current.append(instr)
+
+    reachable = set()
+    pending = [main]
+    while pending:
+        for instr in pending.pop():
+            if instr[0] == "CALL" and instr[1] not in reachable and instr[1] in bodies:
+                reachable.add(instr[1])
+                pending.append(bodies[instr[1]])
+
+    code = list(main)
+    removed = 0
+    for name in order:
+        if name in reachable:
+            code.extend(bodies[name])
+        else:
+            removed += sum(1 for instr in bodies[name] if instr[0] not in PSEUDO_OPS)
+    return code, removed
+
+
+def link(vm_code, base=0, functions=None, deferred=()):
+    # Primeira passada: calcula o pc de cada rótulo e de cada função como
+    # ficarão depois que os pseudo-ops LABEL/FUNCTION/GLOBALS/LINE forem retirados.
+    # 'base', 'functions' e 'deferred' servem à ligação em partes do
+    # LazyProgram: o código começa em 'base', pode chamar funções já ligadas
+    # e as chamadas a funções ainda não geradas viram CALL_LAZY pelo nome.
+    labels = {}
+    functions = dict(functions or {})
+    pure_functions = {}
+    global_size = 0
+    main_size = None
+    pc = base
+    for instr in vm_code:
+        op = instr[0]
+        if op == "LABEL":
+            labels[instr[1]] = pc
+        elif op == "FUNCTION":
+            if main_size is None:
+                main_size = pc
+            functions[instr[1]] = pc
+            # ("FUNCTION", nome, nº de parâmetros, pura)
+            if len(instr) > 3 and instr[3]:
+                pure_functions[pc] = instr[2]
+        elif op == "GLOBALS":
+            global_size = instr[1]
+        elif op == "LINE":
+            pass
+        else:
+            pc += 1
+    if main_size is None:
+        main_size = pc
+
+    # Segunda passada: reescreve desvios e chamadas com endereços absolutos.
+    code = []
+    lines = []
+    line = None
+    for instr in vm_code:
+        op = instr[0]
+        if op == "LINE":
+            line = instr[1]
+            continue
+        if op in PSEUDO_OPS:
+            continue
+        if op in BRANCH_OPS:
+            if instr[1] not in labels:
+                raise LinkError(f"Rótulo não definido: {instr[1]}")
+            instr = (op, labels[instr[1]]) + instr[2:]
+        elif op == "CALL":
+            if instr[1] in functions:
+                instr = (op, functions[instr[1]]) + instr[2:]
+            elif instr[1] in deferred:
+                instr = ("CALL_LAZY", instr[1])
+            else:
+                raise LinkError(f"Função não definida: {instr[1]}")
+        code.append(instr)
+        lines.append(line)
+
+    return LinkedProgram(code, functions, global_size, main_size, pure_functions, lines)
@@ -4,13 +4,25 @@ from semantic_analyzer import *
 from tac_generator import *
 from tac_optimizer import optimize
 from vm_code_generator import *
+from linker import *
+from superinstructions import fuse
 from VM import *
+from register_code_generator import *
+from register_vm import *
+from python_code_generator import *
+from profiler import ProfilingVM, SamplingProfiler, SAMPLE_INTERVAL
+from output import SINKS
+from cache import CompileCache
+from compiler import compile as compile_source, compile_lazy
+import bytecode
 import sys
 import os
 import argparse
 
 import sys
 
+ENGINES = ("pilha", "registradores", "python")
+
 def is_debugging():
     return sys.gettrace() is not None
 
@@ -18,18 +30,32 @@ def parse_args():
     parser = argparse.ArgumentParser(description="Leitor de parâmetros para execução de arquivos .tot")
 
     # Argumento obrigatório: arquivo .tot
-    parser.add_argument("-a", "--arquivo", type=str, help="Arquivo de entrada com extensão .tot")
+    parser.add_argument("-a", "--arquivo", type=str, help="Arquivo de entrada com extensão .tot (fonte) ou .totc (compilado)")
 
     # Flags booleanas
     parser.add_argument("-p", "--processar", action="store_true", help="Executar o código do arquivo")
     parser.add_argument("-o", "--otimizar", action="store_true", help="Aplicar otimizações")
     parser.add_argument("-v", "--verbose", action="store_true", help="Printar saídas")
+    parser.add_argument("--despacho", choices=DISPATCH_MODES, default="decoded", help="Laço de despacho da VM (decoded ou legacy)")
+    parser.add_argument("--superinstrucoes", action="store_true", help="Fundir sequências quentes em superinstruções")
+    parser.add_argument("--jit", action="store_true", help="Compilar funções quentes para Python durante a execução")
+    parser.add_argument("--jit-limiar", type=int, default=JIT_THRESHOLD, help="Chamadas até uma função ser compilada pelo JIT")
+    parser.add_argument("--sem-memo", action="store_true", help="Desligar a memoização de funções puras na VM")
+    parser.add_argument("--motor", choices=ENGINES, default="pilha", help="Máquina que executa o programa (pilha, registradores ou python compilado)")
+    parser.add_argument("--totc", type=str, help="Gravar o programa compilado em formato binário .totc neste arquivo")
+    parser.add_argument("--no-cache", action="store_true", help="Não ler nem gravar o cache de compilação em disco")
+    parser.add_argument("--saida", choices=SINKS, default="linha", help="Destino dos prints: uma linha por vez, em buffer ou descartados")
+    parser.add_argument("--preguicoso", action="store_true", help="Gerar o código de cada função só na primeira chamada (motor pilha)")
+    parser.add_argument("--profile", action="store_true", help="Rodar na VM instrumentada e imprimir o perfil por opcode, função e linha")
+    parser.add_argument("--profile-json", type=str, help="Gravar o perfil em JSON neste arquivo (implica --profile)")
+    parser.add_argument("--sample", type=str, help="Amostrar a pilha de chamadas e gravar as pilhas colapsadas (flamegraph) neste arquivo")
+    parser.add_argument("--sample-interval", type=float, default=SAMPLE_INTERVAL, help="Segundos de CPU entre amostras")
 
     args = parser.parse_args()
 
     # Validação da extensão
-    if not args.arquivo.endswith(".tot"):
-        print("Erro: o arquivo deve ter extensão '.tot'")
+    if not args.arquivo.endswith((".tot", ".totc")):
+        print("Erro: o arquivo deve ter extensão '.tot' ou '.totc'")
         sys.exit(1)
 
     if not os.path.isfile(args.arquivo):
@@ -38,19 +64,39 @@ def parse_args():
 
     return args
 
-def execute(source_code, run, opt, verbose):
+def execute(source_code, run, opt, verbose, dispatch="decoded", engine="pilha", superinstructions=False,
+            jit=False, jit_threshold=JIT_THRESHOLD, memoize=True, profile=False, profile_json=None,
+            sample=None, sample_interval=SAMPLE_INTERVAL, sink=None, cache=None, lazy=False):
+    profile = profile or profile_json is not None
+    if (profile or sample) and engine != "pilha":
+        raise ValueError("O perfil só existe no motor de pilha")
+    if lazy and engine != "pilha":
+        raise ValueError("A geração preguiçosa só existe no motor de pilha")
+
+    options = (run, verbose, dispatch, engine, jit, jit_threshold, memoize, profile, profile_json,
+               sample, sample_interval, sink)
+    if lazy:
+        # funções geradas na primeira chamada: não há programa inteiro para
+        # mostrar nem para guardar no cache
+        return run_program(compile_lazy(source_code, opt, superinstructions), *options)
+    if cache is not None and not verbose and engine != "registradores":
+        # sem etapas para mostrar, o programa ligado pode vir direto do cache
+        return run_program(cache.compile(source_code, opt, superinstructions), *options)
+
     if verbose:
         print("Conteúdo do arquivo lido com sucesso:")
         print(source_code)
 
     lexer = Lexer(source_code)
-    tokens = lexer.tokenize()
-    stream = TokenStream(tokens)
-
     if verbose:
+        # a lista inteira só é montada para ser mostrada
+        tokens = lexer.tokenize()
         print("Tokens:")
-        for t in stream.tokens:
+        for t in tokens:
             print(t)
+        stream = TokenStream(tokens)
+    else:
+        stream = TokenStream(lexer.scan())
 
     parser = Parser(stream)
     parsed_ast = parser.parse_program()
@@ -85,6 +131,18 @@ def execute(source_code, run, opt, verbose):
     else:    
         optimized = instructions 
 
+    if engine == "registradores":
+        program = RegisterCodeGenerator(optimized, analyzer.global_scope).generate()
+
+        if verbose:
+            print("\nCódigo de registradores:")
+            print(program)
+
+        if run:
+            vm = RegisterVM(sink)
+            vm.run(program)
+        return
+
     vmgen = VMCodeGenerator(optimized, analyzer.global_scope)
     vm_code = vmgen.generate()
 
@@ -93,9 +151,61 @@ def execute(source_code, run, opt, verbose):
         for line in vm_code:
             print(line, end=",\n")
 
+    vm_code, removed = remove_dead_functions(vm_code)
+
+    if verbose:
+        print(f"\nFunções mortas: {removed} instruções removidas")
+
+    if superinstructions:
+        vm_code = fuse(vm_code)
+
+    program = link(vm_code)
+
+    if verbose:
+        print("\nPrograma ligado:")
+        print(program)
+
+    run_program(program, *options)
+
+
+def run_program(program, run, verbose, dispatch, engine, jit, jit_threshold, memoize, profile, profile_json,
+                sample, sample_interval, sink):
+    if engine == "python":
+        if verbose:
+            print("\nMódulo Python:")
+            print(compile_program(program)["__source__"])
+
+        if run:
+            run_compiled(program, sink)
+        return
+
+    if run and profile:
+        vm = ProfilingVM(memoize, sink)
+        vm.run(program)
+        print()
+        print(vm.report())
+        if profile_json:
+            vm.dump_json(profile_json)
+        return
+
     if run:
-        vm = VirtualMachine()
-        vm.run(vm_code)
+        vm = VirtualMachine(dispatch, jit, jit_threshold, memoize, sink=sink)
+        if sample:
+            sampler = SamplingProfiler(vm, sample_interval)
+            sampler.run(program)
+            sampler.write(sample)
+        else:
+            vm.run(program)
+
+        if verbose and vm.memoize:
+            stats = vm.memo_stats
+            print(f"\nMemoização: {stats['hits']} acertos, {stats['misses']} falhas, "
+                  f"{len(vm.memo)} resultados no cache")
+
+        if verbose and vm.jit:
+            stats = vm.jit_stats
+            print(f"\nJIT: {stats['compiled']} funções compiladas, {stats['failed']} falhas, "
+                  f"{stats['compile_time'] * 1000:.2f} ms compilando")
 
 
 if __name__ == "__main__":
@@ -109,10 +219,26 @@ if __name__ == "__main__":
         print(f"Verbose: {args.verbose}")
 
     try:
+        if args.arquivo.endswith(".totc"):
+            # programa já compilado: vai direto para a execução
+            if args.motor == "registradores":
+                print("Erro: arquivos .totc só rodam nos motores pilha e python")
+                sys.exit(1)
+            run_program(bytecode.open_image(args.arquivo), args.processar, args.verbose, args.despacho, args.motor,
+                        args.jit, args.jit_limiar, not args.sem_memo, args.profile or args.profile_json is not None,
+                        args.profile_json, args.sample, args.sample_interval, SINKS[args.saida]())
+            sys.exit(0)
+
         with open(args.arquivo, "r", encoding="utf-8") as f:
             source_code = f.read()
 
-            execute(source_code, args.processar, args.otimizar, args.verbose)
+            if args.totc:
+                bytecode.save(compile_source(source_code, args.otimizar, args.superinstrucoes), args.totc)
+
+            execute(source_code, args.processar, args.otimizar, args.verbose, args.despacho, args.motor, args.superinstrucoes,
+                    args.jit, args.jit_limiar, not args.sem_memo, args.profile, args.profile_json,
+                    args.sample, args.sample_interval, SINKS[args.saida](),
+                    None if args.no_cache else CompileCache(), args.preguicoso)
 
     except FileNotFoundError:
         print(f"Arquivo não encontrado: {args.arquivo}")
@@ -0,0 +1,73 @@
+import sys
+
+PREFIX = ">> "
+BUFFER_LINES = 1024
+
+# Destinos da saída do print: todas as máquinas chamam sink.write(valor) a
+# cada print e sink.flush() no halt e no fim da execução.
+
+class StdoutSink:
+    # Padrão: uma linha por print, direto no sys.stdout do momento (o que
+    # mantém redirect_stdout funcionando).
+
+    def __init__(self, prefix=PREFIX):
+        self.prefix = prefix
+
+    def write(self, value):
+        sys.stdout.write(f"{self.prefix}{value}\n")
+
+    def flush(self):
+        pass
+
+
+class BufferedSink:
+    # Junta as linhas e escreve de uma vez a cada 'limit' linhas, no halt e
+    # no fim da execução.
+
+    def __init__(self, stream=None, limit=BUFFER_LINES, prefix=PREFIX):
+        self.stream = stream
+        self.limit = limit
+        self.prefix = prefix
+        self.buffer = []
+
+    def write(self, value):
+        buffer = self.buffer
+        buffer.append(f"{self.prefix}{value}\n")
+        if len(buffer) >= self.limit:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            stream = self.stream or sys.stdout
+            stream.write("".join(self.buffer))
+            stream.flush()
+            self.buffer.clear()
+
+
+class ListSink:
+    # Guarda os valores impressos; para testes e para quem embute a VM.
+
+    def __init__(self, prefix=PREFIX):
+        self.prefix = prefix
+        self.values = []
+        self.write = self.values.append
+
+    def flush(self):
+        pass
+
+    def text(self):
+        return "\n".join(f"{self.prefix}{value}" for value in self.values)
+
+
+class NullSink:
+    # Descarta a saída: mede só a execução nos benchmarks.
+
+    def write(self, value):
+        pass
+
+    def flush(self):
+        pass
+
+
+# destinos escolhidos pela linha de comando
+SINKS = {"linha": StdoutSink, "buffer": BufferedSink, "nula": NullSink}
@@ -2,14 +2,23 @@ from ast_tree import *
 
 class SyntaxError(Exception): pass
 
+# Precedência dos operadores binários (maior liga mais forte)
+BINARY_PRECEDENCE = {
+    "||": 1,
+    "&&": 2,
+    "==": 3, "!=": 3,
+    "<": 4, ">": 4, "<=": 4, ">=": 4,
+    "+": 5, "-": 5,
+    "*": 6, "/": 6,
+}
+UNARY_OPERATORS = {"-", "!"}
+UNARY_PRECEDENCE = 7
+PAREN = (0, "(")
+
 class Parser:
     def __init__(self, token_stream):
         self.tokens = token_stream
 
-    def match(self, type_, *values):
-        tok = self.tokens.peek()
-        return tok and tok.type == type_ and (tok.value in values if values else True)
-
     def parse_program(self):
         namespaces = []
         while self.tokens.peek() is not None:
@@ -39,6 +48,15 @@ class Parser:
         return NamespaceDecl(name_tok.value, declarations)
 
     def parse_declaration(self):
+        # A linha do primeiro token segue com o comando até o TAC e a VM,
+        # onde vira a tabela pc -> linha usada pelo perfil.
+        line = self.tokens.peek().line
+        stmt = self.parse_statement()
+        for node in stmt if isinstance(stmt, list) else [stmt]:
+            node.line = line
+        return stmt
+
+    def parse_statement(self):
         tok = self.tokens.peek()
         if tok.type in {"INT", "FLOAT", "BOOL", "STRING"}:
             if self.tokens.peek(2) and self.tokens.peek(2).value == "(":
@@ -50,7 +68,8 @@ class Parser:
             return self.parse_if()
         elif tok.type == "OP" and tok.value == "{":
             return self.parse_block()
-        elif tok.type == "IDENT":
+        elif tok.type == "IDENT" and not (self.tokens.peek(1) and self.tokens.peek(1).value == "("):
+            # chamadas como comando (ex.: fill(v, 0);) caem na expressão abaixo
             return self.parse_assign()
         elif tok.type == "RETURN":
             return self.parse_return()
@@ -200,62 +219,64 @@ class Parser:
             else_branch = self.parse_block()
         return If(condition, then_branch, else_branch)
 
-    def parse_expr(self): return self.parse_logical_or()
-
-    def parse_logical_or(self):
-        expr = self.parse_logical_and()
-        while self.match("OP", "||"):
-            op = self.tokens.consume().value
-            right = self.parse_logical_and()
-            expr = BinaryOp(op, expr, right)
-        return expr
-
-    def parse_logical_and(self):
-        expr = self.parse_equality()
-        while self.match("OP", "&&"):
-            op = self.tokens.consume().value
-            right = self.parse_equality()
-            expr = BinaryOp(op, expr, right)
-        return expr
-
-    def parse_equality(self):
-        expr = self.parse_relational()
-        while self.match("OP", "==", "!="):
-            op = self.tokens.consume().value
-            right = self.parse_relational()
-            expr = BinaryOp(op, expr, right)
-        return expr
-
-    def parse_relational(self):
-        expr = self.parse_additive()
-        while self.match("OP", "<", ">", "<=", ">="):
-            op = self.tokens.consume().value
-            right = self.parse_additive()
-            expr = BinaryOp(op, expr, right)
-        return expr
-
-    def parse_additive(self):
-        expr = self.parse_multiplicative()
-        while self.match("OP", "+", "-"):
-            op = self.tokens.consume().value
-            right = self.parse_multiplicative()
-            expr = BinaryOp(op, expr, right)
-        return expr
-
-    def parse_multiplicative(self):
-        expr = self.parse_unary()
-        while self.match("OP", "*", "/"):
-            op = self.tokens.consume().value
-            right = self.parse_unary()
-            expr = BinaryOp(op, expr, right)
-        return expr
-
-    def parse_unary(self):
-        if self.match("OP", "-", "!"):
-            op = self.tokens.consume().value
-            expr = self.parse_unary()
-            return BinaryOp(op, Literal(0, "int"), expr)
-        return self.parse_primary()
+    def parse_expr(self):
+        # Precedence climbing com pilhas explícitas: cada operador custa uma
+        # consulta à tabela, e parênteses aninhados empilham um marcador em
+        # vez de uma chamada recursiva, então milhares de níveis não estouram
+        # o limite de recursão do Python. Binários associam à esquerda; o
+        # unário vira BinaryOp(op, 0, expr), como antes.
+        peek, consume = self.tokens.peek, self.tokens.consume
+        operands = []
+        operators = []      # (precedência, op); PAREN marca um '(' aberto
+        open_parens = 0
+        expect_operand = True
+        while True:
+            tok = peek()
+            if expect_operand:
+                if tok is not None and tok.type == "OP":
+                    if tok.value in UNARY_OPERATORS:
+                        consume()
+                        operators.append((UNARY_PRECEDENCE, tok.value))
+                        continue
+                    if tok.value == "(":
+                        consume()
+                        operators.append(PAREN)
+                        open_parens += 1
+                        continue
+                operands.append(self.parse_primary())
+                expect_operand = False
+                continue
+
+            precedence = BINARY_PRECEDENCE.get(tok.value) if tok is not None and tok.type == "OP" else None
+            if precedence is not None:
+                consume()
+                self.reduce(operands, operators, precedence)
+                operators.append((precedence, tok.value))
+                expect_operand = True
+            elif open_parens and tok is not None and tok.type == "OP" and tok.value == ")":
+                consume()
+                self.reduce(operands, operators, 0)
+                operators.pop()     # o próprio '('
+                open_parens -= 1
+            else:
+                break
+
+        if open_parens:
+            raise SyntaxError("Esperado ')'")
+        self.reduce(operands, operators, 0)
+        return operands[0]
+
+    @staticmethod
+    def reduce(operands, operators, precedence):
+        # Aplica os operadores do topo com precedência >= 'precedence', até
+        # o '(' aberto mais próximo
+        while operators and operators[-1] is not PAREN and operators[-1][0] >= precedence:
+            op_precedence, op = operators.pop()
+            right = operands.pop()
+            if op_precedence == UNARY_PRECEDENCE:
+                operands.append(BinaryOp(op, Literal(0, "int"), right))
+            else:
+                operands.append(BinaryOp(op, operands.pop(), right))
 
     def parse_primary(self):
         tok = self.tokens.peek()
@@ -306,13 +327,6 @@ class Parser:
                         raise SyntaxError("Esperado ']'")
                     return ArrayAccess(ident, index)     
             return VarRef(ident)
-        elif tok.type == "OP" and tok.value == "(":
-            self.tokens.consume()
-            expr = self.parse_expr()
-            self.tokens.expect("OP")
-            if self.tokens.peek(-1).value != ")":
-                raise SyntaxError("Esperado ')'")
-            return expr
         else:
             raise SyntaxError(f"Expressão primária inválida: {tok}")
 
@@ -0,0 +1,240 @@
+import json
+import signal
+import time
+from collections import Counter
+
+from VM import VirtualMachine
+
+MAIN = "<main>"
+SAMPLE_INTERVAL = 0.005     # segundos de CPU entre amostras (200 Hz)
+
+class SamplingError(Exception): pass
+
+class ProfilingVM(VirtualMachine):
+    # Cópia instrumentada do laço decodificado: mede cada instrução com
+    # perf_counter_ns e agrega por pc. O laço normal da VirtualMachine fica
+    # intacto, então só quem pede --profile paga a medição (o programa roda
+    # umas 4x mais devagar; os tempos são os dos handlers, sem o custo do
+    # próprio perfilador). O JIT fica desligado: código compilado não
+    # passa pelo laço e sumiria do perfil.
+
+    def __init__(self, memoize=True, sink=None):
+        super().__init__("decoded", jit=False, memoize=memoize, sink=sink)
+        self.counts = []                # pc -> execuções
+        self.times = []                 # pc -> ns
+        self.calls = Counter()          # função -> chamadas
+        self.exclusive = Counter()      # função -> ns no próprio corpo
+        self.inclusive = Counter()      # função -> ns incluindo as chamadas feitas
+        self.total_time = 0
+
+    def run_decoded(self, code):
+        end = len(code)
+        counts = self.counts = [0] * end
+        times = self.times = [0] * end
+        calls, exclusive, inclusive = self.calls, self.exclusive, self.inclusive
+        call_stack = self.call_stack
+        clock = time.perf_counter_ns
+        shadow = []         # funções ativas, espelhando a pilha de chamadas
+        active = Counter()  # ativações abertas de cada função (recursão)
+        started = {}        # função -> tempo acumulado quando a ativação mais externa começou
+        current = MAIN
+        elapsed = 0
+        steps = 0
+        while self.running:
+            pc = self.pc
+            if pc >= end:
+                if pc >= len(code):
+                    break
+                # LazyProgram: o código cresceu com uma função recém-gerada
+                counts.extend([0] * (len(code) - end))
+                times.extend([0] * (len(code) - end))
+                end = len(code)
+            handler, args = code[pc]
+            start = clock()
+            handler(*args)
+            spent = clock() - start
+            elapsed += spent
+            counts[pc] += 1
+            times[pc] += spent
+            exclusive[current] += spent
+            steps += 1
+
+            # CALL/RET mudam a profundidade; chamadas memoizadas com acerto não
+            while len(shadow) < len(call_stack):
+                current = call_stack[len(shadow)].function
+                shadow.append(current)
+                calls[current] += 1
+                if not active[current]:
+                    started[current] = elapsed
+                active[current] += 1
+            while len(shadow) > len(call_stack):
+                function = shadow.pop()
+                active[function] -= 1
+                if not active[function]:
+                    inclusive[function] += elapsed - started[function]
+                current = shadow[-1] if shadow else MAIN
+            self.pc += 1
+
+        # halt dentro de função: fecha as ativações ainda abertas
+        for function in shadow:
+            if active[function]:
+                inclusive[function] += elapsed - started[function]
+                active[function] = 0
+        inclusive[MAIN] = elapsed
+        self.total_time = elapsed
+        self.steps += steps
+
+    def function_name(self, function):
+        if function == MAIN:
+            return MAIN
+        return self.program.function_names.get(function, f"@{function}")
+
+    def by_opcode(self):
+        result = {}
+        for pc, count in enumerate(self.counts):
+            if not count:
+                continue
+            op = self.instructions[pc][0]
+            entry = result.setdefault(op, [0, 0])
+            entry[0] += count
+            entry[1] += self.times[pc]
+        return result
+
+    def by_line(self):
+        result = {}
+        for pc, count in enumerate(self.counts):
+            if not count:
+                continue
+            entry = result.setdefault(self.program.lines[pc], [0, 0])
+            entry[0] += count
+            entry[1] += self.times[pc]
+        return result
+
+    def by_function(self):
+        result = {}
+        for function in set(self.exclusive) | set(self.inclusive):
+            result[self.function_name(function)] = {
+                "calls": self.calls[function] if function != MAIN else 1,
+                "inclusive_ns": self.inclusive[function],
+                "exclusive_ns": self.exclusive[function],
+            }
+        return result
+
+    def to_json(self):
+        return {
+            "steps": self.steps,
+            "total_ns": self.total_time,
+            "opcodes": {op: {"count": count, "time_ns": ns}
+                        for op, (count, ns) in self.by_opcode().items()},
+            "functions": self.by_function(),
+            "lines": [{"line": line, "count": count, "time_ns": ns}
+                      for line, (count, ns) in sorted(self.by_line().items(), key=lambda item: item[0] or 0)],
+        }
+
+    def dump_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_json(), f, indent=2, ensure_ascii=False)
+
+    def report(self, limit=20):
+        total = self.total_time or 1
+
+        def ms(ns):
+            return f"{ns / 1e6:10.3f}"
+
+        def share(ns):
+            return f"{100 * ns / total:6.1f}%"
+
+        out = [f"Perfil: {self.steps} instruções, {self.total_time / 1e6:.3f} ms nos handlers"]
+
+        out.append("\nPor opcode:")
+        out.append(f"{'execuções':>12} {'ms':>10} {'%':>7}  opcode")
+        opcodes = sorted(self.by_opcode().items(), key=lambda item: -item[1][1])
+        for op, (count, ns) in opcodes[:limit]:
+            out.append(f"{count:12d} {ms(ns)} {share(ns)}  {op}")
+
+        out.append("\nPor função:")
+        out.append(f"{'chamadas':>12} {'incl. ms':>10} {'%':>7} {'excl. ms':>10} {'%':>7}  função")
+        functions = sorted(self.by_function().items(), key=lambda item: -item[1]["inclusive_ns"])
+        for name, stats in functions[:limit]:
+            out.append(f"{stats['calls']:12d} {ms(stats['inclusive_ns'])} {share(stats['inclusive_ns'])} "
+                       f"{ms(stats['exclusive_ns'])} {share(stats['exclusive_ns'])}  {name}")
+
+        out.append("\nPor linha:")
+        out.append(f"{'execuções':>12} {'ms':>10} {'%':>7}  linha")
+        lines = sorted(self.by_line().items(), key=lambda item: -item[1][1])
+        for line, (count, ns) in lines[:limit]:
+            out.append(f"{count:12d} {ms(ns)} {share(ns)}  {line if line is not None else '?'}")
+        return "\n".join(out)
+
+
+class SamplingProfiler:
+    # Amostrador por sinal: a cada 'interval' segundos de CPU o SIGPROF
+    # interrompe o laço da VM e o handler copia os nomes das funções em
+    # call_stack e a linha do pc atual. A VM roda o laço normal; o custo é
+    # só o do handler, uns poucos microssegundos por amostra. Medido com
+    # bench_sampling do benchmark.py na taxa padrão (200 Hz): cerca de 2% em
+    # fib(22). Funções já compiladas pelo JIT não têm registro em call_stack
+    # e aparecem dentro de quem as chamou.
+
+    def __init__(self, vm, interval=SAMPLE_INTERVAL, lines=True):
+        if not hasattr(signal, "setitimer"):
+            raise SamplingError("Amostragem por sinal não disponível nesta plataforma")
+        self.vm = vm
+        self.interval = interval
+        self.lines = lines      # anota a linha do pc no quadro do topo
+        self.samples = Counter()
+        self.previous = None
+        self.sampling = False
+
+    def sample(self, signum, frame):
+        # Numa pilha funda a cópia pode levar mais que 'interval': o sinal
+        # seguinte chega dentro do handler e é descartado, em vez de aninhar
+        # handlers até estourar a recursão do Python
+        if self.sampling:
+            return
+        self.sampling = True
+        try:
+            self.record()
+        finally:
+            self.sampling = False
+
+    def record(self):
+        vm = self.vm
+        program = vm.program
+        if program is None:
+            return
+        names = program.function_names
+        stack = [MAIN]
+        for activation in vm.call_stack:
+            stack.append(names.get(activation.function, f"@{activation.function}"))
+        if self.lines and 0 <= vm.pc < len(program.lines) and program.lines[vm.pc] is not None:
+            stack[-1] = f"{stack[-1]}:{program.lines[vm.pc]}"
+        self.samples[";".join(stack)] += 1
+
+    def start(self):
+        self.previous = signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self.previous)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def run(self, program):
+        with self:
+            self.vm.run(program)
+
+    def collapsed(self):
+        # Formato "pilha;de;quadros contagem", lido por flamegraph.pl,
+        # speedscope e inferno.
+        return "\n".join(f"{stack} {count}" for stack, count in sorted(self.samples.items()))
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.collapsed() + "\n")
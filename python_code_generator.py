@@ -0,0 +1,392 @@
+import sys
+import weakref
+
+from arrays import BULK_OPCODES
+from output import StdoutSink
+
+class AOTError(Exception): pass
+
+class Halt(Exception): pass
+
+# Cada chamada do programa é uma chamada Python: o motor python não passa
+# desse aninhamento e run_compiled acusa AOTError quando ele é excedido
+AOT_RECURSION_LIMIT = 100000
+
+BINARY_EXPRS = {
+    "ADD": "({a} + {b})",
+    "SUB": "({a} - {b})",
+    "MUL": "({a} * {b})",
+    "DIV": "_div({a}, {b})",
+    "EQ":  "(1 if {a} == {b} else 0)",
+    "NEQ": "(1 if {a} != {b} else 0)",
+    "LT":  "(1 if {a} < {b} else 0)",
+    "LE":  "(1 if {a} <= {b} else 0)",
+    "GT":  "(1 if {a} > {b} else 0)",
+    "GE":  "(1 if {a} >= {b} else 0)",
+}
+
+# superinstruções: nome -> (operação, origem do 1º operando, origem do 2º, destino)
+FUSED_BINARY = {
+    "ADD_LLL": ("ADD", "L", "L", "L"), "SUB_LLL": ("SUB", "L", "L", "L"), "MUL_LLL": ("MUL", "L", "L", "L"),
+    "ADD_LKL": ("ADD", "L", "K", "L"), "SUB_LKL": ("SUB", "L", "K", "L"),
+    "EQ_LKL": ("EQ", "L", "K", "L"), "NEQ_LKL": ("NEQ", "L", "K", "L"),
+    "LT_LKL": ("LT", "L", "K", "L"), "GT_LKL": ("GT", "L", "K", "L"),
+    "ADD_GGG": ("ADD", "G", "G", "G"), "SUB_GGG": ("SUB", "G", "G", "G"), "MUL_GGG": ("MUL", "G", "G", "G"),
+    "ADD_GKG": ("ADD", "G", "K", "G"), "SUB_GKG": ("SUB", "G", "K", "G"), "MUL_GKG": ("MUL", "G", "K", "G"),
+}
+
+PRELUDE = '''\
+import arrays as _arrays
+from arrays import new_array as _new_array, check_index as _check
+
+def _div(a, b):
+    return a // b if isinstance(a, int) and isinstance(b, int) else a / b
+'''
+
+
+class StackValue:
+    # Valor simbólico da pilha: a expressão Python que o calcula, as
+    # variáveis de que depende e se avaliá-la tem efeito colateral (chamada).
+    __slots__ = ("expr", "deps", "pure")
+
+    def __init__(self, expr, deps=frozenset(), pure=True):
+        self.expr = expr
+        self.deps = deps
+        self.pure = pure
+
+
+class PythonCodeGenerator:
+    # Traduz um LinkedProgram da VM de pilha num módulo Python: uma função por
+    # função Tothic, locais como variáveis locais (l<slot>), globais na lista
+    # g e o if/else reconstruído a partir do padrão que o VMCodeGenerator
+    # emite para 'ifz':  <cond>; JMP_IF_TRUE then; JUMP else; then...;
+    # JUMP fim; else...; fim.
+
+    def __init__(self, program):
+        self.program = program
+        self.code = program.code
+        self.lines = []
+        self.stack = []
+        self.indent = 1
+        self.temp_count = 0
+        self.in_function = False
+        self.loop_start = None
+        self.params = {}
+        for name, entry in program.functions.items():
+            self.params[entry] = self.prologue_slots(entry)
+
+    def prologue_slots(self, entry):
+        # ENTER seguido dos STORE_LOCAL que desempilham os argumentos
+        # (último parâmetro primeiro).
+        if self.code[entry][0] != "ENTER":
+            raise AOTError(f"Função em {entry} não começa com ENTER")
+        slots = []
+        pc = entry + 1
+        while pc < len(self.code) and self.code[pc][0] == "STORE_LOCAL":
+            slots.append(self.code[pc][1])
+            pc += 1
+        return list(reversed(slots))
+
+    def function_bounds(self):
+        entries = sorted(self.program.functions.values())
+        bounds = []
+        for i, entry in enumerate(entries):
+            end = entries[i + 1] if i + 1 < len(entries) else len(self.code)
+            bounds.append((self.program.function_names[entry], entry, end))
+        return bounds
+
+    def generate(self):
+        self.lines = [PRELUDE]
+        for name, entry, end in self.function_bounds():
+            self.generate_function(name, entry, end)
+            self.lines.append("")
+
+        self.lines.append("def main():")
+        self.in_function = False
+        self.emit_block(0, self.program.main_size)
+        return "\n".join(self.lines) + "\n"
+
+    def generate_function(self, name, entry, end):
+        params = self.params[entry]
+        frame_size = self.code[entry][1]
+        self.lines.append(f"def f_{name}({', '.join(self.signature(params))}):")
+        self.prologue(entry, params)
+        others = [f"l{slot}" for slot in range(frame_size) if slot not in params]
+        if others:
+            self.lines.append(f"    {' = '.join(others)} = 0")
+        self.in_function = True
+        # chamadas de cauda a si mesma voltam ao início do corpo: o corpo
+        # vira um laço e esses saltos viram 'continue'
+        start = entry + 1 + len(params)
+        self.loop_start = None
+        if any(instr[0] == "JUMP" and instr[1] == start for instr in self.code[start:end]):
+            self.loop_start = start
+            self.lines.append("    while True:")
+            self.indent += 1
+        self.emit_block(start, end)
+        if self.loop_start is not None:
+            self.indent -= 1
+            self.loop_start = None
+
+    def signature(self, params):
+        return [f"l{slot}" for slot in params]
+
+    def prologue(self, entry, params):
+        pass
+
+    def call_expr(self, entry, call_args):
+        name = self.program.function_names[entry]
+        return f"f_{name}({', '.join(arg.expr for arg in call_args)})"
+
+    # -- pilha simbólica -------------------------------------------------
+
+    def new_temp(self):
+        name = f"_s{self.temp_count}"
+        self.temp_count += 1
+        return name
+
+    def emit(self, line, writes=frozenset(), impure=False):
+        # Antes de um comando, materializa valores pendentes que ele poderia
+        # alterar, para manter a ordem de avaliação da VM.
+        for i, value in enumerate(self.stack):
+            if not value.pure or (value.deps & writes) or (impure and value.deps):
+                temp = self.new_temp()
+                self.lines.append("    " * self.indent + f"{temp} = {value.expr}")
+                self.stack[i] = StackValue(temp, frozenset({temp}))
+        self.lines.append("    " * self.indent + line)
+
+    def push(self, expr, deps=frozenset(), pure=True):
+        self.stack.append(StackValue(expr, frozenset(deps), pure))
+
+    def pop(self):
+        if not self.stack:
+            raise AOTError("Pilha vazia durante a tradução")
+        return self.stack.pop()
+
+    def store(self, target, value):
+        writes = {"g"} if target.startswith("g[") else {target}
+        self.emit(f"{target} = {value.expr}", frozenset(writes), impure=not value.pure)
+
+    def operand(self, kind, value):
+        if kind == "L":
+            return StackValue(f"l{value}", frozenset({f"l{value}"}))
+        if kind == "G":
+            return StackValue(f"g[{value}]", frozenset({"g"}))
+        return StackValue(repr(value))
+
+    def target_name(self, kind, slot):
+        return f"l{slot}" if kind == "L" else f"g[{slot}]"
+
+    # -- fluxo de controle ----------------------------------------------
+
+    def condition_at(self, pc):
+        # Reconhece o início de um if: devolve (expressão, pc do then, pc do else).
+        instr = self.code[pc]
+        op = instr[0]
+        if op == "JMP_IF_TRUE":
+            cond, then_pc = None, instr[1]
+        elif op == "JMP_IF_TRUE_L":
+            cond, then_pc = self.operand("L", instr[2]), instr[1]
+        elif op == "JMP_IF_TRUE_G":
+            cond, then_pc = self.operand("G", instr[2]), instr[1]
+        else:
+            return None
+        following = self.code[pc + 1] if pc + 1 < len(self.code) else None
+        if then_pc != pc + 2 or following is None or following[0] != "JUMP":
+            raise AOTError(f"Desvio condicional fora do padrão de if em {pc}")
+        return cond, then_pc, following[1]
+
+    def emit_block(self, start, end):
+        # Região indentada; 'pass' quando ela não gera nenhum comando.
+        count = len(self.lines)
+        self.emit_region(start, end)
+        if len(self.lines) == count:
+            self.lines.append("    " * self.indent + "pass")
+
+    def emit_region(self, start, end):
+        pc = start
+        while pc < end:
+            shape = self.condition_at(pc)
+            if shape is None:
+                self.emit_instruction(pc)
+                pc += 1
+                continue
+
+            cond, then_pc, else_pc = shape
+            if cond is None:
+                cond = self.pop()
+            self.emit(f"if {cond.expr}:", impure=not cond.pure)
+
+            last = self.code[else_pc - 1]
+            if last[0] != "JUMP" or last[1] < else_pc:
+                raise AOTError(f"Bloco then sem salto para o fim em {else_pc - 1}")
+            end_pc = last[1]
+
+            self.indent += 1
+            self.emit_block(then_pc, else_pc - 1)
+            self.indent -= 1
+            if end_pc > else_pc:
+                self.lines.append("    " * self.indent + "else:")
+                self.indent += 1
+                self.emit_block(else_pc, end_pc)
+                self.indent -= 1
+            if self.stack:
+                raise AOTError("Valores na pilha atravessando um if")
+            pc = end_pc
+
+    def emit_instruction(self, pc):
+        instr = self.code[pc]
+        op, args = instr[0], instr[1:]
+
+        if op == "PUSH":
+            self.push(repr(args[0]))
+        elif op == "POP":
+            self.pop()
+        elif op == "LOAD_LOCAL":
+            self.push(f"l{args[0]}", {f"l{args[0]}"})
+        elif op == "LOAD_GLOBAL":
+            self.push(f"g[{args[0]}]", {"g"})
+        elif op == "STORE_LOCAL":
+            self.store(f"l{args[0]}", self.pop())
+        elif op == "STORE_GLOBAL":
+            self.store(f"g[{args[0]}]", self.pop())
+        elif op in ("ALLOC_LOCAL", "ALLOC_GLOBAL"):
+            value = StackValue(repr(args[1] if len(args) > 1 else 0))
+            self.store(self.target_name("L" if op == "ALLOC_LOCAL" else "G", args[0]), value)
+        elif op in BINARY_EXPRS:
+            b = self.pop()
+            a = self.pop()
+            self.push(BINARY_EXPRS[op].format(a=a.expr, b=b.expr), a.deps | b.deps, a.pure and b.pure)
+        elif op in FUSED_BINARY:
+            binop, kind_a, kind_b, kind_dst = FUSED_BINARY[op]
+            a = self.operand(kind_a, args[0])
+            b = self.operand(kind_b, args[1])
+            self.store(self.target_name(kind_dst, args[2]),
+                       StackValue(BINARY_EXPRS[binop].format(a=a.expr, b=b.expr), a.deps | b.deps))
+        elif op in ("MOVE_LL", "MOVE_GG"):
+            kind = op[-1]
+            self.store(self.target_name(kind, args[1]), self.operand(kind, args[0]))
+        elif op in ("SET_KL", "SET_KG"):
+            self.store(self.target_name(op[-1], args[1]), StackValue(repr(args[0])))
+        elif op == "NEW_ARRAY":
+            size = self.pop()
+            self.push(f"_new_array({args[0]!r}, {size.expr})", size.deps, size.pure)
+        elif op in ("LOAD_INDEX", "LOAD_INDEX_UNCHECKED"):
+            # o conteúdo do array muda sem que a variável mude: a leitura é
+            # materializada antes do próximo comando
+            index = self.pop()
+            values = self.pop()
+            if op == "LOAD_INDEX":
+                index = StackValue(f"_check({values.expr}, {index.expr})", index.deps, index.pure)
+            self.push(f"{values.expr}[{index.expr}]", values.deps | index.deps, pure=False)
+        elif op in ("STORE_INDEX", "STORE_INDEX_UNCHECKED"):
+            value = self.pop()
+            index = self.pop()
+            values = self.pop()
+            position = f"_check({values.expr}, {index.expr})" if op == "STORE_INDEX" else index.expr
+            self.emit(f"{values.expr}[{position}] = {value.expr}", impure=True)
+        elif op in BULK_OPCODES:
+            function, arity = BULK_OPCODES[op]
+            call_args = [self.pop() for _ in range(arity)][::-1]
+            deps = frozenset().union(*(arg.deps for arg in call_args))
+            self.push(f"_arrays.{function.__name__}({', '.join(arg.expr for arg in call_args)})", deps, pure=False)
+        elif op == "PRINT":
+            value = self.pop()
+            self.emit(f"_out({value.expr})", impure=True)
+        elif op == "CALL":
+            params = self.params[args[0]]
+            call_args = [self.pop() for _ in params][::-1]
+            deps = frozenset().union(*(arg.deps for arg in call_args))
+            self.push(self.call_expr(args[0], call_args), deps, pure=False)
+        elif op in ("RET", "RET_L"):
+            if not self.in_function:
+                raise AOTError("RET fora de função")
+            value = self.operand("L", args[0]) if op == "RET_L" else self.pop()
+            self.emit(f"return {value.expr}", impure=not value.pure)
+            self.stack.clear()
+        elif op == "HALT":
+            self.emit("raise Halt()" if self.in_function else "return", impure=True)
+            self.stack.clear()
+        elif op == "JUMP" and args[0] == self.loop_start:
+            if self.stack:
+                raise AOTError("Valores na pilha atravessando uma chamada de cauda")
+            self.emit("continue")
+        elif op == "JUMP":
+            # fora das chamadas de cauda, só aparece como salto para o fim de um if, já tratado em emit_region
+            raise AOTError(f"JUMP fora do padrão de if em {pc}")
+        elif op == "NOP":
+            pass
+        else:
+            raise AOTError(f"Opcode sem tradução: {op}")
+
+
+class FunctionTranslator(PythonCodeGenerator):
+    # Traduz uma única função para o JIT. Chamadas recursivas viram chamadas
+    # Python diretas; as demais passam por _call, que decide entre outra
+    # função já compilada e o interpretador. Funções memoizadas pela VM
+    # chamam a si mesmas por _call também, para consultar o cache.
+    #
+    # Cada função recebe _d, quantas ativações compiladas já estão na pilha
+    # do Python. Passando de _LIMIT, a chamada volta para o interpretador
+    # (_interp), cujos frames não gastam pilha do Python: uma recursão que a
+    # VM aguenta não vira RecursionError só porque a função ficou quente.
+
+    def __init__(self, program, memoized=frozenset()):
+        super().__init__(program)
+        self.memoized = memoized
+
+    def translate(self, entry):
+        for name, start, end in self.function_bounds():
+            if start == entry:
+                self.lines = [PRELUDE]
+                self.current_entry = entry
+                self.generate_function(name, start, end)
+                return name, "\n".join(self.lines) + "\n"
+        raise AOTError(f"Nenhuma função começa em {entry}")
+
+    def signature(self, params):
+        return super().signature(params) + ["_d"]
+
+    def prologue(self, entry, params):
+        args = "".join(f"l{slot}, " for slot in params)
+        self.lines.append(f"    if _d > _LIMIT:")
+        self.lines.append(f"        return _interp({entry}, ({args}), _d)")
+
+    def call_expr(self, entry, call_args):
+        args = [arg.expr for arg in call_args]
+        if entry == self.current_entry and entry not in self.memoized:
+            name = self.program.function_names[entry]
+            return f"f_{name}({', '.join(args + ['_d + 1'])})"
+        return f"_call({', '.join([str(entry), '_d'] + args)})"
+
+
+_compiled = weakref.WeakKeyDictionary()
+
+def compile_program(program):
+    # Traduz e compila uma única vez por programa ligado; as execuções
+    # seguintes reaproveitam o namespace com as funções já definidas.
+    namespace = _compiled.get(program)
+    if namespace is None:
+        source = PythonCodeGenerator(program).generate()
+        namespace = {"Halt": Halt, "__source__": source}
+        exec(compile(source, "<tothic-aot>", "exec"), namespace)
+        _compiled[program] = namespace
+    return namespace
+
+def run_compiled(program, sink=None):
+    sink = sink if sink is not None else StdoutSink()
+    namespace = compile_program(program)
+    namespace["g"] = [0] * program.global_size
+    namespace["_out"] = sink.write
+    old_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(old_limit, AOT_RECURSION_LIMIT))
+    try:
+        namespace["main"]()
+    except Halt:
+        pass
+    except RecursionError:
+        raise AOTError(f"Recursão mais funda que {AOT_RECURSION_LIMIT} chamadas: "
+                       "o motor python não passa desse limite, use o motor pilha") from None
+    finally:
+        sys.setrecursionlimit(old_limit)
+        sink.flush()
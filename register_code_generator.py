@@ -0,0 +1,252 @@
+from ast_tree import *
+from vm_code_generator import VMCodeGenerator
+from arrays import BULK_OPS
+
+BINARY_OPS = {
+    '+': "ADD",
+    '-': "SUB",
+    '*': "MUL",
+    '/': "DIV",
+    '==': "EQ",
+    '!=': "NEQ",
+    '<':  "LT",
+    '<=': "LE",
+    '>':  "GT",
+    '>=': "GE"
+}
+
+class RegisterProgram:
+    def __init__(self, code, functions, templates, global_template, main_size):
+        self.code = code                        # tuplas (op, dst, src1, src2)
+        self.functions = functions              # nome da função -> pc de entrada
+        self.templates = templates              # pc de entrada -> registradores iniciais
+        self.global_template = global_template  # registradores do main (globais + constantes)
+        self.main_size = main_size
+
+    def __repr__(self):
+        names = {pc: name for name, pc in self.functions.items()}
+        lines = [f"; registradores globais: {len(self.global_template)}"]
+        for pc, instr in enumerate(self.code):
+            if pc in names:
+                lines.append(f"{names[pc]}: ; {len(self.templates[pc])} registradores")
+            lines.append(f"{pc:5d}  {instr}")
+        return "\n".join(lines)
+
+
+class RegisterCodeGenerator(VMCodeGenerator):
+    # Reaproveita a resolução de nomes em slots do gerador da VM de pilha: o
+    # slot de cada variável vira o índice do seu registrador. Globais lidas ou
+    # escritas dentro de uma função passam por registradores de rascunho com
+    # GGET/GSET; constantes ficam em registradores pré-carregados do frame.
+
+    def __init__(self, tac_instructions, symbol_table):
+        super().__init__(tac_instructions, symbol_table)
+        self.segment = None
+
+    def new_segment(self):
+        return {"code": [], "scratch": 0, "consts": {}}
+
+    def constant(self, value):
+        consts = self.segment["consts"]
+        key = (type(value), value)
+        if key not in consts:
+            consts[key] = len(consts)
+        return ("k", consts[key])
+
+    def scratch(self):
+        index = self.segment["scratch"]
+        self.segment["scratch"] += 1
+        return ("s", index)
+
+    def source(self, operand):
+        if isinstance(operand, Literal):
+            return self.constant(operand.value)
+        if isinstance(operand, VarRef):
+            operand = operand.name
+        if isinstance(operand, str):
+            sym = self.symbol_table.VMlookup(operand)
+            if sym and sym.category == 'literal':
+                return self.constant(sym.value)
+        elif isinstance(operand, (int, float)):
+            return self.constant(operand)
+
+        area, slot = self.resolve(operand)
+        if area == "GLOBAL" and self.function_scope is not None:
+            reg = self.scratch()
+            self.emit("GGET", reg, slot)
+            return reg
+        return ("r", slot)
+
+    def target(self, name):
+        # Devolve o registrador de destino e, para globais vistas de dentro
+        # de uma função, a instrução que grava o resultado de volta.
+        area, slot = self.resolve(name)
+        if area == "GLOBAL" and self.function_scope is not None:
+            reg = self.scratch()
+            return reg, ("GSET", slot, reg, None)
+        return ("r", slot), None
+
+    def emit(self, op, dst=None, src1=None, src2=None):
+        self.segment["code"].append((op, dst, src1, src2))
+
+    def emit_to(self, name, op, src1=None, src2=None):
+        dst, writeback = self.target(name)
+        self.emit(op, dst, src1, src2)
+        if writeback:
+            self.segment["code"].append(writeback)
+
+    def finish_segment(self, frame_size):
+        # Troca os registradores simbólicos por índices reais:
+        # [slots do frame | rascunho | constantes].
+        segment = self.segment
+        scratch_base = frame_size
+        const_base = scratch_base + segment["scratch"]
+
+        def reg(operand):
+            if isinstance(operand, tuple) and len(operand) == 2 and operand[0] in ("r", "s", "k"):
+                kind, index = operand
+                if kind == "r":
+                    return index
+                if kind == "s":
+                    return scratch_base + index
+                return const_base + index
+            if isinstance(operand, tuple):
+                return tuple(reg(item) for item in operand)
+            return operand
+
+        code = [(op, reg(dst), reg(src1), reg(src2)) for op, dst, src1, src2 in segment["code"]]
+        template = [0] * const_base
+        for (_, value), index in sorted(segment["consts"].items(), key=lambda item: item[1]):
+            template.append(value)
+        return code, template
+
+    def generate(self):
+        main = self.new_segment()
+        self.segment = main
+        functions = []
+        pending_args = []
+
+        for instr in self.tac:
+            op = instr.op
+
+            if op == 'namespace':
+                self.namespace_scope = self.symbol_table.child(instr.result)
+
+            elif op == 'func':
+                self.function_scope = (self.namespace_scope or self.symbol_table).child(instr.result)
+                self.local_temps = {}
+                self.segment = self.new_segment()
+                self.segment["name"] = instr.result
+
+            elif op == 'endfunc':
+                self.emit("RET", None, self.constant(0))
+                frame_size = self.function_scope.slot_count + len(self.local_temps)
+                functions.append((self.segment["name"], self.finish_segment(frame_size)))
+                self.segment = main
+                self.function_scope = None
+
+            elif op == 'param':
+                # parâmetros ocupam os primeiros slots do frame, na ordem da declaração
+                pass
+
+            elif op == 'label':
+                self.emit("LABEL", instr.result)
+
+            elif op == 'arg':
+                pending_args.append(self.source(instr.arg1))
+
+            elif op == 'call':
+                args = tuple(pending_args)
+                pending_args.clear()
+                self.emit_to(instr.result, "CALL", instr.arg1, args)
+
+            elif op == 'builtin':
+                args = tuple(pending_args)
+                pending_args.clear()
+                self.emit_to(instr.result, "BULK", BULK_OPS[instr.arg1][0], args)
+
+            elif op == 'PRINT':
+                for arg in pending_args:
+                    self.emit("PRINT", None, arg)
+                pending_args.clear()
+
+            elif op == 'HALT':
+                self.emit("HALT")
+
+            elif op == 'ret':
+                self.emit("RET", None, self.source(instr.arg1) if instr.arg1 is not None else self.constant(0))
+
+            elif op == '=':
+                self.emit_to(instr.result, "MOVE", self.source(instr.arg1))
+
+            elif op in BINARY_OPS:
+                a = self.source(instr.arg1)
+                b = self.source(instr.arg2)
+                self.emit_to(instr.result, BINARY_OPS[op], a, b)
+
+            elif op == 'alloc':
+                self.emit_to(instr.result, "MOVE", self.constant(0))
+
+            elif op == 'alloc_array':
+                self.emit_to(instr.result, "NEW_ARRAY", self.source(instr.arg1), instr.arg2)
+
+            elif op in ('load', 'load_unchecked'):
+                values = self.source(instr.arg1)
+                index = self.source(instr.arg2)
+                self.emit_to(instr.result, "LOAD_INDEX" if op == 'load' else "LOAD_INDEX_UNCHECKED", values, index)
+
+            elif op in ('store', 'store_unchecked'):
+                # o destino é o próprio array: o elemento muda dentro dele
+                values = self.source(instr.result)
+                index = self.source(instr.arg2)
+                value = self.source(instr.arg1)
+                self.emit("STORE_INDEX" if op == 'store' else "STORE_INDEX_UNCHECKED", values, index, value)
+
+            elif op == 'goto':
+                self.emit("JUMP", instr.result)
+
+            elif op == 'ifz':
+                self.emit("JUMPZ", instr.result, self.source(instr.arg1))
+
+            else:
+                self.emit("NOP", None, str(instr))
+
+        self.emit("HALT")
+        global_size = self.symbol_table.frame.slot_count + len(self.global_temps)
+        main_code, global_template = self.finish_segment(global_size)
+        return self.link(main_code, global_template, functions)
+
+    def link(self, main_code, global_template, functions):
+        segments = [(None, main_code)] + [(name, code) for name, (code, _) in functions]
+        labels = {}
+        entries = {}
+        templates = {}
+        pc = 0
+        main_size = None
+        for name, code in segments:
+            if name is not None:
+                if main_size is None:
+                    main_size = pc
+                entries[name] = pc
+            for instr in code:
+                if instr[0] == "LABEL":
+                    labels[instr[1]] = pc
+                else:
+                    pc += 1
+        if main_size is None:
+            main_size = pc
+        for name, (_, template) in functions:
+            templates[entries[name]] = template
+
+        linked = []
+        for _, code in segments:
+            for op, dst, src1, src2 in code:
+                if op == "LABEL":
+                    continue
+                if op in ("JUMP", "JUMPZ"):
+                    dst = labels[dst]
+                elif op == "CALL":
+                    src1 = entries[src1]
+                linked.append((op, dst, src1, src2))
+
+        return RegisterProgram(linked, entries, templates, global_template, main_size)
@@ -0,0 +1,153 @@
+from arrays import new_array, check_index, BULK_OPCODES
+from output import StdoutSink
+
+class RegisterVM:
+    # Executa tuplas (op, dst, src1, src2) sobre um banco de registradores.
+    # O main usa o banco global; cada chamada ganha uma cópia do modelo de
+    # registradores da função (locais zerados + constantes).
+
+    def __init__(self, sink=None):
+        self.sink = sink if sink is not None else StdoutSink()
+        self.regs = []
+        self.globals = []
+        self.program = None
+        self.pc = 0
+        self.call_stack = []
+        self.running = True
+        self.steps = 0
+
+    def run(self, program):
+        self.program = program
+        self.globals = list(program.global_template)
+        self.regs = self.globals
+        self.call_stack = []
+        self.pc = 0
+        self.running = True
+        try:
+            self.run_decoded(self.decode(program.code))
+        finally:
+            self.sink.flush()
+
+    def decode(self, code):
+        return [(getattr(self, f"op_{op}"), dst, src1, src2) for op, dst, src1, src2 in code]
+
+    def run_decoded(self, code):
+        steps = 0
+        end = len(code)
+        while self.running and self.pc < end:
+            handler, dst, src1, src2 = code[self.pc]
+            handler(dst, src1, src2)
+            self.pc += 1
+            steps += 1
+        self.steps = steps
+
+    def op_NOP(self, dst, src1, src2):
+        pass
+
+    def op_HALT(self, dst, src1, src2):
+        self.running = False
+        self.sink.flush()
+
+    def op_MOVE(self, dst, src1, src2):
+        regs = self.regs
+        regs[dst] = regs[src1]
+
+    def op_GGET(self, dst, src1, src2):
+        self.regs[dst] = self.globals[src1]
+
+    def op_GSET(self, dst, src1, src2):
+        self.globals[dst] = self.regs[src1]
+
+    def op_ADD(self, dst, src1, src2):
+        regs = self.regs
+        regs[dst] = regs[src1] + regs[src2]
+
+    def op_SUB(self, dst, src1, src2):
+        regs = self.regs
+        regs[dst] = regs[src1] - regs[src2]
+
+    def op_MUL(self, dst, src1, src2):
+        regs = self.regs
+        regs[dst] = regs[src1] * regs[src2]
+
+    def op_DIV(self, dst, src1, src2):
+        regs = self.regs
+        a, b = regs[src1], regs[src2]
+        regs[dst] = a // b if isinstance(a, int) and isinstance(b, int) else a / b
+
+    def op_EQ(self, dst, src1, src2):
+        regs = self.regs
+        regs[dst] = 1 if regs[src1] == regs[src2] else 0
+
+    def op_NEQ(self, dst, src1, src2):
+        regs = self.regs
+        regs[dst] = 1 if regs[src1] != regs[src2] else 0
+
+    def op_LT(self, dst, src1, src2):
+        regs = self.regs
+        regs[dst] = 1 if regs[src1] < regs[src2] else 0
+
+    def op_LE(self, dst, src1, src2):
+        regs = self.regs
+        regs[dst] = 1 if regs[src1] <= regs[src2] else 0
+
+    def op_GT(self, dst, src1, src2):
+        regs = self.regs
+        regs[dst] = 1 if regs[src1] > regs[src2] else 0
+
+    def op_GE(self, dst, src1, src2):
+        regs = self.regs
+        regs[dst] = 1 if regs[src1] >= regs[src2] else 0
+
+    def op_NEW_ARRAY(self, dst, src1, src2):
+        regs = self.regs
+        regs[dst] = new_array(src2, regs[src1])
+
+    def op_LOAD_INDEX(self, dst, src1, src2):
+        regs = self.regs
+        values = regs[src1]
+        regs[dst] = values[check_index(values, regs[src2])]
+
+    def op_LOAD_INDEX_UNCHECKED(self, dst, src1, src2):
+        regs = self.regs
+        regs[dst] = regs[src1][regs[src2]]
+
+    def op_STORE_INDEX(self, dst, src1, src2):
+        regs = self.regs
+        values = regs[dst]
+        values[check_index(values, regs[src1])] = regs[src2]
+
+    def op_STORE_INDEX_UNCHECKED(self, dst, src1, src2):
+        regs = self.regs
+        regs[dst][regs[src1]] = regs[src2]
+
+    def op_BULK(self, dst, src1, src2):
+        # src1 é o opcode da operação em lote, src2 os registradores dos argumentos
+        regs = self.regs
+        regs[dst] = BULK_OPCODES[src1][0](*[regs[reg] for reg in src2])
+
+    def op_PRINT(self, dst, src1, src2):
+        self.sink.write(self.regs[src1])
+
+    def op_JUMP(self, dst, src1, src2):
+        self.pc = dst - 1
+
+    def op_JUMPZ(self, dst, src1, src2):
+        if not self.regs[src1]:
+            self.pc = dst - 1
+
+    def op_CALL(self, dst, src1, src2):
+        caller = self.regs
+        callee = list(self.program.templates[src1])
+        for index, reg in enumerate(src2):
+            callee[index] = caller[reg]
+        self.call_stack.append((self.pc, caller, dst))
+        self.regs = callee
+        self.pc = src1 - 1
+
+    def op_RET(self, dst, src1, src2):
+        if not self.call_stack:
+            raise RuntimeError("RET called without active CALL")
+        value = self.regs[src1]
+        self.pc, self.regs, result = self.call_stack.pop()
+        self.regs[result] = value
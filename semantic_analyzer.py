@@ -1,6 +1,20 @@
 from semantic_error import *
 from symbol_table import *
 from ast_tree import *
+from arrays import BULK_OPS
+
+# Assinaturas das funções embutidas sobre arrays: "[]" aceita um array e
+# "elem" um valor do tipo de elemento dos arrays da mesma chamada.
+BULK_SIGNATURES = {
+    "fill": (["[]", "elem"], "void"),
+    "copy": (["[]", "[]"], "void"),
+    "sum":  (["[]"], "elem"),
+    "min":  (["[]"], "elem"),
+    "max":  (["[]"], "elem"),
+    "dot":  (["[]", "[]"], "elem"),
+    "add":  (["[]", "[]", "[]"], "void"),
+    "mul":  (["[]", "[]", "[]"], "void"),
+}
 
 class SemanticAnalyzer:
     def __init__(self):
@@ -21,7 +35,19 @@ class SemanticAnalyzer:
             params=[],
             return_type="void"
         )
+        for name, (params, return_type) in BULK_SIGNATURES.items():
+            self.global_scope.symbols[name] = Symbol(
+                name=BULK_OPS[name][0],
+                typ="func",
+                scope=self.global_scope.scope_name,
+                params=[(f"arg{i}", param_type) for i, param_type in enumerate(params)],
+                return_type=return_type,
+                category="builtin"
+            )
         self.current_scope = self.global_scope
+        # Efeitos observados por função: símbolo -> (tem efeito próprio, funções chamadas)
+        self.function_effects = {}
+        self.current_function = None
 
     def visit(self, node):
         method = 'visit_' + node.__class__.__name__
@@ -34,6 +60,35 @@ class SemanticAnalyzer:
     def visit_Program(self, node):
         for stmt in node.statements:
             self.visit(stmt)
+        self.mark_pure_functions()
+
+    def mark_pure_functions(self):
+        # Pura: sem print/halt, sem ler ou escrever variáveis de fora e só
+        # chamando funções puras. Parte de "todas puras" e derruba até
+        # estabilizar, para que recursões (diretas ou mútuas) continuem puras.
+        pure = {symbol for symbol, (effect, _) in self.function_effects.items() if not effect}
+        changed = True
+        while changed:
+            changed = False
+            for symbol in list(pure):
+                if not self.function_effects[symbol][1] <= pure:
+                    pure.discard(symbol)
+                    changed = True
+        for symbol in self.function_effects:
+            symbol.pure = symbol in pure
+
+    def mark_effect(self):
+        if self.current_function is not None:
+            self.function_effects[self.current_function][0] = True
+
+    def check_outer_access(self, name):
+        # Variáveis fora do registro de ativação da função atual são estado
+        # compartilhado: acessá-las impede a memoização.
+        if self.current_function is None:
+            return
+        symbol = self.current_scope.VMlookup(name)
+        if symbol is not None and symbol.category == "var" and name not in self.current_scope.symbols:
+            self.mark_effect()
 
     def visit_NamespaceDecl(self, node):
         new_scope = SymbolTable(parent=self.current_scope, scope_name=node.name)
@@ -47,24 +102,31 @@ class SemanticAnalyzer:
         self.current_scope.insert(node.name, node.type)
 
     def visit_FunctionDecl(self, node):
-        self.current_scope.symbols[node.name] = Symbol(
+        if node.name in BULK_SIGNATURES:
+            raise SemanticError(f"'{node.name}' é uma função embutida e não pode ser redefinida")
+        symbol = Symbol(
             name=node.name,
             typ="func",
             scope=self.current_scope.scope_name,
             params=node.params,
             return_type=node.return_type
         )
-        func_scope = SymbolTable(parent=self.current_scope, scope_name=node.name)
+        self.current_scope.symbols[node.name] = symbol
+        self.function_effects[symbol] = [False, set()]
+        func_scope = SymbolTable(parent=self.current_scope, scope_name=node.name, owns_frame=True)
         for param_name, param_type in node.params:
             func_scope.insert(param_name, param_type)
-        old_scope = self.current_scope
-        self.current_scope = func_scope
+        old_scope, old_function = self.current_scope, self.current_function
+        self.current_scope, self.current_function = func_scope, symbol
         self.visit(node.body)
-        self.current_scope = old_scope
+        self.current_scope, self.current_function = old_scope, old_function
 
     def visit_ArrayDecl(self, node):
-        self.visit(node.size)
-        self.current_scope.insert(node.name, f"{node.type}[]")
+        if self.visit(node.size) != "int":
+            raise SemanticError(f"O tamanho do array '{node.name}' deve ser do tipo 'int'")
+        # tamanho constante fica no símbolo para conferir comprimentos nas embutidas
+        size = node.size.value if isinstance(node.size, Literal) else None
+        self.current_scope.insert(node.name, f"{node.type}[]", value=size)
 
     def visit_AutoDecl(self, node):
         expr_type = self.visit(node.expr)
@@ -76,6 +138,7 @@ class SemanticAnalyzer:
     def visit_Assign(self, node):
         if isinstance(node.name, ArrayAccess):
             array_symbol = self.current_scope.lookup(node.name.name)
+            self.check_outer_access(node.name.name)
             if not array_symbol.type.endswith("[]"):
                 raise SemanticError(f"'{node.name.name}' não é um array")
             element_type = array_symbol.type[:-2]
@@ -87,6 +150,7 @@ class SemanticAnalyzer:
                 raise SemanticError(f"Tipo incompatível na atribuição ao array: esperado {element_type}, encontrado {expr_type}")
         else:
             var = self.current_scope.lookup(node.name.name)
+            self.check_outer_access(node.name.name)
             expr_type = self.visit(node.expr)
             if var.type != expr_type:
                 raise SemanticError(f"Incompatibilidade de tipos: variável '{node.name}' é '{var.type}', mas expressão é '{expr_type}'")
@@ -121,17 +185,21 @@ class SemanticAnalyzer:
 
     def visit_VarRef(self, node):
         symbol = self.current_scope.lookup(node.name)
+        self.check_outer_access(node.name)
         return symbol.type
 
     def visit_ArrayAccess(self, node):
         symbol = self.current_scope.lookup(node.name)
+        self.check_outer_access(node.name)
         if not symbol.type.endswith("[]"):
             raise SemanticError(f"'{node.name}' não é um array")
-        self.visit(node.index)
+        if self.visit(node.index) != "int":
+            raise SemanticError("O índice do array deve ser do tipo 'int'")
         return symbol.type[:-2]
 
     def visit_QualifiedRef(self, node):
         # Simulação simplificada — assume símbolo como válido
+        self.mark_effect()  # estado de outro namespace
         return "float"  # Ex: math.pi
 
     def visit_Literal(self, node):
@@ -146,6 +214,10 @@ class SemanticAnalyzer:
         symbol = self.current_scope.lookup(node.name)
         if symbol.type != "func":
             raise SemanticError(f"'{node.name}' não é uma função")
+        if symbol.category == "builtin":
+            return self.check_bulk_call(node, symbol)
+        if self.current_function is not None:
+            self.function_effects[self.current_function][1].add(symbol)
         if len(symbol.params) != len(node.args):
             raise SemanticError(f"Função '{node.name}' espera {len(symbol.params)} argumentos, mas recebeu {len(node.args)}")
         for (arg_expr, (param_name, param_type)) in zip(node.args, symbol.params):
@@ -154,14 +226,44 @@ class SemanticAnalyzer:
                 raise SemanticError(f"Tipo do argumento '{param_name}' deve ser '{param_type}', mas foi '{arg_type}'")
         return symbol.return_type 
 
+    def check_bulk_call(self, node, symbol):
+        if len(symbol.params) != len(node.args):
+            raise SemanticError(f"Função '{node.name}' espera {len(symbol.params)} argumentos, mas recebeu {len(node.args)}")
+        arg_types = [self.visit(arg) for arg in node.args]
+        array_types = []
+        sizes = []
+        for arg, arg_type, (_, param_type) in zip(node.args, arg_types, symbol.params):
+            if param_type != "[]":
+                continue
+            if not arg_type.endswith("[]"):
+                raise SemanticError(f"Argumento de '{node.name}' deve ser um array, mas foi '{arg_type}'")
+            array_types.append(arg_type)
+            if isinstance(arg, VarRef):
+                sizes.append(self.current_scope.lookup(arg.name).value)
+
+        element_type = array_types[0][:-2]
+        if any(array_type != array_types[0] for array_type in array_types):
+            raise SemanticError(f"Arrays de tipos diferentes em '{node.name}': {', '.join(array_types)}")
+        if node.name not in {"fill", "copy"} and element_type not in {"int", "float"}:
+            raise SemanticError(f"Função '{node.name}' requer arrays 'int' ou 'float', mas obtido '{array_types[0]}'")
+        for arg_type, (_, param_type) in zip(arg_types, symbol.params):
+            if param_type == "elem" and arg_type != element_type:
+                raise SemanticError(f"Valor de '{node.name}' deve ser '{element_type}', mas foi '{arg_type}'")
+        known = {size for size in sizes if size is not None}
+        if len(known) > 1:
+            raise SemanticError(f"Arrays de tamanhos diferentes em '{node.name}': {', '.join(map(str, sorted(known)))}")
+        return element_type if symbol.return_type == "elem" else "void"
+
     def visit_Print(self, node):
         symbol = self.current_scope.lookup(node.name)
+        self.mark_effect()
         if len(symbol.params) != len(node.args):
             raise SemanticError(f"Função '{node.name}' espera {len(symbol.params)} argumentos, mas recebeu {len(node.args)}")
         return symbol.return_type 
 
     def visit_Halt(self, node):
         symbol = self.current_scope.lookup(node.name)
+        self.mark_effect()
         return symbol.return_type       
 
     def visit_Return(self, node):
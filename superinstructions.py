@@ -0,0 +1,119 @@
+import glob
+import io
+from collections import Counter
+from contextlib import redirect_stdout
+
+from VM import VirtualMachine
+
+# Conjunto fundido, escolhido a partir das contagens de n-gramas medidas com
+# `python superinstructions.py` sobre os exemplos e os programas gerados do
+# benchmark. Mudar o conjunto exige incrementar a versão: ela identifica o
+# formato do código fundido para quem guarda programas já compilados.
+SUPERINSTRUCTIONS_VERSION = 1
+
+# padrão de opcodes -> (superinstrução, ordem dos operandos concatenados)
+SUPERINSTRUCTIONS = {
+    ("LOAD_LOCAL", "LOAD_LOCAL", "ADD", "STORE_LOCAL"): ("ADD_LLL", None),
+    ("LOAD_LOCAL", "LOAD_LOCAL", "SUB", "STORE_LOCAL"): ("SUB_LLL", None),
+    ("LOAD_LOCAL", "LOAD_LOCAL", "MUL", "STORE_LOCAL"): ("MUL_LLL", None),
+    ("LOAD_LOCAL", "PUSH", "ADD", "STORE_LOCAL"): ("ADD_LKL", None),
+    ("LOAD_LOCAL", "PUSH", "SUB", "STORE_LOCAL"): ("SUB_LKL", None),
+    ("LOAD_LOCAL", "PUSH", "EQ", "STORE_LOCAL"): ("EQ_LKL", None),
+    ("LOAD_LOCAL", "PUSH", "NEQ", "STORE_LOCAL"): ("NEQ_LKL", None),
+    ("LOAD_LOCAL", "PUSH", "LT", "STORE_LOCAL"): ("LT_LKL", None),
+    ("LOAD_LOCAL", "PUSH", "GT", "STORE_LOCAL"): ("GT_LKL", None),
+    ("LOAD_GLOBAL", "LOAD_GLOBAL", "ADD", "STORE_GLOBAL"): ("ADD_GGG", None),
+    ("LOAD_GLOBAL", "LOAD_GLOBAL", "SUB", "STORE_GLOBAL"): ("SUB_GGG", None),
+    ("LOAD_GLOBAL", "LOAD_GLOBAL", "MUL", "STORE_GLOBAL"): ("MUL_GGG", None),
+    ("LOAD_GLOBAL", "PUSH", "ADD", "STORE_GLOBAL"): ("ADD_GKG", None),
+    ("LOAD_GLOBAL", "PUSH", "SUB", "STORE_GLOBAL"): ("SUB_GKG", None),
+    ("LOAD_GLOBAL", "PUSH", "MUL", "STORE_GLOBAL"): ("MUL_GKG", None),
+    ("LOAD_LOCAL", "STORE_LOCAL"): ("MOVE_LL", None),
+    ("LOAD_GLOBAL", "STORE_GLOBAL"): ("MOVE_GG", None),
+    ("PUSH", "STORE_LOCAL"): ("SET_KL", None),
+    ("PUSH", "STORE_GLOBAL"): ("SET_KG", None),
+    ("LOAD_LOCAL", "JMP_IF_TRUE"): ("JMP_IF_TRUE_L", (1, 0)),
+    ("LOAD_GLOBAL", "JMP_IF_TRUE"): ("JMP_IF_TRUE_G", (1, 0)),
+    ("LOAD_LOCAL", "RET"): ("RET_L", None),
+}
+
+
+def fuse(vm_code, table=SUPERINSTRUCTIONS):
+    # Roda antes do linker: os pseudo-ops LABEL/FUNCTION ainda estão no
+    # código, então nenhuma fusão engole o alvo de um desvio.
+    lengths = sorted({len(pattern) for pattern in table}, reverse=True)
+    fused = []
+    i = 0
+    while i < len(vm_code):
+        for length in lengths:
+            window = vm_code[i:i + length]
+            key = tuple(instr[0] for instr in window)
+            if key in table:
+                name, order = table[key]
+                operands = [arg for instr in window for arg in instr[1:]]
+                if order:
+                    operands = [operands[j] for j in order]
+                fused.append((name, *operands))
+                i += length
+                break
+        else:
+            fused.append(vm_code[i])
+            i += 1
+    return fused
+
+
+class NGramProfiler(VirtualMachine):
+    # Conta sequências de opcodes executadas em linha reta. Um desvio tomado
+    # quebra a janela, porque só instruções vizinhas podem ser fundidas.
+
+    def __init__(self, max_n=4):
+        super().__init__()
+        self.max_n = max_n
+        self.ngrams = Counter()
+
+    def run_decoded(self, code):
+        ops = [instr[0] for instr in self.instructions]
+        window = []
+        steps = 0
+        end = len(code)
+        while self.running and self.pc < end:
+            pc = self.pc
+            handler, args = code[pc]
+            window.append(ops[pc])
+            if len(window) > self.max_n:
+                window.pop(0)
+            for n in range(2, len(window) + 1):
+                self.ngrams[tuple(window[-n:])] += 1
+            handler(*args)
+            if self.pc != pc:
+                window = []
+            self.pc += 1
+            steps += 1
+        self.steps = steps
+
+
+def profile_ngrams(programs, max_n=4):
+    counts = Counter()
+    for program in programs:
+        vm = NGramProfiler(max_n)
+        with redirect_stdout(io.StringIO()):
+            vm.run(program)
+        counts.update(vm.ngrams)
+    return counts
+
+
+if __name__ == "__main__":
+    from benchmark import build_program, generate_arithmetic, generate_recursive
+
+    corpus = []
+    for path in sorted(glob.glob("exemplos/*.tot")):
+        with open(path, "r", encoding="utf-8") as f:
+            corpus.append(f.read())
+    corpus.append(generate_arithmetic(500))
+    corpus.append(generate_recursive(100, 10))
+
+    counts = profile_ngrams([build_program(source) for source in corpus])
+    print(f"Conjunto atual: versão {SUPERINSTRUCTIONS_VERSION}\n")
+    for ngram, count in counts.most_common(30):
+        fused = SUPERINSTRUCTIONS.get(ngram, ("", None))[0]
+        print(f"{count:>8}  {' '.join(ngram):<52}{fused}")
@@ -1,7 +1,7 @@
 from semantic_error import *
 
 class Symbol:
-    def __init__(self, name, typ, scope, params=None, return_type=None, category="var", value=None):
+    def __init__(self, name, typ, scope, params=None, return_type=None, category="var", value=None, slot=None, pure=False):
         self.name = name
         self.type = typ
         self.scope = scope
@@ -9,25 +9,42 @@ class Symbol:
         self.return_type = return_type
         self.category = category
         self.value = value
+        self.slot = slot
+        self.pure = pure        # função sem efeitos: o resultado só depende dos argumentos
 
     def __repr__(self):
         if self.type == "func":
             sig = ", ".join(f"{n}:{t}" for n, t in self.params)
             return f"{self.name}({sig}) -> {self.return_type} [{self.scope}]"
         
+        if self.slot is not None:
+            return f"{self.name}:{self.type} ({self.scope}) ({self.category}) [slot {self.slot}]"
         return f"{self.name}:{self.type} ({self.scope}) ({self.category})"
 
 class SymbolTable:
-    def __init__(self, parent=None, scope_name="global"):
+    def __init__(self, parent=None, scope_name="global", owns_frame=False):
         self.symbols = {}
         self.parent = parent
         self.scope_name = scope_name
         self.literal_count = 0
+        self.children = []
+        if parent:
+            parent.children.append(self)
+        # Escopos de função têm registro de ativação próprio; namespaces
+        # dividem a área global. Variáveis recebem slots densos do seu frame.
+        self.frame = self if owns_frame or parent is None else parent.frame
+        self.slot_count = 0
 
     def insert(self, name, typ, category = "var", value = None):
         if name in self.symbols:
             raise SemanticError(f"Identificador '{name}' já declarado no escopo '{self.scope_name}'")
-        self.symbols[name] = Symbol(name, typ, self.scope_name, None, None, category, value)
+        slot = self.frame.allocate_slot() if category == "var" else None
+        self.symbols[name] = Symbol(name, typ, self.scope_name, None, None, category, value, slot)
+
+    def allocate_slot(self):
+        slot = self.slot_count
+        self.slot_count += 1
+        return slot
 
     def lookup(self, name):
         if name in self.symbols:
@@ -43,6 +60,14 @@ class SymbolTable:
         elif self.parent:
             return self.parent.VMlookup(name)
     
+    def child(self, scope_name):
+        # Só os filhos diretos: uma função pode ter o nome do próprio
+        # namespace, e uma busca na árvore inteira acharia o namespace
+        for child in self.children:
+            if child.scope_name == scope_name:
+                return child
+        return None
+
     def register_literal(self, node):
         for sym in self.symbols.values():
             if sym.category == 'literal' and sym.value == node.value:
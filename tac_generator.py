@@ -1,5 +1,6 @@
 from ast_tree import *
 from tac_instruction import *
+from arrays import BULK_OPS
 
 class TempVar:
     def __init__(self):
@@ -11,15 +12,29 @@ class TempVar:
         return name
 
 class TACGenerator:
-    def __init__(self, symbol_table):
+    def __init__(self, symbol_table, lazy=False):
         self.instructions = []
         self.temps = TempVar()
         self.symbol_table = symbol_table; 
+        self.current_function = None
+        self.function_start = None
+        # Modo preguiçoso: o corpo das funções só vira TAC quando
+        # function_tac() é chamado, na primeira chamada feita pela VM
+        self.lazy = lazy
+        self.deferred = {}
+        self.namespace = None
 
     def visit(self, node):
         method = 'visit_' + node.__class__.__name__
         visitor = getattr(self, method, self.generic_visit)
-        return visitor(node)
+        start = len(self.instructions)
+        result = visitor(node)
+        # comandos internos já marcaram as suas; o resto fica com a linha deste
+        if node.line is not None:
+            for instr in self.instructions[start:]:
+                if instr.line is None:
+                    instr.line = node.line
+        return result
 
     def generic_visit(self, node):
         raise Exception(f"Nenhum visitador TAC definido para {node.__class__.__name__}")
@@ -32,12 +47,38 @@ class TACGenerator:
     def visit_Decl(self, node):
         self.instructions.append(TACInstruction("alloc", 1, None, node.name))
 
+    def function_tac(self, name):
+        # TAC de uma função adiada; rótulos e temporários continuam únicos
+        # porque o contador é o mesmo do resto do programa
+        namespace, node = self.deferred.pop(name)
+        outer, self.instructions = self.instructions, []
+        self.lazy = False
+        try:
+            # o gerador de código acha o escopo da função dentro do namespace
+            self.instructions.append(TACInstruction("namespace", None, None, namespace))
+            self.visit(node)
+            return self.instructions
+        finally:
+            self.instructions = outer
+            self.lazy = True
+
     def visit_FunctionDecl(self, node):
-        self.instructions.append(TACInstruction("label", None, None, node.name))
+        if self.lazy:
+            self.deferred[node.name] = (self.namespace, node)
+            return
+        self.instructions.append(TACInstruction("func", None, None, node.name))
         for param_name, _ in node.params:
             # assume que cada parâmetro já está em uma variável correspondente
             self.instructions.append(TACInstruction("param", None, None, param_name))
+        # rótulo depois dos parâmetros: destino das chamadas de cauda a si mesma
+        outer = self.current_function, self.function_start
+        self.current_function = node
+        self.function_start = f"L{self.temps.new_temp()}"
+        self.instructions.append(TACInstruction("label", None, None, self.function_start))
         self.visit(node.body)
+        self.current_function, self.function_start = outer
+        # marca o fim do corpo para o gerador de código separar função e main
+        self.instructions.append(TACInstruction("endfunc", None, None, node.name))
 
     def visit_AutoDecl(self, node):
         self.instructions.append(TACInstruction("alloc", 1, None, node.name))  # string
@@ -45,12 +86,14 @@ class TACGenerator:
         self.instructions.append(TACInstruction("=", value, None, node.name))
 
     def visit_NamespaceDecl(self, node):
+        self.instructions.append(TACInstruction("namespace", None, None, node.name))
+        self.namespace = node.name
         for decl in node.declarations:
             self.visit(decl)
 
     def visit_ArrayDecl(self, node):
         size = self.visit(node.size)
-        self.instructions.append(TACInstruction("alloc", size, None, node.name))
+        self.instructions.append(TACInstruction("alloc_array", size, node.type, node.name))
 
     def visit_ArrayAccess(self, node):
         index = self.visit(node.index)
@@ -102,9 +145,9 @@ class TACGenerator:
         return f"{node.namespace}.{node.name}"
 
     def visit_Literal(self, node):
-        # label = self.symbol_table.register_literal(node)
-        # self.instructions.append(TACInstruction("alloc", None, None, label))     
-        # self.instructions.append(TACInstruction('literal_init', node.value, None, label))  
+        # strings viram o rótulo do literal para não serem confundidas com nomes de variáveis
+        if node.type == "string":
+            return self.symbol_table.register_literal(node)
         return node.value
 
     def visit_TypeCast(self, node):
@@ -124,7 +167,9 @@ class TACGenerator:
                 self.instructions.append(TACInstruction("arg", temp))
 
         temp = self.temps.new_temp()
-        self.instructions.append(TACInstruction("call", node.name, len(node.args), temp))
+        # funções embutidas sobre arrays viram uma única operação em lote
+        op = "builtin" if node.name in BULK_OPS else "call"
+        self.instructions.append(TACInstruction(op, node.name, len(node.args), temp))
         return temp
     
     def visit_Print(self, node):
@@ -143,7 +188,32 @@ class TACGenerator:
         self.instructions.append(TACInstruction("HALT"))
             
     
+    def is_self_tail_call(self, expr):
+        function = self.current_function
+        return (isinstance(expr, Call) and function is not None
+                and expr.name == function.name and len(expr.args) == len(function.params))
+
+    def visit_TailCall(self, node):
+        # return f(...) dentro da própria f: reatribui os parâmetros e volta
+        # ao início do corpo, sem empilhar um novo registro de ativação.
+        # Todos os argumentos são avaliados antes da primeira reatribuição,
+        # porque um argumento pode ler um parâmetro que muda antes dele.
+        values = []
+        for arg in node.args:
+            value = self.visit(arg)
+            if isinstance(arg, VarRef):
+                temp = self.temps.new_temp()
+                self.instructions.append(TACInstruction("=", value, None, temp))
+                value = temp
+            values.append(value)
+        for (param_name, _), value in zip(self.current_function.params, values):
+            self.instructions.append(TACInstruction("=", value, None, param_name))
+        self.instructions.append(TACInstruction("goto", None, None, self.function_start))
+
     def visit_Return(self, node):
+        if self.is_self_tail_call(node.expr):
+            self.visit_TailCall(node.expr)
+            return
         value = self.visit(node.expr)
         self.instructions.append(TACInstruction("ret", value))
 
@@ -1,9 +1,10 @@
 class TACInstruction:
-    def __init__(self, op, arg1=None, arg2=None, result=None):
+    def __init__(self, op, arg1=None, arg2=None, result=None, line=None):
         self.op = op
         self.arg1 = arg1
         self.arg2 = arg2
         self.result = result
+        self.line = line
 
     def __repr__(self):
         if self.op in {"copy"}:
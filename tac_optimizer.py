@@ -1,4 +1,31 @@
+import operator
+import re
+
 from tac_instruction import *
+from ast_tree import VarRef
+
+# Pontos onde o que se sabia sobre as variáveis deixa de valer: um rótulo
+# junta caminhos, as fronteiras de função trocam de escopo e uma chamada
+# pode mudar qualquer global.
+BARRIERS = {'label', 'func', 'endfunc', 'call', 'builtin'}
+
+# Operações cujo 'result' é um rótulo ou um nome de escopo, não uma variável
+# escrita.
+NOT_WRITES = {'label', 'goto', 'ifz', 'func', 'endfunc', 'namespace'}
+
+# Temporários criados pelo TACGenerator (TempVar)
+TEMP_NAME = re.compile(r"t\d+")
+
+def written_name(instr):
+    if instr.op not in NOT_WRITES and isinstance(instr.result, str):
+        return instr.result
+    return None
+
+def divide(a, b):
+    # Mesma regra do DIV das máquinas: entre inteiros a divisão é inteira
+    return a // b if isinstance(a, int) and isinstance(b, int) else a / b
+
+FOLDS = {'+': operator.add, '-': operator.sub, '*': operator.mul, '/': divide}
 
 class TACConstantFolder:
     def __init__(self, instructions):
@@ -7,10 +34,12 @@ class TACConstantFolder:
     def fold(self):
         optimized = []
         for instr in self.instructions:
-            if instr.op in ['+', '-', '*', '/']:
-                if isinstance(instr.arg1, (int, float)) and isinstance(instr.arg2, (int, float)):
-                    result = eval(f"{instr.arg1} {instr.op} {instr.arg2}")
-                    optimized.append(TACInstruction('=', result, None, instr.result))
+            if instr.op in FOLDS:
+                if isinstance(instr.arg1, (int, float)) and isinstance(instr.arg2, (int, float)) \
+                        and not (instr.op == '/' and instr.arg2 == 0):
+                    # divisão por zero fica para falhar na execução
+                    result = FOLDS[instr.op](instr.arg1, instr.arg2)
+                    optimized.append(TACInstruction('=', result, None, instr.result, instr.line))
                     continue
             optimized.append(instr)
         return optimized
@@ -25,25 +54,34 @@ class TACCopyPropagation:
         result = []
 
         for instr in self.instructions:
-            # Se arg1 ou arg2 forem não-hashables (como VarRef), usamos como estão
-            try:
-                arg1 = self.copy_map.get(instr.arg1, instr.arg1)
-            except TypeError:
-                arg1 = instr.arg1
+            if instr.op in BARRIERS:
+                self.copy_map.clear()
+            if instr.op in {'call', 'alloc_array'}:
+                # nome da função / tipo dos elementos, não variáveis
+                arg1, arg2 = instr.arg1, instr.arg2
+            else:
+                # Se arg1 ou arg2 forem não-hashables (como VarRef), usamos como estão
+                try:
+                    arg1 = self.copy_map.get(instr.arg1, instr.arg1)
+                except TypeError:
+                    arg1 = instr.arg1
 
-            try:
-                arg2 = self.copy_map.get(instr.arg2, instr.arg2)
-            except TypeError:
-                arg2 = instr.arg2
+                try:
+                    arg2 = self.copy_map.get(instr.arg2, instr.arg2)
+                except TypeError:
+                    arg2 = instr.arg2
+
+            # Escrever em x invalida a cópia de x e as cópias feitas a partir de x
+            written = written_name(instr)
+            if written is not None:
+                self.copy_map.pop(written, None)
+                for name in [name for name, source in self.copy_map.items() if source == written]:
+                    del self.copy_map[name]
 
             # Se for cópia válida: x = y
-            if instr.op == '=' and isinstance(instr.arg1, str) and isinstance(instr.result, str):
-                self.copy_map[instr.result] = arg1
-                result.append(TACInstruction('=', arg1, None, instr.result))
-            else:
-                if isinstance(instr.result, str) and instr.result in self.copy_map:
-                    del self.copy_map[instr.result]
-                result.append(TACInstruction(instr.op, arg1, arg2, instr.result))
+            if instr.op == '=' and isinstance(instr.arg1, str) and written is not None and arg1 != written:
+                self.copy_map[written] = arg1
+            result.append(TACInstruction(instr.op, arg1, arg2, instr.result, instr.line))
 
         return result
 
@@ -56,15 +94,20 @@ class TACConstantPropagation:
     def propagate(self):
         optimized = []
         for instr in self.instructions:
-            if instr.op == '=' and isinstance(instr.arg1, (int, float, str, bool)):
-                self.env[instr.result] = instr.arg1
-                optimized.append(instr)
-            elif instr.op in ['+', '-', '*', '/', '==', '!=', '<', '<=', '>', '>=']:
+            if instr.op in BARRIERS:
+                self.env.clear()
+            if instr.op in ['+', '-', '*', '/', '==', '!=', '<', '<=', '>', '>=']:
                 a1 = self.env.get(instr.arg1, instr.arg1)
                 a2 = self.env.get(instr.arg2, instr.arg2)
-                optimized.append(TACInstruction(instr.op, a1, a2, instr.result))
-            else:
-                optimized.append(instr)
+                instr = TACInstruction(instr.op, a1, a2, instr.result, instr.line)
+            written = written_name(instr)
+            if written is not None:
+                self.env.pop(written, None)
+            # só números e booleanos: um str aqui é o nome de outra variável
+            # (ou de um literal de string), que pode mudar depois
+            if instr.op == '=' and isinstance(instr.arg1, (int, float, bool)) and written is not None:
+                self.env[written] = instr.arg1
+            optimized.append(instr)
         return optimized
 
 
@@ -76,15 +119,21 @@ class TACCommonSubexpressionEliminator:
     def eliminate(self):
         result = []
         for instr in self.instructions:
+            if instr.op in BARRIERS:
+                self.expr_map.clear()
             key = None
             if instr.op in ['+', '-', '*', '/'] and all(isinstance(x, str) for x in [instr.arg1, instr.arg2]):
                 key = (instr.op, instr.arg1, instr.arg2)
                 if key in self.expr_map:
-                    existing_result = self.expr_map[key]
-                    result.append(TACInstruction('=', existing_result, None, instr.result))
-                    continue
-                else:
-                    self.expr_map[key] = instr.result
+                    instr = TACInstruction('=', self.expr_map[key], None, instr.result, instr.line)
+                    key = None
+            # Escrever em x invalida as expressões que leem x ou que estão em x
+            written = written_name(instr)
+            if written is not None:
+                for stale in [k for k, name in self.expr_map.items() if name == written or written in k[1:]]:
+                    del self.expr_map[stale]
+            if key is not None and written is not None and written not in key[1:]:
+                self.expr_map[key] = written
             result.append(instr)
         return result
 
@@ -93,19 +142,78 @@ class TACDeadCodeEliminator:
     def __init__(self, instructions):
         self.instructions = instructions
 
+    @staticmethod
+    def used_names(instr):
+        # Nomes lidos por uma instrução; 'arg' pode carregar o nó VarRef
+        names = []
+        for arg in [instr.arg1, instr.arg2]:
+            if isinstance(arg, str):
+                names.append(arg)
+            elif isinstance(arg, VarRef):
+                names.append(arg.name)
+        return names
+
+    def global_writes(self):
+        # Índices das instruções que escrevem numa global (declarada fora das
+        # funções e não encoberta por um local ou parâmetro da função atual).
+        # Uma global pode ser lida por qualquer função ou depois de uma
+        # chamada, então a análise linear não consegue provar que está morta.
+        globals_ = set()
+        functions = []      # (início, fim, nomes locais)
+        start = None
+        local_names = set()
+        for i, instr in enumerate(self.instructions):
+            if instr.op == 'func':
+                start, local_names = i, set()
+            elif instr.op == 'endfunc':
+                functions.append((start, i, local_names))
+                start = None
+            elif instr.op in {'alloc', 'alloc_array', 'param'}:
+                (local_names if start is not None else globals_).add(instr.result)
+        result = set()
+        scopes = iter(functions)
+        scope = next(scopes, None)
+        for i, instr in enumerate(self.instructions):
+            while scope is not None and i > scope[1]:
+                scope = next(scopes, None)
+            name = written_name(instr)
+            if name is None:
+                continue
+            if scope is not None and scope[0] <= i:
+                # dentro de função: tudo o que não é local nem temporário é
+                # global, mesmo sem a declaração no trecho (LazyProgram
+                # otimiza cada função sozinha)
+                if name not in scope[2] and not TEMP_NAME.fullmatch(name):
+                    result.add(i)
+            elif name in globals_:
+                result.add(i)
+        return result
+
     def eliminate(self):
         live_vars = set()
         optimized = []
+        labels = {instr.result: i for i, instr in enumerate(self.instructions) if instr.op == 'label'}
+        global_writes = self.global_writes()
+        crossed_branch = False
+
+        for i in range(len(self.instructions) - 1, -1, -1):
+            instr = self.instructions[i]
+
+            # Um goto para trás (chamada de cauda) fecha um laço: o que é lido
+            # dentro dele pode ser lido de novo na próxima volta
+            if instr.op == 'goto' and labels.get(instr.result, i) < i:
+                for looped in self.instructions[labels[instr.result]:i]:
+                    live_vars.update(self.used_names(looped))
+
+            if instr.op in {'label', 'goto', 'ifz'}:
+                crossed_branch = True
 
-        for instr in reversed(self.instructions):
             # Ignorar instruções de controle/declaração que sempre devem ser mantidas
             if instr.op not in {'=', '+', '-', '*', '/', 'cast'}:
                 optimized.insert(0, instr)
 
                 # Tenta adicionar args vivos
-                for arg in [instr.arg1, instr.arg2]:
-                    if isinstance(arg, str):
-                        live_vars.add(arg)
+                live_vars.update(self.used_names(instr))
                 continue
 
             # Verificar se o resultado está vivo
@@ -114,39 +222,82 @@ class TACDeadCodeEliminator:
             except TypeError:
                 is_live = False
 
-            if not instr.result or not is_live:
+            if (not instr.result or not is_live) and i not in global_writes:
                 continue  # código morto
 
             # Mantém a instrução
             optimized.insert(0, instr)
 
-            # Atualiza variáveis vivas com os argumentos usados
-            for arg in [instr.arg1, instr.arg2]:
-                if isinstance(arg, str):
-                    live_vars.add(arg)
-
-            # Remove variável definida (não é mais viva até outro uso)
-            if isinstance(instr.result, str) and instr.result in live_vars:
+            # Remove variável definida (não é mais viva até outro uso). Depois
+            # de passar por um desvio a definição pode estar num só dos
+            # caminhos, então ela não mata as anteriores.
+            if not crossed_branch and isinstance(instr.result, str) and instr.result in live_vars:
                 live_vars.remove(instr.result)
 
+            # Atualiza variáveis vivas com os argumentos usados
+            live_vars.update(self.used_names(instr))
+
         return optimized
 
  
 
+class TACBoundsCheckEliminator:
+    # Acesso com índice constante dentro do tamanho constante do array não
+    # precisa de verificação de limites em tempo de execução.
+    def __init__(self, instructions):
+        self.instructions = instructions
+
+    def eliminate(self):
+        # Um array reatribuído (a = b) passa a ter o tamanho do outro, e a
+        # atribuição pode estar num ramo ou numa função chamada: nome escrito
+        # fora de alloc_array e store nunca tem o tamanho confiado
+        reassigned = {written_name(instr) for instr in self.instructions
+                      if instr.op not in {'alloc_array', 'store'}}
+        defined = {instr.result for instr in self.instructions if instr.op == 'func'}
+        global_sizes = {}
+        sizes = global_sizes
+        optimized = []
+        for instr in self.instructions:
+            if instr.op == 'func':
+                sizes = dict(global_sizes)
+            elif instr.op == 'endfunc':
+                sizes = global_sizes
+            elif instr.op == 'alloc_array':
+                if isinstance(instr.arg1, int) and instr.result not in reassigned:
+                    sizes[instr.result] = instr.arg1
+                else:
+                    sizes.pop(instr.result, None)
+            elif instr.op == 'call' and instr.arg1 not in defined:
+                # função fora desta lista (geração preguiçosa) pode reatribuir
+                # qualquer array global
+                for name in list(global_sizes):
+                    sizes.pop(name, None)
+            elif instr.op in {'load', 'store'}:
+                array_name = instr.arg1 if instr.op == 'load' else instr.result
+                index = instr.arg2
+                size = sizes.get(array_name)
+                if isinstance(index, int) and not isinstance(index, bool) and size is not None and 0 <= index < size:
+                    instr = TACInstruction(instr.op + '_unchecked', instr.arg1, instr.arg2, instr.result, instr.line)
+            optimized.append(instr)
+        return optimized
+
+
 def optimize(instructions):
     passes = [
         TACConstantFolder,
         TACConstantPropagation,
         TACCopyPropagation,
         TACCommonSubexpressionEliminator,
-        TACDeadCodeEliminator
+        TACDeadCodeEliminator,
+        TACBoundsCheckEliminator
     ]
 
     current = instructions
     while True:
         previous = current
         for opt_cls in passes:
-            optimizer = opt_cls(previous)
+            # cada passo recebe a saída do anterior
+            optimizer = opt_cls(current)
             if hasattr(optimizer, "fold"):
                 current = optimizer.fold()
             elif hasattr(optimizer, "propagate"):
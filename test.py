@@ -1,15 +1,50 @@
 import io
+import os
+import re
+import sys
+import tempfile
 from contextlib import redirect_stdout
 from main import execute
+from output import ListSink
+from batch import BatchFunction
+from benchmark import build_program
+from profiler import ProfilingVM, SamplingProfiler, SamplingError
+from compiler import compile, generate, run
+from linker import link, remove_dead_functions
+from lexer import Lexer, TokenStream, TokenBuffer, ColumnarTokenStream
+from parser import Parser
+from semantic_analyzer import SemanticAnalyzer
+from tac_generator import TACGenerator
+from tac_optimizer import optimize
+from VM import VirtualMachine, FRAME_POOL_SIZE
+from python_code_generator import run_compiled, AOTError
+from cache import CompileCache
+import bytecode
 
-def compile_and_run(source_code: str) -> None:
-    execute(source_code, True, False, False)
+# Cada caso roda em todas as configurações de execução e deve dar a mesma saída
+CONFIGURATIONS = {
+    "pilha": {},
+    "registradores": {"engine": "registradores"},
+    "superinstruções": {"superinstructions": True},
+    "python": {"engine": "python"},
+    "python + superinstruções": {"engine": "python", "superinstructions": True},
+    "jit": {"jit": True, "jit_threshold": 1},
+    "jit (limiar 3)": {"jit": True, "jit_threshold": 3},
+    "sem memoização": {"memoize": False},
+    "preguiçoso": {"lazy": True},
+    "preguiçoso + jit": {"lazy": True, "jit": True, "jit_threshold": 1},
+    "otimizado": {"opt": True},
+    "otimizado + python": {"opt": True, "engine": "python"},
+    "otimizado + preguiçoso": {"opt": True, "lazy": True},
+}
 
-def simulate_vm_execution(source_code: str) -> str:
-    f = io.StringIO()
-    with redirect_stdout(f):
-        compile_and_run(source_code)
-    return f.getvalue().strip()
+def compile_and_run(source_code: str, opt: bool = False, **options) -> None:
+    execute(source_code, True, opt, False, **options)
+
+def simulate_vm_execution(source_code: str, **options) -> str:
+    sink = ListSink()
+    compile_and_run(source_code, sink=sink, **options)
+    return sink.text()
 
 def run_tests():
     test_cases = [
@@ -23,6 +58,28 @@ def run_tests():
             """,
             "expected_output": ">> Hello World"
         },
+        {
+            "name": "Comentários de linha e // dentro de string",
+            "code": """
+                namespace main {
+                    // comentário antes do código
+                    print("http://exemplo"); // comentário no fim da linha
+                    halt();
+                }
+            """,
+            "expected_output": ">> http://exemplo"
+        },
+        {
+            "name": "Milhares de parênteses aninhados",
+            "code": f"""
+                namespace main {{
+                    auto x = {"(" * 3000}-1 + 2 * 3{")" * 3000};
+                    print(x);
+                    halt();
+                }}
+            """,
+            "expected_output": ">> 5"
+        },
         {
             "name": "Literal atribuído antes do print",
             "code": """
@@ -91,22 +148,830 @@ def run_tests():
                 }
             """,
             "expected_output": ">> Oi\n>> Tudo bem?"
+        },
+        {
+            "name": "Parâmetros na ordem da chamada e globais compartilhadas",
+            "code": """
+                namespace main {
+                    int total;
+                    total = 1;
+                    int sub(int a, int b) {
+                        total = total + 1;
+                        return a - b;
+                    }
+                    auto x = sub(10, 3);
+                    print(x);
+                    print(total);
+                    halt();
+                }
+            """,
+            "expected_output": ">> 7\n>> 2"
+        },
+        {
+            "name": "Recursão com registros de ativação",
+            "code": """
+                namespace main {
+                    int fat(int n) {
+                        int r;
+                        r = 1;
+                        if (n > 1) {
+                            r = n * fat(n - 1);
+                        }
+                        return r;
+                    }
+                    print(fat(5));
+                    halt();
+                }
+            """,
+            "expected_output": ">> 120"
+        },
+        {
+            "name": "Função com vários retornos",
+            "code": """
+                namespace main {
+                    int sinal(int n) {
+                        if (n < 0) {
+                            return 0 - 1;
+                        } else {
+                            if (n == 0) {
+                                return 0;
+                            }
+                        }
+                        return 1;
+                    }
+                    print(sinal(5));
+                    print(sinal(0));
+                    print(sinal(0 - 7));
+                    halt();
+                }
+            """,
+            "expected_output": ">> 1\n>> 0\n>> -1"
+        },
+        {
+            "name": "Funções que se chamam e halt dentro de função",
+            "code": """
+                namespace main {
+                    int total;
+                    total = 0;
+                    int dobro(int n) {
+                        total = total + 1;
+                        return n * 2;
+                    }
+                    int soma(int n) {
+                        int r;
+                        r = 0;
+                        if (n > 0) {
+                            r = dobro(n) + soma(n - 1);
+                        }
+                        return r;
+                    }
+                    int para(int n) {
+                        if (n == 0) {
+                            print("parando");
+                            halt();
+                        }
+                        return para(n - 1);
+                    }
+                    print(soma(5));
+                    print(soma(4));
+                    print(total);
+                    auto z = para(4);
+                    print("nunca");
+                }
+            """,
+            "expected_output": ">> 30\n>> 20\n>> 9\n>> parando"
+        },
+        {
+            "name": "Chamadas de cauda sem crescer a pilha",
+            "code": """
+                namespace main {
+                    int conta(int n, int acc) {
+                        if (n == 0) {
+                            return acc;
+                        }
+                        return conta(n - 1, acc + 2);
+                    }
+                    int troca(int a, int b) {
+                        if (a > 3) {
+                            return b;
+                        }
+                        return troca(b + 1, a);
+                    }
+                    print(conta(150000, 0));
+                    print(troca(0, 1));
+                    halt();
+                }
+            """,
+            "expected_output": ">> 300000\n>> 2"
+        },
+        {
+            "name": "Memoização só de funções puras",
+            "code": """
+                namespace main {
+                    int total;
+                    total = 0;
+                    int fib(int n) {
+                        if (n < 2) {
+                            return n;
+                        }
+                        return fib(n - 1) + fib(n - 2);
+                    }
+                    int lido(int n) {
+                        return n + total;
+                    }
+                    print(fib(20));
+                    total = 5;
+                    print(lido(1));
+                    total = 7;
+                    print(lido(1));
+                    print(fib(20));
+                    halt();
+                }
+            """,
+            "expected_output": ">> 6765\n>> 6\n>> 8\n>> 6765"
+        },
+        {
+            "name": "Arrays globais e locais",
+            "code": """
+                namespace main {
+                    int v[10];
+                    int enche(int i, int n) {
+                        if (i == n) {
+                            return 0;
+                        }
+                        v[i] = i * i;
+                        return enche(i + 1, n);
+                    }
+                    int soma(int i, int n, int acc) {
+                        if (i == n) {
+                            return acc;
+                        }
+                        return soma(i + 1, n, acc + v[i]);
+                    }
+                    int local(int n) {
+                        float f[3];
+                        bool b[2];
+                        f[1] = 2.5;
+                        b[1] = true;
+                        print(f[1] + f[0]);
+                        print(b[1]);
+                        return n;
+                    }
+                    auto z = enche(0, 10);
+                    print(soma(0, 10, 0));
+                    print(v[9]);
+                    auto y = local(1);
+                    halt();
+                }
+            """,
+            "expected_output": ">> 285\n>> 81\n>> 2.5\n>> 1"
+        },
+        {
+            "name": "Funções embutidas sobre arrays",
+            "code": """
+                namespace main {
+                    int a[5];
+                    int b[5];
+                    int c[5];
+                    float x[3];
+                    float y[3];
+                    int norma(int n) {
+                        int v[3];
+                        fill(v, n);
+                        return dot(v, v);
+                    }
+                    fill(a, 2);
+                    b[1] = 5;
+                    b[2] = 0 - 3;
+                    add(c, a, b);
+                    print(sum(c));
+                    print(min(c));
+                    print(max(c));
+                    mul(c, c, b);
+                    copy(a, c);
+                    print(a[1]);
+                    fill(x, 1.5);
+                    y[1] = 2.0;
+                    mul(y, x, y);
+                    print(sum(y));
+                    print(norma(2));
+                    halt();
+                }
+            """,
+            "expected_output": ">> 12\n>> -1\n>> 7\n>> 35\n>> 3.0\n>> 12"
+        },
+        {
+            "name": "Divisão entre constantes",
+            "code": """
+                namespace main {
+                    int b = 7 / 2;
+                    float f = 7.0 / 2.0;
+                    print(b);
+                    print(2 * 3 + 4 * 5 - 6 / 2);
+                    print(f);
+                    if (b == 0) {
+                        print(1 / 0);
+                    }
+                    halt();
+                }
+            """,
+            "expected_output": ">> 3\n>> 23\n>> 3.5"
+        },
+        {
+            "name": "Memoização distingue true de 1",
+            "code": """
+                namespace main {
+                    bool ident(bool b) {
+                        return b;
+                    }
+                    print(ident(true));
+                    print(ident(1 == 1));
+                    halt();
+                }
+            """,
+            "expected_output": ">> True\n>> 1"
+        },
+        {
+            "name": "Função com o nome do namespace",
+            "code": """
+                namespace calc {
+                    int calc(int v) {
+                        return v + 1;
+                    }
+                    print(calc(41));
+                    halt();
+                }
+            """,
+            "expected_output": ">> 42"
         }
     ]
 
     print("\n--- Resultados dos Testes de Literais ---\n")
     for i, case in enumerate(test_cases, 1):
-        print(f"Teste {i}: {case['name']}")
+        for config, options in CONFIGURATIONS.items():
+            print(f"Teste {i} ({config}): {case['name']}")
+            try:
+                output = simulate_vm_execution(case["code"], **options)
+                success = output == case["expected_output"]
+                print("✔️  Sucesso" if success else "❌  Falhou")
+                print("Esperado:")
+                print(case["expected_output"])
+                print("Obtido:")
+                print(output)
+            except Exception as e:
+                print("❌  Erro de execução:", e)
+            print("-" * 40)
+
+def run_batch_tests():
+    # Execução em lote: a versão vetorizada deve bater com a VM escalar
+    source = """
+        namespace main {
+            int total;
+            int classe(int x, int y) {
+                int r;
+                r = x * 2 - y;
+                if (r > 10) {
+                    if (y == 0) {
+                        return 0 - 1;
+                    }
+                    r = r / y;
+                } else {
+                    r = r + 100;
+                }
+                return r;
+            }
+            int conta(int n) {
+                if (n == 0) {
+                    return total;
+                }
+                return conta(n - 1);
+            }
+        }
+    """
+    xs = [-7, 0, 3, 6, 9, 12, 20, 40]
+    ys = [0, 1, 2, 0, 3, 5, 0, 4]
+    cases = [
+        ("classe vetorizada", "classe", (xs, ys), True),
+        ("conta cai na VM escalar", "conta", (ys,), False),
+    ]
+    print("\n--- Resultados dos Testes de Execução em Lote ---\n")
+    for name, function_name, columns, vectorized in cases:
+        print(f"Teste lote: {name}")
         try:
-            output = simulate_vm_execution(case["code"])
-            success = output == case["expected_output"]
+            function = BatchFunction(source, function_name)
+            expected = function.run_scalar(columns, len(columns[0]))
+            output = list(function(*columns))
+            success = output == list(expected) and function.vectorized == vectorized
             print("✔️  Sucesso" if success else "❌  Falhou")
             print("Esperado:")
-            print(case["expected_output"])
+            print(list(expected))
             print("Obtido:")
             print(output)
         except Exception as e:
             print("❌  Erro de execução:", e)
         print("-" * 40)
 
-run_tests()
\ No newline at end of file
+def run_profile_tests():
+    # O perfil não muda a saída e suas contagens fecham com o total executado
+    source = """
+        namespace main {
+            int fat(int n) {
+                int r;
+                r = 1;
+                if (n > 1) {
+                    r = n * fat(n - 1);
+                }
+                return r;
+            }
+            print(fat(6));
+            halt();
+        }
+    """
+    print("\n--- Resultados dos Testes de Perfil ---\n")
+    print("Teste perfil: contagens por opcode, função e linha")
+    try:
+        sink = ListSink()
+        vm = ProfilingVM(sink=sink)
+        vm.run(build_program(source))
+        data = vm.to_json()
+        expected = {"output": ">> 720", "fat": 6, "steps": vm.steps, "lines": vm.steps}
+        output = {
+            "output": sink.text(),
+            "fat": data["functions"]["fat"]["calls"],
+            "steps": sum(stats["count"] for stats in data["opcodes"].values()),
+            "lines": sum(line["count"] for line in data["lines"] if line["line"] is not None),
+        }
+        print("✔️  Sucesso" if output == expected else "❌  Falhou")
+        print("Esperado:")
+        print(expected)
+        print("Obtido:")
+        print(output)
+    except Exception as e:
+        print("❌  Erro de execução:", e)
+    print("-" * 40)
+
+    # O amostrador devolve pilhas colapsadas "<main>;f:linha contagem", uma
+    # por linha, sem mudar a saída do programa
+    source = """
+        namespace main {
+            int conta(int n, int total) {
+                if (n == 0) {
+                    return total;
+                }
+                return conta(n - 1, total + 1);
+            }
+            print(conta(30000, 0));
+        }
+    """
+    print("Teste perfil: amostragem em pilhas colapsadas")
+    try:
+        sink = ListSink()
+        sampler = SamplingProfiler(VirtualMachine(sink=sink), interval=0.001)
+        sampler.run(build_program(source))
+        lines = sampler.collapsed().splitlines()
+        expected = {"output": ">> 30000", "format": True, "conta": True}
+        output = {
+            "output": sink.text(),
+            "format": bool(lines) and all(re.fullmatch(r"<main>(;[^; ]+)* \d+", line) for line in lines),
+            "conta": any(line.startswith("<main>;conta") for line in lines),
+        }
+        print("✔️  Sucesso" if output == expected else "❌  Falhou")
+        print("Esperado:")
+        print(expected)
+        print("Obtido:")
+        print(output)
+    except SamplingError as e:
+        print("Ignorado:", e)
+    except Exception as e:
+        print("❌  Erro de execução:", e)
+    print("-" * 40)
+
+def run_reuse_tests():
+    # Um programa compilado uma vez e executado várias vezes na mesma VM:
+    # globais, pilhas e o halt dentro de função não vazam entre execuções
+    source = """
+        namespace main {
+            int total;
+            int para(int n) {
+                total = total + 1;
+                if (n == 0) {
+                    print(total);
+                    halt();
+                }
+                return para(n - 1) + 1;
+            }
+            print(para(3));
+        }
+    """
+    print("\n--- Resultados dos Testes de Reexecução ---\n")
+    for name, vm in (("VM do módulo", None), ("VM com JIT", VirtualMachine(jit=True, jit_threshold=1))):
+        print(f"Teste reexecução: {name}")
+        try:
+            program = compile(source, optimize=True)
+            expected = [">> 4"] * 3
+            output = [run(program, ListSink(), vm).text() for _ in range(3)]
+            print("✔️  Sucesso" if output == expected else "❌  Falhou")
+            print("Esperado:")
+            print(expected)
+            print("Obtido:")
+            print(output)
+        except Exception as e:
+            print("❌  Erro de execução:", e)
+        print("-" * 40)
+
+    # Sem sink a VM do módulo volta ao stdout, em vez de escrever no sink da
+    # chamada anterior
+    print("Teste reexecução: VM do módulo sem sink")
+    try:
+        program = compile("namespace main { print(2); }")
+        sink = run(program, ListSink())
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            run(program)
+        expected = {"anterior": ">> 2", "stdout": ">> 2\n"}
+        output = {"anterior": sink.text(), "stdout": stdout.getvalue()}
+        print("✔️  Sucesso" if output == expected else "❌  Falhou")
+        print("Esperado:")
+        print(expected)
+        print("Obtido:")
+        print(output)
+    except Exception as e:
+        print("❌  Erro de execução:", e)
+    print("-" * 40)
+
+def run_rerun_after_error_tests():
+    # Uma chamada memoizada que estoura no meio não deixa a chave no frame:
+    # na próxima execução uma chamada impura na mesma profundidade não pode
+    # guardar o resultado dela no lugar da função pura
+    source = """
+        namespace main {
+            int total;
+            int mostra() {
+                total = total + 1;
+                return 99;
+            }
+            int quociente(int a, int b) {
+                return a / b;
+            }
+            print(mostra());
+            print(quociente(1, 0));
+        }
+    """
+    print("Teste reexecução: depois de uma exceção")
+    try:
+        vm = VirtualMachine()
+        program = compile(source)
+        errors = []
+        for _ in range(2):
+            try:
+                run(program, ListSink(), vm)
+            except ZeroDivisionError as e:
+                errors.append(type(e).__name__)
+        expected = ["ZeroDivisionError"] * 2
+        print("✔️  Sucesso" if errors == expected else "❌  Falhou")
+        print("Esperado:")
+        print(expected)
+        print("Obtido:")
+        print(errors)
+    except Exception as e:
+        print("❌  Erro de execução:", e)
+    print("-" * 40)
+
+# Recursão não-de-cauda mais funda que os limites do JIT e do motor python
+DEEP_RECURSION_SOURCE = """
+    namespace main {
+        int total;
+        int fundo(int n) {
+            int r;
+            r = 0;
+            if (n > 0) {
+                total = total + 1;
+                r = fundo(n - 1) + 1;
+            }
+            return r;
+        }
+        int passo(int n) {
+            return fundo(n);
+        }
+        print(passo(120000));
+        print(total);
+    }
+"""
+
+def run_deep_jit_tests():
+    # Recursão mais funda que o limite do JIT: as ativações além dele voltam
+    # para o interpretador em vez de estourar a pilha do Python
+    source = DEEP_RECURSION_SOURCE
+    print("Teste reexecução: recursão funda com JIT")
+    try:
+        program = compile(source)
+        expected = run(program, ListSink(), VirtualMachine()).text()
+        output = run(program, ListSink(), VirtualMachine(jit=True, jit_threshold=1)).text()
+        print("✔️  Sucesso" if output == expected == ">> 120000\n>> 120000" else "❌  Falhou")
+        print("Esperado:")
+        print(expected)
+        print("Obtido:")
+        print(output)
+    except Exception as e:
+        print("❌  Erro de execução:", e)
+    print("-" * 40)
+
+def run_deep_aot_tests():
+    # O motor python não passa de AOT_RECURSION_LIMIT chamadas aninhadas:
+    # acusa AOTError em vez de RecursionError e devolve o limite do Python
+    print("Teste reexecução: recursão funda no motor python")
+    old_limit = sys.getrecursionlimit()
+    try:
+        run_compiled(compile(DEEP_RECURSION_SOURCE), ListSink())
+        print("❌  Falhou: a recursão deveria passar do limite")
+    except AOTError as e:
+        ok = sys.getrecursionlimit() == old_limit
+        print("✔️  Sucesso" if ok else "❌  Falhou: limite de recursão não restaurado")
+        print("Erro:", e)
+    except Exception as e:
+        print("❌  Erro de execução:", e)
+    print("-" * 40)
+
+def run_cache_tests():
+    # Segunda compilação sai do disco; entrada corrompida é recompilada e o
+    # limite de tamanho despeja as entradas menos usadas
+    sources = ["namespace main { print(%d * 3); halt(); }" % n for n in range(3)]
+    print("\n--- Resultados dos Testes do Cache de Compilação ---\n")
+    print("Teste cache: acertos, entrada corrompida e despejo LRU")
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            cache = CompileCache(directory)
+            first = run(cache.compile(sources[1], optimize=True), ListSink()).text()
+            second = run(cache.compile(sources[1], optimize=True), ListSink()).text()
+            with open(cache.path(cache.key(sources[1], optimize=True)), "wb") as f:
+                f.write(b"lixo")
+            third = run(cache.compile(sources[1], optimize=True), ListSink()).text()
+            size = max(len(bytecode.encode(compile(source))) for source in sources)
+            small = CompileCache(directory, max_bytes=2 * size)
+            for source in sources:
+                small.compile(source)
+            expected = {"output": [">> 3"] * 3, "stats": {"hits": 1, "misses": 2, "evicted": 0}, "entries": 2}
+            output = {"output": [first, second, third], "stats": cache.stats, "entries": len(small.entries())}
+        print("✔️  Sucesso" if output == expected else "❌  Falhou")
+        print("Esperado:")
+        print(expected)
+        print("Obtido:")
+        print(output)
+    except Exception as e:
+        print("❌  Erro de execução:", e)
+    print("-" * 40)
+
+def run_bytecode_tests():
+    # Ida e volta pelo .totc: mesmas instruções, com os mesmos tipos de
+    # constante; com -o, 0.0 e -0.0 viram constantes distintas no pool
+    source = """
+        namespace main {
+            float f[2];
+            float z;
+            bool b;
+            int dobro(int n) {
+                return n * 2;
+            }
+            b = true;
+            f[1] = 2.5;
+            print("texto");
+            print(b);
+            print(f[1] + 1.0);
+            print(dobro(21));
+            z = 0.0 * (0.0 - 1.0);
+            print(0.0);
+            print(z);
+            halt();
+        }
+    """
+    print("\n--- Resultados dos Testes do Formato .totc ---\n")
+    for optimize in (False, True):
+        print(f"Teste .totc (otimizado: {optimize})")
+        try:
+            program = compile(source, optimize=optimize, superinstructions=True)
+            loaded = bytecode.decode(bytecode.encode(program))
+            types = lambda code: [tuple(map(type, instr)) for instr in code]
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "programa.totc")
+                bytecode.save(program, path)
+                with bytecode.open_image(path) as image:
+                    image_output = run(image, ListSink(), VirtualMachine()).text()
+                    image_code = list(image.code)
+            expected = {"output": [run(program, ListSink()).text()] * 2, "same": True}
+            output = {"output": [run(loaded, ListSink()).text(), image_output],
+                      "same": loaded.code == program.code and types(loaded.code) == types(program.code)
+                              and image_code == list(program.code) and types(image_code) == types(program.code)
+                              and loaded.lines == program.lines and dict(loaded.functions) == dict(program.functions)}
+            print("✔️  Sucesso" if output == expected else "❌  Falhou")
+            print("Esperado:")
+            print(expected)
+            print("Obtido:")
+            print(output)
+        except Exception as e:
+            print("❌  Erro de execução:", e)
+        print("-" * 40)
+
+def run_dead_function_tests():
+    # Funções que o main não alcança (nem por outra função) saem do programa
+    source = """
+        namespace main {
+            int usada(int n) {
+                return n + 1;
+            }
+            int morta(int n) {
+                return usada(n * 2);
+            }
+            int tambem_morta(int n) {
+                return morta(n) + 1;
+            }
+            int indireta(int n) {
+                return usada(n) * 2;
+            }
+            auto x = indireta(3);
+            print(x);
+        }
+    """
+    print("\n--- Resultados dos Testes de Eliminação de Funções Mortas ---\n")
+    print("Teste eliminação de funções mortas")
+    try:
+        full = link(generate(source))
+        _, removed = remove_dead_functions(generate(source))
+        program = compile(source)
+        expected = {"functions": {"usada", "indireta"}, "removed": len(full.code) - len(program.code),
+                    "output": run(full, ListSink()).text()}
+        output = {"functions": set(program.functions), "removed": removed,
+                  "output": run(program, ListSink()).text()}
+        print("✔️  Sucesso" if output == expected and removed > 0 else "❌  Falhou")
+        print("Esperado:")
+        print(expected)
+        print("Obtido:")
+        print(output)
+    except Exception as e:
+        print("❌  Erro de execução:", e)
+    print("-" * 40)
+
+def run_lexer_tests():
+    # Arquivo mapeado com mmap e texto em memória geram os mesmos tokens,
+    # o TokenStream sobre o gerador se comporta como sobre a lista e o
+    # buffer em colunas devolve os mesmos tokens e a mesma AST
+    source = """namespace main {
+        // só comentário
+        auto s = "a // b"; int x; x = 10 >= 2;
+        print(s);
+    }
+    """
+    print("\n--- Resultados dos Testes do Lexer ---\n")
+    print("Teste lexer: mmap x texto")
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "fonte.tot")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(source)
+            mapped = [repr(tok) for tok in Lexer.from_file(path).scan()]
+        stream = TokenStream(Lexer(source).scan())
+        streamed = []
+        while stream.peek() is not None:
+            ahead = stream.peek(2)
+            tok = stream.consume()
+            streamed.append((repr(tok), repr(stream.peek(-1)), repr(ahead) == repr(stream.peek(1))))
+        tokens = Lexer(source).tokenize()
+        buffer = TokenBuffer(Lexer(source).scan())
+        expected = {"tokens": [repr(tok) for tok in tokens],
+                    "stream": [(repr(tok), repr(tok), True) for tok in tokens],
+                    "columnar": [repr(tok) for tok in tokens],
+                    "ast": Parser(TokenStream(tokens)).parse_program()}
+        output = {"tokens": mapped, "stream": streamed, "columnar": [repr(tok) for tok in buffer],
+                  "ast": Parser(ColumnarTokenStream(buffer)).parse_program()}
+        print("✔️  Sucesso" if output == expected else "❌  Falhou")
+        print("Esperado:")
+        print(expected)
+        print("Obtido:")
+        print(output)
+    except Exception as e:
+        print("❌  Erro de execução:", e)
+    print("-" * 40)
+
+def tac_of(source):
+    parsed_ast = Parser(TokenStream(Lexer(source).scan())).parse_program()
+    analyzer = SemanticAnalyzer()
+    analyzer.visit(parsed_ast)
+    return TACGenerator(analyzer.global_scope).visit(parsed_ast)
+
+def run_optimizer_tests():
+    # Com -o os passos rodam encadeados: as propagações expõem as cópias e
+    # a eliminação de código morto tira as escritas que ninguém lê, sem
+    # mexer nas globais lidas por outra função
+    source = """
+        namespace main {
+            int total;
+            int f(int n) {
+                int r;
+                int s;
+                r = n * 2;
+                s = r;
+                r = n + 1;
+                return r + total;
+            }
+            total = 5;
+            print(f(3));
+        }
+    """
+    print("\n--- Resultados dos Testes do Otimizador ---\n")
+    print("Teste otimizador: escritas mortas")
+    try:
+        tac = tac_of(source)
+        optimized = optimize(tac)
+        expected = {"dead_store": False, "smaller": True, "output": run(compile(source), ListSink()).text()}
+        output = {"dead_store": any(instr.op == '*' for instr in optimized),
+                  "smaller": len(optimized) < len(tac),
+                  "output": run(compile(source, optimize=True), ListSink()).text()}
+        print("✔️  Sucesso" if output == expected else "❌  Falhou")
+        print("Esperado:")
+        print(expected)
+        print("Obtido:")
+        print(output)
+    except Exception as e:
+        print("❌  Erro de execução:", e)
+    print("-" * 40)
+
+    # Depois de a = b o tamanho de a é o de b: o acesso a a[5] continua
+    # verificado e falha como sem -o
+    source = """
+        namespace main {
+            int a[10];
+            int b[2];
+            b[1] = 7;
+            a = b;
+            a[5] = 3;
+            print(a[5]);
+        }
+    """
+    print("Teste otimizador: array reatribuído mantém a verificação de limites")
+    try:
+        optimized = optimize(tac_of(source))
+        checked = {instr.op for instr in optimized if instr.op.startswith(('load', 'store'))}
+        try:
+            run(compile(source, optimize=True), ListSink())
+            error = None
+        except IndexError as e:
+            error = str(e)
+        ok = checked == {'store', 'store_unchecked', 'load'} and error is not None
+        print("✔️  Sucesso" if ok else "❌  Falhou")
+        print("Acessos:", sorted(checked))
+        print("Erro:", error)
+    except Exception as e:
+        print("❌  Erro de execução:", e)
+    print("-" * 40)
+
+def run_frame_pool_tests():
+    # Uma VM reaproveitada não segura memória da execução anterior: o RET
+    # esvazia os locais e a carga corta o pool de frames de volta ao tamanho
+    # inicial depois de uma recursão profunda
+    source = """
+        namespace main {
+            int fundo(int n) {
+                int v[50];
+                int r;
+                r = 0;
+                if (n > 0) {
+                    r = fundo(n - 1) + 1;
+                }
+                return r;
+            }
+            print(fundo(2000));
+        }
+    """
+    print("\n--- Resultados dos Testes do Pool de Frames ---\n")
+    print("Teste pool de frames: locais liberados e pool cortado")
+    try:
+        vm = VirtualMachine(memoize=False)
+        program = compile(source)
+        first = run(program, ListSink(), vm).text()
+        grown = len(vm.frame_pool)
+        leftover = sum(len(frame.locals) for frame in vm.frame_pool)
+        vm.load(program)
+        expected = {"output": ">> 2000", "grown": True, "leftover": 0, "pool": FRAME_POOL_SIZE}
+        output = {"output": first, "grown": grown > FRAME_POOL_SIZE, "leftover": leftover,
+                  "pool": len(vm.frame_pool)}
+        print("✔️  Sucesso" if output == expected else "❌  Falhou")
+        print("Esperado:")
+        print(expected)
+        print("Obtido:")
+        print(output)
+    except Exception as e:
+        print("❌  Erro de execução:", e)
+    print("-" * 40)
+
+run_tests()
+run_batch_tests()
+run_profile_tests()
+run_reuse_tests()
+run_rerun_after_error_tests()
+run_deep_jit_tests()
+run_deep_aot_tests()
+run_cache_tests()
+run_bytecode_tests()
+run_dead_function_tests()
+run_lexer_tests()
+run_optimizer_tests()
+run_frame_pool_tests()
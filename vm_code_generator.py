@@ -1,56 +1,138 @@
 from ast_tree import *
+from arrays import BULK_OPS
 
 class VMCodeGenerator:
     def __init__(self, tac_instructions, symbol_table):
         self.tac = tac_instructions
         self.vm_code = []
         self.symbol_table = symbol_table
+        self.namespace_scope = None
+        self.function_scope = None
+        self.global_temps = {}
+        self.local_temps = {}
+
+    def resolve(self, name):
+        # Traduz um nome para (área, slot). Dentro de uma função, parâmetros,
+        # declarações e temporários vivem no registro de ativação; o que
+        # resolve para um namespace é global. Temporários recebem slots logo
+        # depois das variáveis declaradas do frame.
+        if self.function_scope is not None:
+            if name in self.function_scope.symbols:
+                return "LOCAL", self.function_scope.symbols[name].slot
+            sym = self.function_scope.VMlookup(name)
+        else:
+            scope = self.namespace_scope or self.symbol_table
+            sym = scope.VMlookup(name)
+
+        if sym is not None and sym.slot is not None:
+            return "GLOBAL", sym.slot
+
+        if self.function_scope is not None:
+            frame, temps, area = self.function_scope.frame, self.local_temps, "LOCAL"
+        else:
+            frame, temps, area = self.symbol_table.frame, self.global_temps, "GLOBAL"
+        if name not in temps:
+            temps[name] = frame.slot_count + len(temps)
+        return area, temps[name]
+
+    def emit_load(self, code, name):
+        area, slot = self.resolve(name)
+        code.append((f"LOAD_{area}", slot))
+
+    def emit_store(self, code, name):
+        area, slot = self.resolve(name)
+        code.append((f"STORE_{area}", slot))
+
+    def emit_operand(self, code, operand):
+        sym = self.symbol_table.VMlookup(operand) if isinstance(operand, str) else None
+
+        if sym and sym.category == 'literal':
+            code.append(("PUSH", sym.value))
+        elif isinstance(operand, (int, float)):
+            code.append(("PUSH", operand))
+        else:
+            self.emit_load(code, operand)
 
     def generate(self):
         arg_stack = []
         main_code = []
         function_code = []
         current = main_code
+        last_lines = {}
 
-        for instr in self.tac:
+        for idx, instr in enumerate(self.tac):
+            # pseudo-op LINE a cada troca de linha do fonte; o linker o
+            # retira e monta a tabela pc -> linha
+            target = function_code if instr.op == 'func' else current
+            if instr.line is not None and last_lines.get(id(target)) != instr.line:
+                target.append(("LINE", instr.line))
+                last_lines[id(target)] = instr.line
 
-            if instr.op == 'label':
+            if instr.op == 'namespace':
+                self.namespace_scope = self.symbol_table.child(instr.result)
+
+            elif instr.op == 'func':
                 current = function_code
+                self.function_scope = (self.namespace_scope or self.symbol_table).child(instr.result)
+                self.local_temps = {}
+
+                # os argumentos foram empilhados na ordem da chamada, então
+                # o último parâmetro é o primeiro a sair da pilha
+                params = []
+                for following in self.tac[idx + 1:]:
+                    if following.op != 'param':
+                        break
+                    params.append(following.result)
+
+                symbol = self.function_scope.parent.symbols[instr.result]
+                current.append(("FUNCTION", instr.result, len(params), symbol.pure))
+                enter_index = len(current)
+                current.append(("ENTER", 0))
+                for name in reversed(params):
+                    self.emit_store(current, name)
+
+            elif instr.op == 'endfunc':
+                # retorno implícito quando o corpo termina sem 'return'
+                current.append(("PUSH", 0))
+                current.append(("RET",))
+                frame_size = self.function_scope.slot_count + len(self.local_temps)
+                current[enter_index] = ("ENTER", frame_size)
+                current = main_code
+                self.function_scope = None
+
+            elif instr.op == 'label':
                 current.append(("LABEL", instr.result))
 
             elif instr.op == 'arg':
                 if isinstance(instr.arg1, Literal):
                     current.append(("PUSH", instr.arg1.value))
                 elif isinstance(instr.arg1, VarRef):
-                    current.append(("LOAD", instr.arg1.name))
+                    self.emit_load(current, instr.arg1.name)
                 else:
-                    current.append(("LOAD", instr.arg1))
+                    self.emit_operand(current, instr.arg1)
 
             elif instr.op == 'call':
                 current.append(("CALL", instr.arg1))
-                current.append(("STORE", instr.result))
+                self.emit_store(current, instr.result)
+                arg_stack.clear()
+
+            elif instr.op == 'builtin':
+                current.append((BULK_OPS[instr.arg1][0],))
+                self.emit_store(current, instr.result)
                 arg_stack.clear()
 
             elif instr.op == 'ret':
                 if instr.arg1 is not None:
-                    current.append(("LOAD", instr.arg1))
+                    self.emit_operand(current, instr.arg1)
                 current.append(("RET",))
 
             elif instr.op == '=':
-                sym = self.symbol_table.VMlookup(instr.arg1) if isinstance(instr.arg1, str) else None
-
-                if sym and sym.category == 'literal':
-                    current.append(("PUSH", sym.value))
-                elif isinstance(instr.arg1, (int, float)):
-                    current.append(("PUSH", instr.arg1))
-                else:
-                    current.append(("LOAD", instr.arg1))
-
-                current.append(("STORE", instr.result))
+                self.emit_operand(current, instr.arg1)
+                self.emit_store(current, instr.result)
 
             elif instr.op in {'+', '-', '*', '/', '==', '!=', '<', '<=', '>', '>='}:
-                current.append(("LOAD", instr.arg1))
-                current.append(("LOAD", instr.arg2))
+                self.emit_operand(current, instr.arg1)
+                self.emit_operand(current, instr.arg2)
                 op_map = {
                     '+': "ADD",
                     '-': "SUB",
@@ -64,35 +146,45 @@ class VMCodeGenerator:
                     '>=': "GE"
                 }
                 current.append((op_map[instr.op],))
-                current.append(("STORE", instr.result))
+                self.emit_store(current, instr.result)
 
             elif instr.op == 'literal_init':
                 current.append(("PUSH", instr.arg1)) 
-                current.append(("STORE", instr.result))
+                self.emit_store(current, instr.result)
 
             elif instr.op == 'alloc':
-                current.append(("ALLOC", instr.result))
-
-            elif instr.op == 'load':
-                current.append(("LOAD_INDEX", instr.arg1, instr.arg2))
-
-                current.append(("STORE", instr.result))
-
-            elif instr.op == 'store':
-                current.append(("LOAD", instr.arg1))
-                current.append(("STORE_INDEX", instr.result, instr.arg2))
+                area, slot = self.resolve(instr.result)
+                current.append((f"ALLOC_{area}", slot))
+
+            elif instr.op == 'alloc_array':
+                self.emit_operand(current, instr.arg1)
+                current.append(("NEW_ARRAY", instr.arg2))
+                self.emit_store(current, instr.result)
+
+            elif instr.op in {'load', 'load_unchecked'}:
+                self.emit_load(current, instr.arg1)
+                self.emit_operand(current, instr.arg2)
+                current.append(("LOAD_INDEX",) if instr.op == 'load' else ("LOAD_INDEX_UNCHECKED",))
+                self.emit_store(current, instr.result)
+
+            elif instr.op in {'store', 'store_unchecked'}:
+                self.emit_load(current, instr.result)
+                self.emit_operand(current, instr.arg2)
+                self.emit_operand(current, instr.arg1)
+                current.append(("STORE_INDEX",) if instr.op == 'store' else ("STORE_INDEX_UNCHECKED",))
 
             elif instr.op == 'goto':
                 current.append(("JUMP", instr.result))
 
             elif instr.op == 'ifz':
-                current.append(("LOAD", instr.arg1))
+                self.emit_operand(current, instr.arg1)
                 current.append(("JMP_IF_TRUE", f"NOT_{instr.result}"))
                 current.append(("JUMP", instr.result))
                 current.append(("LABEL", f"NOT_{instr.result}"))
 
             elif instr.op == 'param':
-                current.append(("STORE", instr.result))
+                # já tratado junto com o 'func' da função
+                pass
 
             elif instr.op == 'PRINT':
                 current.append(("PRINT",))
@@ -103,6 +195,11 @@ class VMCodeGenerator:
             else:
                 current.append(("# UNHANDLED", str(instr)))
 
-        self.vm_code = main_code + function_code
+        if function_code:
+            # o main nunca deve cair dentro do corpo de uma função
+            main_code.append(("HALT",))
+
+        global_size = self.symbol_table.frame.slot_count + len(self.global_temps)
+        self.vm_code = [("GLOBALS", global_size)] + main_code + function_code
         return self.vm_code
 